@@ -0,0 +1,314 @@
+"""
+批量運行討論：從文件讀取問題，在同一個事件循環中並發運行多個討論會話
+
+用法：
+    python batch.py questions.txt --concurrency 4 --timeout 900
+    python batch.py questions.jsonl --output records/batch_nightly
+    python batch.py questions.yaml --restart
+
+問題文件格式：
+- .txt：每行一個問題，空行和以 # 開頭的行會被忽略
+- .jsonl：每行一個 JSON 對象 {"id": "可選的編號", "question": "問題", "observer_inputs": ["可選的各輪觀察者意見"]}，
+  或直接是問題字符串
+- .yaml / .yml：問題列表（字符串或與 jsonl 格式相同的對象），也可以放在 questions 鍵下
+
+觀察者不在終端輸入，只使用問題中預設的 observer_inputs。
+
+每個問題完成後把結果追加到輸出目錄的 progress.jsonl，再次運行時跳過已完成的問題；
+全部結束後在輸出目錄生成 report.json 和 report.md。
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import asyncio
+import statistics
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 已完成的問題在恢復運行時跳過，其餘狀態（失敗、超時）會重新運行
+DONE_STATUSES = ("completed", "partial")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="從文件批量運行討論")
+    parser.add_argument("questions", help="問題文件（.txt、.jsonl、.yaml）")
+    parser.add_argument("--output", help="記錄和報告的輸出目錄，默認為 records/batch_<文件名>")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時運行的最大會話數")
+    parser.add_argument("--timeout", type=float, default=900, help="單個問題的超時時間（秒）")
+    parser.add_argument("--restart", action="store_true", help="忽略已有進度，重新運行所有問題")
+    parser.add_argument("--log", help="會話輸出寫入的日誌文件，默認為輸出目錄下的 batch.log")
+    return parser.parse_args()
+
+def question_id(question: str) -> str:
+    """根據問題內容生成穩定的編號，用於恢復進度"""
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()[:12]
+
+def _entry(item, source: str) -> Optional[Dict]:
+    """把文件中的一項轉換為 {"id", "question", "observer_inputs"}，無效項返回 None"""
+    if isinstance(item, str):
+        question = item.strip()
+        item_id = None
+        observer_inputs = []
+    elif isinstance(item, dict) and isinstance(item.get("question"), str):
+        question = item["question"].strip()
+        item_id = item.get("id")
+        observer_inputs = item.get("observer_inputs") or []
+    else:
+        print(f"警告: 忽略無效的問題 {source}: {item!r}", file=sys.stderr)
+        return None
+    if not question:
+        return None
+    return {
+        "id": str(item_id) if item_id is not None else question_id(question),
+        "question": question,
+        "observer_inputs": list(observer_inputs)
+    }
+
+def load_questions(path: str) -> List[Dict]:
+    """讀取問題文件，返回 [{"id", "question", "observer_inputs"}]，重複的編號只保留第一個"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8") as f:
+        if ext == ".jsonl":
+            items = []
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        items.append((json.loads(line), f"第 {line_number} 行"))
+                    except json.JSONDecodeError as e:
+                        print(f"警告: 第 {line_number} 行不是有效的 JSON：{e.msg}", file=sys.stderr)
+        elif ext in (".yaml", ".yml"):
+            from utils.serialization import load_yaml
+            data = load_yaml(f) or []
+            if isinstance(data, dict):
+                data = data.get("questions", [])
+            items = [(item, f"第 {index + 1} 項") for index, item in enumerate(data)]
+        else:
+            items = [
+                (line, f"第 {line_number} 行")
+                for line_number, line in enumerate(f, 1)
+                if line.strip() and not line.lstrip().startswith("#")
+            ]
+
+    entries, seen = [], set()
+    for item, source in items:
+        entry = _entry(item, source)
+        if entry and entry["id"] not in seen:
+            seen.add(entry["id"])
+            entries.append(entry)
+    return entries
+
+def load_progress(path: str) -> Dict[str, Dict]:
+    """讀取進度文件，同一問題以最後一條記錄為準"""
+    progress = {}
+    if not os.path.exists(path):
+        return progress
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 中斷時可能留下不完整的最後一行
+            progress[result["id"]] = result
+    return progress
+
+def new_shared(question: str) -> Dict:
+    return {
+        "question": question,
+        "moderator": None,
+        "agents": None,
+        "discussion_history": [],
+        "observer_inputs": [],
+        "summary": None,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "initializing",
+        "start_time": time.time(),
+        "llm_calls": []
+    }
+
+async def run_question(entry: Dict, output_dir: str, timeout: float, observer=None) -> Dict:
+    """運行單個問題的討論並保存記錄，返回進度記錄
+
+    observer 為觀察者輸入通道，未指定時只使用問題中預設的 observer_inputs
+    """
+    from flow import create_discussion_flow
+    from nodes import SummaryNode
+    from utils import save_discussion_record, render_event_log, summarize_usage
+    from utils.ledger import use_ledger, call_context
+    from utils.event_log import open_event_log, log_event
+    from utils.observer import QueuedObserver
+
+    shared = new_shared(entry["question"])
+    # 每個會話在自己的任務中運行，賬本互不干擾；超時後的補救摘要也記入本會話
+    use_ledger(shared["llm_calls"])
+    # 重新運行的問題從頭開始記錄
+    name = f"discussion_{entry['id']}"
+    event_log = open_event_log(os.path.join(output_dir, f"{name}.jsonl"), append=False)
+    log_event("session", session_id=entry["id"], question=entry["question"], timestamp=shared["timestamp"])
+    start = time.time()
+
+    try:
+        # 無人值守：只使用預設的觀察者輸入
+        flow = create_discussion_flow(observer=observer or QueuedObserver(entry.get("observer_inputs", [])))
+        await asyncio.wait_for(flow.run_async(shared), timeout=timeout)
+    except asyncio.TimeoutError:
+        shared["error"] = f"討論流程超時（{timeout:.0f}秒）"
+        shared["status"] = "timeout"
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        shared["error"] = f"討論流程錯誤: {str(e)}"
+        shared["status"] = "error"
+
+    # 超時或出錯但已有討論內容時，嘗試從討論歷史生成摘要
+    if not shared.get("summary") and shared.get("discussion_history"):
+        try:
+            with call_context(node="summary"):
+                await SummaryNode().run_async(shared)
+        except Exception as e:
+            shared["error"] = f"生成摘要錯誤: {str(e)}"
+
+    if shared.get("summary"):
+        shared["status"] = "completed" if shared.get("status") not in ("timeout", "error") else "partial"
+    elif shared.get("status") not in ("timeout", "error"):
+        shared["status"] = "failed"
+
+    elapsed = time.time() - start
+    shared["total_time"] = f"{elapsed:.1f}秒"
+    log_event("status", status=shared["status"], error=shared.get("error"), total_time=shared["total_time"])
+    if event_log:
+        event_log.close()
+        record_file = render_event_log(event_log.path, directory=output_dir, name=name)
+    else:
+        record_file = save_discussion_record(shared, directory=output_dir, name=name)
+
+    return {
+        "id": entry["id"],
+        "question": entry["question"],
+        "status": shared["status"],
+        "error": shared.get("error"),
+        "elapsed": round(elapsed, 2),
+        "rounds": len(shared.get("discussion_history", [])),
+        "record": record_file,
+        "usage": summarize_usage(shared["llm_calls"])["total"],
+        "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def build_report(results: List[Dict], wall_time: float) -> Dict:
+    """匯總所有問題的狀態、耗時和用量"""
+    by_status = {}
+    for result in results:
+        by_status[result["status"]] = by_status.get(result["status"], 0) + 1
+
+    elapsed = sorted(result["elapsed"] for result in results)
+    costs = [result["usage"]["cost"] for result in results if result["usage"].get("cost") is not None]
+    return {
+        "questions": len(results),
+        "by_status": by_status,
+        "wall_time": round(wall_time, 1),
+        "elapsed": {
+            "mean": round(statistics.mean(elapsed), 1),
+            "median": round(statistics.median(elapsed), 1),
+            "max": elapsed[-1]
+        } if elapsed else None,
+        "calls": sum(result["usage"]["calls"] for result in results),
+        "prompt_tokens": sum(result["usage"]["prompt_tokens"] for result in results),
+        "completion_tokens": sum(result["usage"]["completion_tokens"] for result in results),
+        "cost": round(sum(costs), 6) if costs else None,
+        "results": results
+    }
+
+def report_markdown(report: Dict) -> str:
+    lines = ["# 批量討論報告", ""]
+    lines.append(f"- **問題數**：{report['questions']}")
+    lines.append(f"- **狀態**：{'，'.join(f'{status} {count}' for status, count in report['by_status'].items())}")
+    if report["elapsed"]:
+        elapsed = report["elapsed"]
+        lines.append(f"- **單個問題耗時**：平均 {elapsed['mean']} 秒，中位數 {elapsed['median']} 秒，最長 {elapsed['max']} 秒")
+    lines.append(f"- **本次運行總耗時**：{report['wall_time']} 秒")
+    lines.append(f"- **LLM 調用**：{report['calls']} 次，輸入 {report['prompt_tokens']} token，輸出 {report['completion_tokens']} token")
+    cost = "未配置價格" if report["cost"] is None else f"${report['cost']:.4f}"
+    lines.append(f"- **估算成本**：{cost}")
+    lines.append("")
+    lines.append("| 編號 | 問題 | 狀態 | 輪數 | 耗時（秒） | 記錄 |")
+    lines.append("| --- | --- | --- | --- | --- | --- |")
+    for result in report["results"]:
+        question = result["question"].replace("|", "\\|").replace("\n", " ")
+        record = os.path.basename(result["record"]) if result.get("record") else "-"
+        lines.append(f"| {result['id']} | {question} | {result['status']} | {result['rounds']} | {result['elapsed']} | {record} |")
+    return "\n".join(lines) + "\n"
+
+async def run_batch(entries: List[Dict], output_dir: str, concurrency: int, timeout: float, restart: bool = False) -> Dict:
+    """並發運行所有未完成的問題，逐個寫入進度，最後生成報告"""
+    from utils.config import AVAILABLE_MODELS, ROUTER_HEALTH_PROBE
+    from utils.router import get_router
+
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, "progress.jsonl")
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    progress = load_progress(progress_path)
+
+    pending = [entry for entry in entries if progress.get(entry["id"], {}).get("status") not in DONE_STATUSES]
+    print(f"共 {len(entries)} 個問題，已完成 {len(entries) - len(pending)} 個，本次運行 {len(pending)} 個（並發數 {concurrency}）", file=sys.stderr)
+
+    if pending and ROUTER_HEALTH_PROBE and len(AVAILABLE_MODELS) > 1:
+        await get_router().probe()
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    progress_lock = asyncio.Lock()
+    finished = 0
+    start = time.time()
+
+    async def worker(entry):
+        nonlocal finished
+        async with semaphore:
+            result = await run_question(entry, output_dir, timeout)
+        async with progress_lock:
+            progress[entry["id"]] = result
+            with open(progress_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            finished += 1
+            print(f"[{finished}/{len(pending)}] {result['status']} {result['elapsed']:.0f} 秒 {entry['question'][:40]}", file=sys.stderr)
+
+    await asyncio.gather(*(worker(entry) for entry in pending))
+
+    # 報告包含本次和之前運行的結果，按問題文件中的順序排列
+    results = [progress[entry["id"]] for entry in entries if entry["id"] in progress]
+    report = build_report(results, time.time() - start)
+    with open(os.path.join(output_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(output_dir, "report.md"), "w", encoding="utf-8") as f:
+        f.write(report_markdown(report))
+    return report
+
+def main(args):
+    # 必須在導入 utils 之前設置：多個會話並行時不能顯示 Live 面板
+    os.environ.setdefault("LIVE_DISPLAY", "false")
+
+    entries = load_questions(args.questions)
+    if not entries:
+        print("錯誤: 問題文件中沒有有效的問題", file=sys.stderr)
+        return 1
+
+    output_dir = args.output or os.path.join("records", f"batch_{os.path.splitext(os.path.basename(args.questions))[0]}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 各會話的輸出寫入日誌文件，終端只顯示進度
+    log_path = args.log or os.path.join(output_dir, "batch.log")
+    stdout = sys.stdout
+    with open(log_path, "a", encoding="utf-8") as log:
+        sys.stdout = log
+        try:
+            report = asyncio.run(run_batch(entries, output_dir, args.concurrency, args.timeout, args.restart))
+        finally:
+            sys.stdout = stdout
+
+    print(report_markdown(report))
+    print(f"報告已保存至 {os.path.join(output_dir, 'report.md')}，會話日誌見 {log_path}")
+    return 0 if all(result["status"] in DONE_STATUSES for result in report["results"]) else 2
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
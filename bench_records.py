@@ -0,0 +1,130 @@
+"""
+比較討論記錄各種序列化方式的速度和大小（不需要網絡和 API 密鑰）
+
+用法：
+    python bench_records.py --rounds 20 --agents 5 --repeat 5
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+import yaml
+
+from utils.serialization import LIBYAML, compact_rounds, dump_record, dump_yaml, iter_rounds, load_record, load_yaml
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="比較討論記錄的序列化和解析速度")
+    parser.add_argument("--rounds", type=int, default=20, help="討論輪數")
+    parser.add_argument("--agents", type=int, default=5, help="專家人數")
+    parser.add_argument("--chars", type=int, default=600, help="每個發言的字符數")
+    parser.add_argument("--repeat", type=int, default=5, help="每項重複次數，取中位數")
+    return parser.parse_args()
+
+def build_record(rounds: int, agents: int, chars: int) -> dict:
+    """生成與真實記錄結構相同的合成記錄：每個發言都帶完整的專家信息"""
+    text = ("分佈式系統的一致性與可用性需要根據業務場景權衡，" * (chars // 24 + 1))[:chars]
+    experts = [
+        {
+            "name": f"專家{index}",
+            "expertise": "分佈式系統、數據庫內核與容量規劃",
+            "background": "在大型互聯網公司負責核心交易系統的架構設計十餘年。" * 3,
+            "personality": "嚴謹、務實，重視數據和可驗證的結論",
+            "stance": "傾向於先保證正確性，再逐步優化性能",
+            "interaction": "會引用其他專家的觀點並提出具體的反例"
+        }
+        for index in range(agents)
+    ]
+    history = [
+        {
+            "round_number": number,
+            "opening": {"opening": text, "focus": "本輪聚焦於故障恢復策略"},
+            "responses": [{"agent": expert, "content": text, "round": number} for expert in experts],
+            "summary": {"summary": text}
+        }
+        for number in range(1, rounds + 1)
+    ]
+    calls = [
+        {"node": "discussion", "model": "deepseek/deepseek-chat-v3-0324", "prompt_tokens": 1800, "completion_tokens": 400,
+         "cached_tokens": 1200, "ttft": 0.8, "latency": 6.2, "retries": 0, "cost": 0.0012}
+        for _ in range(rounds * (agents + 2))
+    ]
+    return {
+        "timestamp": "2026-01-01 00:00:00",
+        "question": "如何設計一個跨地域部署的高可用消息隊列？",
+        "moderator": {"name": "主持人", "background": "資深架構師", "style": "引導式"},
+        "agents": experts,
+        "discussion_history": history,
+        "observer_inputs": [],
+        "summary": text,
+        "status": "completed",
+        "error": None,
+        "total_time": 300.0,
+        "usage": {"total": {"calls": len(calls)}, "by_node": {}, "calls": calls}
+    }
+
+def timed(func, repeat: int) -> float:
+    """重複運行 func，返回耗時的中位數（毫秒）"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+def main():
+    args = parse_args()
+    record = build_record(args.rounds, args.agents, args.chars)
+    directory = tempfile.mkdtemp()
+    yaml_path = os.path.join(directory, "bench.yaml")
+    record_path = os.path.join(directory, "bench.record.jsonl")
+
+    def dump_pure_yaml():
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            yaml.dump(record, f, Dumper=yaml.SafeDumper, allow_unicode=True, sort_keys=False)
+
+    def load_pure_yaml():
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            yaml.load(f, Loader=yaml.SafeLoader)
+
+    def dump_fast_yaml():
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            dump_yaml(record, f)
+
+    def load_fast_yaml():
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            load_yaml(f)
+
+    def stream_first_round():
+        next(iter_rounds(record_path))
+
+    results = []
+    dump_pure_yaml()
+    results.append(("YAML（純 Python）", timed(dump_pure_yaml, args.repeat), timed(load_pure_yaml, args.repeat), os.path.getsize(yaml_path)))
+    if LIBYAML:
+        results.append(("YAML（libyaml）", timed(dump_fast_yaml, args.repeat), timed(load_fast_yaml, args.repeat), os.path.getsize(yaml_path)))
+    dump_record(record, record_path)
+    results.append(("記錄文件 .record.jsonl", timed(lambda: dump_record(record, record_path), args.repeat),
+                    timed(lambda: load_record(record_path), args.repeat), os.path.getsize(record_path)))
+
+    # 檢查點每輪寫一次整個 shared，比較發言中保存完整專家信息和只保存名稱
+    def dump_full_checkpoint():
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+    def dump_compact_checkpoint():
+        compacted = dict(record, discussion_history=compact_rounds(record["discussion_history"], record["agents"]))
+        return json.dumps(compacted, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    print(f"合成記錄：{args.rounds} 輪 × {args.agents} 位專家，每個發言 {args.chars} 字符；libyaml {'可用' if LIBYAML else '不可用'}")
+    print(f"{'格式':<24}{'序列化 (ms)':>14}{'解析 (ms)':>14}{'大小 (KB)':>12}")
+    for name, dump_ms, load_ms, size in results:
+        print(f"{name:<24}{dump_ms:>14.1f}{load_ms:>14.1f}{size / 1024:>12.1f}")
+    print(f"\n逐輪讀取第一輪：{timed(stream_first_round, args.repeat):.2f} ms")
+    print(f"檢查點：完整 {len(dump_full_checkpoint().encode()) / 1024:.1f} KB / {timed(dump_full_checkpoint, args.repeat):.1f} ms，"
+          f"緊湊 {len(dump_compact_checkpoint().encode()) / 1024:.1f} KB / {timed(dump_compact_checkpoint, args.repeat):.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 import asyncio
 from pocketflow import Flow, AsyncFlow, Node
 
+from utils.config import PARALLEL_SETUP, DUPLICATE_MODE
+from utils.ledger import use_ledger, reset_ledger, call_context
+from utils.progress import emit_progress
+from utils.checkpoint import save_checkpoint
+
+FORK_CONFLICT_POLICIES = ("error", "first", "last")
+
+class ForkMergeError(ValueError):
+    """並行分支對 shared 的同一鍵寫入了不同的值，且沒有指定合併方式"""
+
 class FlowRunner:
     """流程運行器"""
     def __init__(self):
         self.nodes = {}
         self.edges = {}
+        self.forks = {}
         
     def add_node(self, name, node):
         """添加節點"""
@@ -15,10 +26,36 @@ class FlowRunner:
     def add_edge(self, src, dst, cond=None):
         """添加邊"""
         self.edges[src][cond] = dst
+    
+    def add_fork(self, name, branches, conflict="error", merge=None):
+        """添加分叉步驟：流程走到 name 時並行運行 branches 中的節點，全部完成後合併它們對 shared 的寫入再沿 name 的出邊繼續
         
-    async def run_async(self, shared):
-        """運行整個流程（異步版本）"""
-        current = "start"
+        每個分支在 shared 的淺拷貝上運行，只有新增、替換或刪除的鍵被視為寫入（就地修改共享對象不受影響）。
+        多個分支寫入同一鍵且值不同時：merge 中為該鍵指定的函數接收按分支聲明順序排列的值並返回合併結果；
+        否則按 conflict 處理，error 拋出 ForkMergeError，first / last 取聲明順序中第一個 / 最後一個分支的值。
+        """
+        if conflict not in FORK_CONFLICT_POLICIES:
+            raise ValueError(f"未知的衝突處理方式: {conflict}")
+        self.forks[name] = {"branches": list(branches), "conflict": conflict, "merge": merge or {}}
+        self.edges[name] = {}
+        
+    async def run_async(self, shared, start="start"):
+        """運行整個流程（異步版本）
+        
+        start 為開始執行的節點，從檢查點恢復時為檢查點記錄的下一個節點
+        """
+        # 本次會話的 LLM 調用記錄保存在 shared["llm_calls"]
+        ledger_token = use_ledger(shared.setdefault("llm_calls", []))
+        try:
+            await self._run_steps(shared, start)
+        finally:
+            reset_ledger(ledger_token)
+            
+        return shared
+    
+    async def _run_steps(self, shared, start="start"):
+        """逐個執行節點直到流程結束，每完成一個節點保存一次檢查點"""
+        current = start
         max_steps = 50  # 防止可能的無限循環
         step_count = 0
         
@@ -27,11 +64,16 @@ class FlowRunner:
             print(f"執行節點: {current}")
             
             try:
-                node = self.nodes.get(current)
-                if not node:
-                    raise ValueError(f"找不到節點: {current}")
-                
-                action = await node.run_async(shared)
+                if current in self.forks:
+                    action = await self._run_fork(current, shared)
+                else:
+                    node = self.nodes.get(current)
+                    if not node:
+                        raise ValueError(f"找不到節點: {current}")
+                    
+                    with call_context(node=current):
+                        emit_progress("node")
+                        action = await node.run_async(shared)
                 
                 # 檢查 action 是否為有效值
                 if action is None:
@@ -51,6 +93,9 @@ class FlowRunner:
                 else:
                     print(f"警告: 節點 {current} 沒有任何出邊，流程結束")
                     current = "end"
+                
+                # 記錄已完成的步驟，失敗後從下一個節點繼續（討論節點每輪保存一次）
+                save_checkpoint(shared, current)
                     
             except Exception as e:
                 error_msg = f"節點 {current} 執行時出錯: {str(e)}"
@@ -63,8 +108,71 @@ class FlowRunner:
             print(f"警告: 流程執行超過最大步數 {max_steps}，強制結束")
             shared["error"] = f"流程執行超過最大步數 {max_steps}"
             shared["status"] = "exceeded_max_steps"
-            
-        return shared
+
+    async def _run_fork(self, name, shared):
+        """並行運行分叉中的節點並合併寫入，返回分叉的動作"""
+        fork = self.forks[name]
+        branches = fork["branches"]
+        for branch in branches:
+            if branch not in self.nodes:
+                raise ValueError(f"找不到節點: {branch}")
+        print(f"並行執行節點: {', '.join(branches)}")
+        
+        async def run_branch(branch):
+            branch_shared = dict(shared)
+            with call_context(node=branch):
+                emit_progress("node")
+                action = await self.nodes[branch].run_async(branch_shared)
+            return branch_shared, action
+        
+        tasks = [asyncio.create_task(run_branch(branch)) for branch in branches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        merge_branch_writes(shared, [branch_shared for branch_shared, _ in results], fork["conflict"], fork["merge"], branches)
+        
+        # 所有分支動作相同時沿用該動作，否則取聲明順序中第一個非默認動作
+        actions = [action or "default" for _, action in results]
+        return next((action for action in actions if action != "default"), "default")
+
+_DELETED = object()
+
+def merge_branch_writes(shared, branch_states, conflict="error", merge=None, names=None):
+    """把各分支的 shared 副本中的寫入合併回 shared，結果只取決於分支的聲明順序，與完成先後無關"""
+    merge = merge or {}
+    names = names or [f"分支 {index + 1}" for index in range(len(branch_states))]
+    
+    writes = {}
+    for name, state in zip(names, branch_states):
+        for key, value in state.items():
+            if key not in shared or shared[key] is not value:
+                writes.setdefault(key, []).append((name, value))
+        for key in shared:
+            if key not in state:
+                writes.setdefault(key, []).append((name, _DELETED))
+    
+    for key, entries in writes.items():
+        values = [value for _, value in entries]
+        if key in merge:
+            value = merge[key]([v for v in values if v is not _DELETED])
+        elif all(v is values[0] or (v is not _DELETED and values[0] is not _DELETED and v == values[0]) for v in values):
+            value = values[0]
+        elif conflict == "first":
+            value = values[0]
+        elif conflict == "last":
+            value = values[-1]
+        else:
+            writers = "、".join(name for name, _ in entries)
+            raise ForkMergeError(f"並行節點 {writers} 都寫入了 shared[{key!r}]，且值不同")
+        
+        if value is _DELETED:
+            shared.pop(key, None)
+        else:
+            shared[key] = value
 
 class EndNode:
     """表示流程結束的節點"""
@@ -80,26 +188,51 @@ class EndNode:
             shared["status"] = "completed"
         return "end"
 
-def create_discussion_flow():
-    """創建完整的討論流程"""
+def create_discussion_flow(observer=None, persona_cache=None, duplicate_mode=None, confirm_duplicate=None):
+    """創建完整的討論流程
+
+    observer 為觀察者輸入通道（utils.observer），未指定時按配置創建；
+    persona_cache 為 False 時不重用相近問題的角色，None 時跟隨 PERSONA_CACHE 設置；
+    duplicate_mode 不為 off 時先檢查是否已經討論過幾乎相同的問題（默認跟隨 DUPLICATE_MODE），
+    ask 模式下由 confirm_duplicate 決定是否使用之前的結論
+    """
     # 動態引入，避免循環引用
-    from nodes import InputNode, ModeratorGeneratorNode, AgentGeneratorNode, SessionStartNode, DiscussionNode, SummaryNode
+    from nodes import InputNode, DuplicateCheckNode, ModeratorGeneratorNode, AgentGeneratorNode, SessionStartNode, DiscussionNode, SummaryNode
     
+    duplicate_mode = duplicate_mode or DUPLICATE_MODE
     flow = FlowRunner()
     
-    # 創建節點
+    # 創建節點（並行生成角色時關閉 Live 面板，同一時間只能顯示一個）
     flow.add_node("start", InputNode())
-    flow.add_node("generate_moderator", ModeratorGeneratorNode())
-    flow.add_node("generate_agents", AgentGeneratorNode())
+    if duplicate_mode != "off":
+        flow.add_node("check_duplicate", DuplicateCheckNode(mode=duplicate_mode, confirm=confirm_duplicate))
+    flow.add_node("generate_moderator", ModeratorGeneratorNode(live_display=False if PARALLEL_SETUP else None, use_cache=persona_cache))
+    flow.add_node("generate_agents", AgentGeneratorNode(live_display=False if PARALLEL_SETUP else None, use_cache=persona_cache))
     flow.add_node("session_start", SessionStartNode())
-    flow.add_node("discussion", DiscussionNode())
+    flow.add_node("discussion", DiscussionNode(observer=observer))
     flow.add_node("summary", SummaryNode())
     flow.add_node("end", EndNode())
     
     # 創建邊
-    flow.add_edge("start", "generate_moderator", "default")
-    flow.add_edge("generate_moderator", "generate_agents", "default")
-    flow.add_edge("generate_agents", "session_start", "default")
+    setup = "generate_roles" if PARALLEL_SETUP else "generate_moderator"
+    if duplicate_mode != "off":
+        # 使用之前的結論時直接結束
+        flow.add_edge("start", "check_duplicate", "default")
+        flow.add_edge("check_duplicate", setup, "default")
+        flow.add_edge("check_duplicate", "end", "duplicate")
+    else:
+        flow.add_edge("start", setup, "default")
+    if PARALLEL_SETUP:
+        # 主持人和專家都只依賴問題，並行生成；兩者都失敗時把錯誤信息合併
+        flow.add_fork(
+            "generate_roles",
+            ["generate_moderator", "generate_agents"],
+            merge={"error": lambda errors: "；".join(errors)}
+        )
+        flow.add_edge("generate_roles", "session_start", "default")
+    else:
+        flow.add_edge("generate_moderator", "generate_agents", "default")
+        flow.add_edge("generate_agents", "session_start", "default")
     flow.add_edge("session_start", "discussion", "default")
     flow.add_edge("discussion", "summary", "end_discussion")
     flow.add_edge("discussion", "discussion", "continue_discussion")
@@ -0,0 +1,95 @@
+"""
+使用本地替身後端對討論流程進行壓力測試（不需要網絡和 API 密鑰）
+
+用法：
+    python loadtest.py --sessions 5 --ttft 0.5 --tps 60 --error-rate 0.05
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import asyncio
+import tempfile
+import statistics
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="使用本地替身後端壓力測試討論流程")
+    parser.add_argument("--sessions", type=int, default=3, help="並行運行的會話數")
+    parser.add_argument("--ttft", type=float, default=0.3, help="首字延遲（秒）")
+    parser.add_argument("--tps", type=float, default=80, help="每秒生成的 token 數")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入錯誤的概率")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="串流停頓的概率")
+    parser.add_argument("--rounds", type=int, default=2, help="每個會話的討論輪數")
+    parser.add_argument("--script", help="本地後端 YAML 腳本文件，會覆蓋上述設置")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    return parser.parse_args()
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def run_session(index: int) -> dict:
+    """運行單個討論會話並返回耗時"""
+    from flow import create_discussion_flow
+
+    shared = {
+        "question": f"壓力測試問題 #{index}：如何評估一個大型系統的架構設計？",
+        "moderator": None,
+        "agents": None,
+        "discussion_history": [],
+        "observer_inputs": [],
+        "summary": None,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "initializing",
+        "start_time": time.time()
+    }
+    start = time.time()
+    await create_discussion_flow().run_async(shared)
+    return {"index": index, "elapsed": time.time() - start, "status": shared.get("status")}
+
+async def main(args):
+    # 必須在導入 utils 之前設置，客戶端在 utils.config 中創建
+    port = _free_port()
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ.setdefault("LIVE_DISPLAY", "false")
+    # 無人值守：觀察者始終不輸入
+    os.environ.setdefault("OBSERVER_MODE", "headless")
+
+    from utils.local_backend import LocalLLMBackend
+
+    if args.script:
+        backend = LocalLLMBackend.from_file(args.script, seed=args.seed)
+    else:
+        backend = LocalLLMBackend({
+            "ttft": args.ttft,
+            "tokens_per_second": args.tps,
+            "error_rate": args.error_rate,
+            "stall_rate": args.stall_rate,
+            "discussion_rounds": args.rounds
+        }, seed=args.seed)
+    await backend.start(port=port)
+
+    start = time.time()
+    try:
+        results = await asyncio.gather(*(run_session(i) for i in range(args.sessions)))
+    finally:
+        await backend.stop()
+    total = time.time() - start
+
+    elapsed = sorted(r["elapsed"] for r in results)
+    print("\n===== 壓力測試結果 =====")
+    for r in results:
+        print(f"會話 #{r['index']}: {r['elapsed']:.2f} 秒，狀態 {r['status']}")
+    print(f"會話數: {len(results)}，總耗時: {total:.2f} 秒")
+    print(f"單會話耗時 平均 {statistics.mean(elapsed):.2f} 秒，中位數 {statistics.median(elapsed):.2f} 秒，最長 {elapsed[-1]:.2f} 秒")
+    print(f"後端統計: {backend.stats}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    # 在臨時目錄中運行，避免壓力測試的記錄寫入 records/
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="roundtable_loadtest_"))
+    asyncio.run(main(args))
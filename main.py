@@ -1,10 +1,18 @@
 import asyncio
+import argparse
 import traceback
 import os
 import time
 from datetime import datetime
 from flow import create_discussion_flow
-from utils import print_summary, save_discussion_record
+from utils import print_summary, save_discussion_record, render_event_log
+from utils.config import AVAILABLE_MODELS, ROUTER_HEALTH_PROBE
+from utils.router import get_router
+from utils.ledger import use_ledger, call_context
+from utils.checkpoint import new_session_id, load_checkpoint, restore_shared, list_checkpoints
+from utils.event_log import open_event_log, event_log_path, log_event
+from utils.duplicates import DUPLICATE_MODES
+from utils.serialization import export_yaml
 
 MAX_RETRIES = 3
 DISCUSSION_TIMEOUT = int(os.getenv("TIMEOUT", "900"))  # 默認15分鐘
@@ -17,45 +25,110 @@ def validate_question(question: str) -> bool:
         return False
     return True
 
-async def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI 圓桌會議系統")
+    parser.add_argument("--resume", metavar="ID", help="從檢查點恢復指定編號的會話")
+    parser.add_argument("--list", action="store_true", help="列出可以恢復的會話")
+    parser.add_argument("--render", metavar="LOG", help="從事件日誌重新生成討論記錄和 Markdown")
+    parser.add_argument("--export-yaml", metavar="RECORD", help="把記錄文件導出為 YAML")
+    parser.add_argument("--fresh-personas", action="store_true", help="不重用相近問題的主持人和專家，重新生成")
+    parser.add_argument("--duplicates", choices=DUPLICATE_MODES, help="問題與已完成的討論幾乎相同時的處理方式（默認跟隨 DUPLICATE_MODE）")
+    return parser.parse_args()
+
+def print_checkpoints():
+    """列出未完成的會話檢查點"""
+    checkpoints = [c for c in list_checkpoints() if c["next_node"] != "end"]
+    if not checkpoints:
+        print("沒有可以恢復的會話")
+        return
+    for checkpoint in checkpoints:
+        print(f"{checkpoint['session_id']}  {checkpoint['saved_at']}  已完成 {checkpoint['round']} 輪，下一步 {checkpoint['next_node']}  {checkpoint['question']}")
+
+async def confirm_duplicate(record) -> bool:
+    """顯示之前討論的結論，詢問是否直接使用"""
+    summary = record["summary"]
+    preview = summary if len(summary) <= 300 else summary[:300] + "……"
+    print(f"\n之前的結論：\n{preview}\n")
+    # 在線程中等待輸入，不阻塞事件循環
+    answer = await asyncio.to_thread(input, "直接使用之前的結論嗎？(y/N) > ")
+    return answer.strip().lower() in ("y", "yes", "是")
+
+async def main(resume_id=None, fresh_personas=False, duplicate_mode=None):
     """主函數"""
     # 歡迎信息
     print("\n=== AI 圓桌會議系統 ===")
-    print("請輸入您想要討論的問題（至少10個字符）：")
     
-    # 獲取並驗證問題
-    question = input("> ").strip()
-    retry_count = 0
-    while not validate_question(question) and retry_count < 3:
-        retry_count += 1
-        print(f"錯誤: 問題太短或為空！請輸入更詳細的問題（嘗試 {retry_count}/3）：")
+    next_node = "start"
+    if resume_id:
+        # 從檢查點恢復：跳過已完成的節點和輪次
+        checkpoint = load_checkpoint(resume_id)
+        if not checkpoint:
+            print(f"錯誤: 找不到會話 {resume_id} 的檢查點")
+            return
+        if checkpoint["next_node"] == "end":
+            print(f"會話 {resume_id} 已經完成，無需恢復")
+            return
+        shared = restore_shared({}, checkpoint)
+        question = shared["question"]
+        next_node = checkpoint["next_node"]
+        print(f"從檢查點恢復會話 {resume_id}：{question}")
+        print(f"已完成 {checkpoint['round']} 輪討論，從節點 {next_node} 繼續")
+    else:
+        print("請輸入您想要討論的問題（至少10個字符）：")
+        
+        # 獲取並驗證問題
         question = input("> ").strip()
+        retry_count = 0
+        while not validate_question(question) and retry_count < 3:
+            retry_count += 1
+            print(f"錯誤: 問題太短或為空！請輸入更詳細的問題（嘗試 {retry_count}/3）：")
+            question = input("> ").strip()
+            
+        if not validate_question(question):
+            print("錯誤: 提供的問題不符合要求，程序結束")
+            return
         
-    if not validate_question(question):
-        print("錯誤: 提供的問題不符合要求，程序結束")
-        return
+        # 初始化共享數據
+        shared = {
+            "session_id": new_session_id(),
+            "question": question,
+            "moderator": None,
+            "agents": None,
+            "discussion_history": [],
+            "observer_inputs": [],
+            "summary": None,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "initializing",
+            "start_time": time.time(),
+            "llm_calls": []
+        }
+        print(f"會話編號: {shared['session_id']}（中斷後可用 python main.py --resume {shared['session_id']} 繼續）")
     
     # 準備日誌目錄
     os.makedirs("logs", exist_ok=True)
     log_file = f"logs/run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     
-    # 初始化共享數據
-    shared = {
-        "question": question,
-        "moderator": None,
-        "agents": None,
-        "discussion_history": [],
-        "observer_inputs": [],
-        "summary": None,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "status": "initializing",
-        "start_time": time.time()
-    }
+    # 記錄本次會話的 LLM 調用（包括流程外的補救摘要）
+    use_ledger(shared["llm_calls"])
+    
+    # 討論過程逐條寫入事件日誌，恢復的會話繼續追加到同一個日誌
+    event_log = open_event_log(event_log_path(shared["session_id"]))
+    if resume_id:
+        log_event("resume", round=checkpoint["round"], next_node=next_node)
+    else:
+        log_event("session", session_id=shared["session_id"], question=question, timestamp=shared["timestamp"])
     
     # 記錄基本信息
     with open(log_file, "a", encoding="utf-8") as f:
         f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 開始討論: {question}\n")
     
+    # 多個模型時並行探測可用性和延遲，排除故障模型
+    if ROUTER_HEALTH_PROBE and len(AVAILABLE_MODELS) > 1:
+        print("\n正在探測模型可用性...")
+        latencies = await get_router().probe()
+        for model, latency in latencies.items():
+            print(f"- {model}: {f'{latency:.2f} 秒' if latency is not None else '不可用'}")
+    
     overall_start_time = time.time()
     retry_count = 0
     
@@ -66,13 +139,29 @@ async def main():
             if retry_count > 0:
                 print(f"\n正在重試討論流程 (嘗試 {retry_count+1}/{MAX_RETRIES})...")
                 
+                # 從最後一個檢查點繼續，已完成的節點和輪次不再重新運行
+                checkpoint = load_checkpoint(shared["session_id"])
+                if checkpoint:
+                    restore_shared(shared, checkpoint)
+                    use_ledger(shared["llm_calls"])
+                    shared["status"] = "running"
+                    next_node = checkpoint["next_node"]
+                    log_event("resume", round=checkpoint["round"], next_node=next_node)
+                    print(f"從檢查點繼續：已完成 {checkpoint['round']} 輪討論，下一步 {next_node}")
+                else:
+                    next_node = "start"
+                
             # 創建流程
-            flow = create_discussion_flow()
+            flow = create_discussion_flow(
+                persona_cache=False if fresh_personas else None,
+                duplicate_mode=duplicate_mode,
+                confirm_duplicate=confirm_duplicate
+            )
             
             # 運行流程（帶超時）
             try:
                 print("\n正在開始討論流程...\n")
-                await asyncio.wait_for(flow.run_async(shared), timeout=DISCUSSION_TIMEOUT)
+                await asyncio.wait_for(flow.run_async(shared, start=next_node), timeout=DISCUSSION_TIMEOUT)
                 
                 # 流程完成，檢查結果
                 if shared.get("status") == "completed" and shared.get("summary"):
@@ -113,7 +202,8 @@ async def main():
                 try:
                     print("\n嘗試從討論歷史生成摘要...")
                     summary_node = SummaryNode()
-                    await summary_node.run_async(shared)
+                    with call_context(node="summary"):
+                        await summary_node.run_async(shared)
                     if shared.get("summary"):
                         shared["status"] = "completed"
                         break  # 成功生成摘要
@@ -166,8 +256,13 @@ async def main():
         print("\n錯誤: 經過多次嘗試，討論仍未能生成摘要")
         shared["status"] = "failed"
     
-    # 保存記錄
-    record_file = save_discussion_record(shared)
+    # 保存記錄：啟用事件日誌時從日誌生成
+    log_event("status", status=shared["status"], error=shared.get("error"), total_time=shared.get("total_time"))
+    if event_log:
+        event_log.close()
+        record_file = render_event_log(event_log.path)
+    else:
+        record_file = save_discussion_record(shared)
     if record_file:
         print(f"\n完整討論記錄已保存，您可以查看 Markdown 格式文件了解詳細內容。")
     else:
@@ -178,4 +273,12 @@ async def main():
         f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 討論結束，狀態: {shared.get('status')}\n")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.list:
+        print_checkpoints()
+    elif args.render:
+        render_event_log(args.render)
+    elif args.export_yaml:
+        print(f"已導出：{export_yaml(args.export_yaml)}")
+    else:
+        asyncio.run(main(args.resume, args.fresh_personas, args.duplicates))
\ No newline at end of file
@@ -8,7 +8,17 @@ from datetime import datetime
 from rich.console import Console
 from rich.markdown import Markdown
 
-from utils import call_llm, call_llm_streaming, save_discussion_record, yaml_safe_load
+from utils import call_llm, call_llm_streaming
+from utils.config import PARALLEL_ROUND, MAX_CONCURRENT_AGENTS, CONTEXT_SUMMARY_TOKENS, SPECULATIVE_FOCUS, FUSED_ROUND_EVALUATION, PERSONA_CACHE_ADAPT, DUPLICATE_MODE
+from utils.ledger import call_context
+from utils.llm import LLM_FAILURE_PREFIX
+from utils.structured import call_llm_structured
+from utils.context import RollingContext, new_context_state
+from utils.observer import ObserverChannel, create_observer
+from utils.progress import emit_progress
+from utils.event_log import log_event
+from utils.persona_cache import get_persona_cache, persona_cache_enabled
+from utils.duplicates import find_duplicate_question
 
 # 動態引入 Node，避免循環引用
 try:
@@ -23,6 +33,171 @@ except ImportError:
         async def post_async(self, shared, prep_res, exec_res):
             return "default"
 
+def _persona_schema(fields: List[str]) -> Dict:
+    """生成角色信息的 JSON Schema：所有字段都是必填的非空字符串"""
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string", "minLength": 1} for field in fields},
+        "required": list(fields),
+        "additionalProperties": False
+    }
+
+# 主持人和專家的輸出格式
+MODERATOR_SCHEMA = _persona_schema(["name", "background", "style", "expertise", "personality"])
+
+EXPERTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "experts": {
+            "type": "array",
+            "minItems": 2,
+            "items": _persona_schema(["name", "expertise", "background", "personality", "stance", "style", "interaction"])
+        }
+    },
+    "required": ["experts"],
+    "additionalProperties": False
+}
+
+# 合併的本輪總結和評估的輸出格式
+_string_list = {"type": "array", "items": {"type": "string"}}
+ROUND_EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string", "minLength": 1},
+        "consensus": _string_list,
+        "disagreements": _string_list,
+        "should_continue": {"type": "boolean"},
+        "reason": {"type": "string", "minLength": 1}
+    },
+    "required": ["summary", "consensus", "disagreements", "should_continue", "reason"],
+    "additionalProperties": False
+}
+
+# 生成失敗時使用的默認角色
+DEFAULT_MODERATOR = {
+    "name": "默認主持人",
+    "background": "跨領域專家",
+    "style": "專業、平衡",
+    "expertise": "多學科整合",
+    "personality": "客觀公正"
+}
+
+DEFAULT_EXPERTS = [
+    {
+        "name": "專家A",
+        "expertise": "相關領域專家",
+        "background": "資深研究員",
+        "personality": "分析型思考",
+        "stance": "客觀中立",
+        "style": "條理清晰",
+        "interaction": "喜歡深入討論"
+    },
+    {
+        "name": "專家B",
+        "expertise": "相關領域專家",
+        "background": "業界實踐者",
+        "personality": "實用主義",
+        "stance": "務實導向",
+        "style": "直接明了",
+        "interaction": "重視實際應用"
+    },
+    {
+        "name": "專家C",
+        "expertise": "相關領域專家",
+        "background": "理論研究者",
+        "personality": "嚴謹細致",
+        "stance": "理論為本",
+        "style": "學術嚴謹",
+        "interaction": "喜歡探討原理"
+    }
+]
+
+def lookup_cached_persona(kind: str, question: str, use_cache: Optional[bool] = None) -> Optional[Dict]:
+    """在角色快取中查找相近問題的主持人（kind="moderator"）或專家（kind="agents"），未啟用或未命中時返回 None"""
+    if not persona_cache_enabled(use_cache):
+        return None
+    cached = get_persona_cache().lookup(kind, question)
+    if cached:
+        label = "主持人" if kind == "moderator" else "專家團隊"
+        print(f"重用相似問題「{cached['question']}」的{label}（相似度 {cached['similarity']:.2f}）")
+    return cached
+
+async def adapt_cached_persona(cached: Dict, question: str, schema: Dict, name: str, live_display: Optional[bool] = None):
+    """按新問題微調快取的角色，保持姓名和整體設定；調整失敗時原樣使用快取的角色"""
+    persona = cached["persona"]
+    payload = {"experts": persona} if name == "experts" else persona
+    prompt = f"""
+        以下角色是為問題「{cached['question']}」生成的，現在要討論的問題是：{question}
+        
+        請保持姓名和整體設定不變，只在必要時調整與新問題不符的內容（例如專業領域、觀點立場）。
+        只輸出一個 JSON 對象，格式與下面相同，不要包含代碼塊標記或其他說明文字：
+        {json.dumps(payload, ensure_ascii=False)}
+        """
+    adapted = await call_llm_structured(
+        [{"role": "user", "content": prompt}],
+        schema,
+        name,
+        context_info="按新問題調整快取的角色中...",
+        live_display=live_display
+    )
+    if adapted is None:
+        return persona
+    return adapted["experts"] if name == "experts" else adapted
+
+# 討論提示分為兩部分：system 消息只包含角色、規則和問題，整場討論中逐字節不變，
+# 便於服務商的前綴快取命中；每輪變化的內容放在其後的 user 消息中
+
+def moderator_system_prompt(question: str, moderator: Dict) -> str:
+    """主持人的固定前綴"""
+    return f"""你是一位名為 {moderator['name']} 的討論主持人，具有 {moderator['background']} 背景，主持風格是 {moderator['style']}。
+
+你正在主持一場關於「{question}」的專家圓桌討論。
+
+請直接以主持人的身份發言，無需使用引號或特殊格式。"""
+
+def agent_system_prompt(question: str, moderator: Dict, agent: Dict) -> str:
+    """專家的固定前綴"""
+    return f"""你是一位名為 {agent['name']} 的專家，專業領域是 {agent['expertise']}，具有 {agent['background']} 背景。
+你的性格特徵是 {agent.get('personality', '未提供')}，觀點立場是 {agent.get('stance', '未提供')}。
+你的發言風格是 {agent.get('style', '專業客觀')}，互動偏好是 {agent.get('interaction', '理性交流')}。
+
+你正在參加一場由 {moderator['name']} 主持的關於「{question}」的專家圓桌討論。
+
+每輪請從你的專業角度，針對當前討論重點發表見解，包括：
+1. 你對問題的專業分析
+2. 可能的解決方案或建議
+3. 對其他專家觀點的回應（如果這不是第一輪討論）
+
+請直接以專家的身份發言，無需使用引號或特殊格式。請確保你的回應：
+- 符合你的專業背景和觀點立場
+- 展現你的性格特徵和發言風格
+- 提供有深度的見解而不是泛泛而談
+- 篇幅適中（200-400字左右）"""
+
+EVALUATION_CRITERIA = """評估討論是否應該結束的標準：
+1. 是否已經全面覆蓋了問題的各個方面
+2. 是否達成了一定程度的共識或清晰地表達了不同觀點
+3. 是否已經提供了足夠的深度分析
+4. 再繼續討論是否會產生實質性的新見解"""
+
+def evaluator_system_prompt(question: str) -> str:
+    """討論評估的固定前綴"""
+    return f"""你是一位資深的討論評估專家。請評估專家討論是否已經充分探討了主題，是否需要繼續討論。
+
+討論問題：{question}
+
+{EVALUATION_CRITERIA}
+
+請回答：「繼續討論」或「結束討論」，並簡要說明理由。"""
+
+def format_round_summary(result: Dict) -> str:
+    """把合併評估的結構化輸出整理為本輪總結文本（核心觀點、共識、分歧）"""
+    parts = [result["summary"].strip()]
+    for title, items in (("達成的共識", result["consensus"]), ("存在的分歧", result["disagreements"])):
+        if items:
+            parts.append(f"**{title}**：\n" + "\n".join(f"- {item}" for item in items))
+    return "\n\n".join(parts)
+
 class InputNode(Node):
     """接收使用者輸入的問題"""
     
@@ -52,13 +227,82 @@ class InputNode(Node):
             shared["error"] = f"InputNode: {str(e)}"
             return "error"
 
+class DuplicateCheckNode(Node):
+    """檢查是否已經討論過幾乎相同的問題，是則提供之前的最終結論而不重新討論"""
+    
+    def __init__(self, mode: Optional[str] = None, confirm=None):
+        super().__init__()
+        # reuse 直接使用之前的結論；ask 由 confirm（接收找到的記錄，返回是否使用的協程函數）決定，未提供時不使用
+        self.mode = mode or DUPLICATE_MODE
+        self.confirm = confirm
+    
+    async def prep_async(self, shared: Dict) -> str:
+        return shared["question"]
+    
+    async def exec_async(self, question: str) -> Optional[Dict]:
+        if self.mode == "off":
+            return None
+        try:
+            # 同步記錄目錄和查詢索引涉及文件讀取，放到線程中進行
+            record = await asyncio.to_thread(find_duplicate_question, question)
+        except Exception as e:
+            print(f"檢查重複問題時發生錯誤: {str(e)}")
+            return None
+        if record is None:
+            return None
+        
+        print(f"\n找到已完成的相似討論（相似度 {record['similarity']:.2f}，{record['timestamp']}）：{record['question']}")
+        if self.mode == "ask" and (self.confirm is None or not await self.confirm(record)):
+            return None
+        return record
+    
+    async def post_async(self, shared: Dict, prep_res: str, exec_res: Optional[Dict]) -> str:
+        if not exec_res:
+            return "default"
+        
+        shared["summary"] = exec_res["summary"]
+        shared["status"] = "completed"
+        shared["reused_from"] = {key: exec_res[key] for key in ("path", "question", "timestamp", "similarity")}
+        log_event("duplicate", reused_from=shared["reused_from"])
+        log_event("summary", summary=exec_res["summary"])
+        
+        console = Console()
+        console.print(Markdown(f"# 之前的討論結論\n\n**原問題**：{exec_res['question']}\n\n{exec_res['summary']}"))
+        return "duplicate"
+        
+    async def run_async(self, shared: Dict) -> str:
+        """為 FlowRunner 系統提供的統一入口"""
+        try:
+            prep_res = await self.prep_async(shared)
+            exec_res = await self.exec_async(prep_res)
+            return await self.post_async(shared, prep_res, exec_res)
+        except Exception as e:
+            print(f"DuplicateCheckNode 執行錯誤: {str(e)}")
+            traceback.print_exc()
+            # 檢查失敗時照常討論
+            return "default"
+
 class ModeratorGeneratorNode(Node):
     """生成主持人角色"""
     
+    def __init__(self, live_display: Optional[bool] = None, use_cache: Optional[bool] = None):
+        super().__init__()
+        # 與其他節點並行運行時應關閉 Live 面板
+        self.live_display = live_display
+        # 是否重用相近問題的主持人，None 時跟隨 PERSONA_CACHE 設置
+        self.use_cache = use_cache
+    
     async def prep_async(self, shared: Dict) -> str:
         return shared["question"]
     
     async def exec_async(self, question: str) -> Dict:
+        # 相近的問題已經生成過主持人時直接重用（或按新問題微調）
+        cached = lookup_cached_persona("moderator", question, self.use_cache)
+        if cached:
+            if PERSONA_CACHE_ADAPT and cached["question"] != question:
+                return await adapt_cached_persona(cached, question, MODERATOR_SCHEMA, "moderator", self.live_display)
+            return cached["persona"]
+        
         # 生成主持人
         moderator_prompt = f"""
         根據以下問題，生成一個合適的會議主持人角色：
@@ -71,51 +315,35 @@ class ModeratorGeneratorNode(Node):
         4. 專業領域
         5. 性格特徵
         
-        以 YAML 格式輸出：
-        ```yaml
-        name: 主持人姓名
-        background: 專業背景
-        style: 主持風格
-        expertise: 專業領域
-        personality: 性格特徵
-        ```
+        只輸出一個 JSON 對象，不要包含代碼塊標記或其他說明文字：
+        {{"name": "主持人姓名", "background": "專業背景", "style": "主持風格", "expertise": "專業領域", "personality": "性格特徵"}}
         """
         
         try:
-            moderator_response = await call_llm_streaming(
+            moderator = await call_llm_structured(
                 [{"role": "user", "content": moderator_prompt}],
-                context_info="生成主持人中..."
+                MODERATOR_SCHEMA,
+                "moderator",
+                context_info="生成主持人中...",
+                live_display=self.live_display
             )
-            moderator_yaml = moderator_response.strip().replace("```yaml", "").replace("```", "").strip()
             
-            # 使用安全的 YAML 解析
-            moderator = yaml_safe_load(moderator_yaml)
-            
-            # 檢查是否成功解析主持人數據
-            if not isinstance(moderator, dict) or not moderator.get('name'):
+            if moderator is None:
                 print(f"警告: 主持人數據格式不正確，使用默認主持人")
-                moderator = {
-                    "name": "默認主持人",
-                    "background": "跨領域專家",
-                    "style": "專業、平衡",
-                    "expertise": "多學科整合",
-                    "personality": "客觀公正"
-                }
+                return dict(DEFAULT_MODERATOR)
             
+            # 只快取成功生成的主持人，默認角色不保存
+            if persona_cache_enabled(self.use_cache):
+                get_persona_cache().store("moderator", question, moderator)
             return moderator
         except Exception as e:
             print(f"生成主持人時發生錯誤: {str(e)}")
             traceback.print_exc()
-            return {
-                "name": "默認主持人",
-                "background": "跨領域專家",
-                "style": "專業、平衡",
-                "expertise": "多學科整合",
-                "personality": "客觀公正"
-            }
+            return dict(DEFAULT_MODERATOR)
     
     async def post_async(self, shared: Dict, prep_res: str, exec_res: Dict) -> str:
         shared["moderator"] = exec_res
+        log_event("moderator", moderator=exec_res)
         
         # 將主持人信息轉換為 Markdown 格式
         markdown_content = []
@@ -149,10 +377,24 @@ class ModeratorGeneratorNode(Node):
 class AgentGeneratorNode(Node):
     """生成專家角色"""
     
+    def __init__(self, live_display: Optional[bool] = None, use_cache: Optional[bool] = None):
+        super().__init__()
+        # 與其他節點並行運行時應關閉 Live 面板
+        self.live_display = live_display
+        # 是否重用相近問題的專家團隊，None 時跟隨 PERSONA_CACHE 設置
+        self.use_cache = use_cache
+    
     async def prep_async(self, shared: Dict) -> str:
         return shared["question"]
     
     async def exec_async(self, question: str) -> List:
+        # 相近的問題已經生成過專家團隊時直接重用（或按新問題微調）
+        cached = lookup_cached_persona("agents", question, self.use_cache)
+        if cached:
+            if PERSONA_CACHE_ADAPT and cached["question"] != question:
+                return await adapt_cached_persona(cached, question, EXPERTS_SCHEMA, "experts", self.live_display)
+            return cached["persona"]
+        
         # 生成專家
         experts_prompt = f"""
         根據以下問題，生成3位不同專業背景、觀點立場的專家角色，他們將參與一個圓桌討論會：
@@ -160,112 +402,35 @@ class AgentGeneratorNode(Node):
         
         請確保這些專家有不同的專業背景、個性特點和觀點立場，能夠從不同角度討論這個問題。
         
-        以 YAML 格式輸出：
-        ```yaml
-        experts:
-          - name: 專家1姓名
-            expertise: 專業領域
-            background: 專業背景
-            personality: 個性特點
-            stance: 觀點立場
-            style: 溝通風格
-            interaction: 互動特點
-          - name: 專家2姓名
-            expertise: 專業領域
-            background: 專業背景
-            personality: 個性特點
-            stance: 觀點立場
-            style: 溝通風格
-            interaction: 互動特點
-          - name: 專家3姓名
-            expertise: 專業領域
-            background: 專業背景
-            personality: 個性特點
-            stance: 觀點立場
-            style: 溝通風格
-            interaction: 互動特點
-        ```
+        只輸出一個 JSON 對象，不要包含代碼塊標記或其他說明文字。experts 中每位專家的格式如下：
+        {{"experts": [{{"name": "專家姓名", "expertise": "專業領域", "background": "專業背景", "personality": "個性特點", "stance": "觀點立場", "style": "溝通風格", "interaction": "互動特點"}}]}}
         """
         
         try:
-            experts_response = await call_llm_streaming(
+            experts_data = await call_llm_structured(
                 [{"role": "user", "content": experts_prompt}],
-                context_info="生成專家團隊中..."
+                EXPERTS_SCHEMA,
+                "experts",
+                context_info="生成專家團隊中...",
+                live_display=self.live_display
             )
-            experts_yaml = experts_response.strip().replace("```yaml", "").replace("```", "").strip()
-            
-            # 使用安全的 YAML 解析
-            experts_data = yaml_safe_load(experts_yaml)
             
-            # 檢查是否成功解析專家數據
-            if not isinstance(experts_data, dict) or not experts_data.get('experts'):
+            if experts_data is None:
                 print(f"警告: 專家數據格式不正確，使用默認專家")
-                return [
-                    {
-                        "name": "專家A",
-                        "expertise": "相關領域專家",
-                        "background": "資深研究員",
-                        "personality": "分析型思考",
-                        "stance": "客觀中立",
-                        "style": "條理清晰",
-                        "interaction": "喜歡深入討論"
-                    },
-                    {
-                        "name": "專家B",
-                        "expertise": "相關領域專家",
-                        "background": "業界實踐者",
-                        "personality": "實用主義",
-                        "stance": "務實導向",
-                        "style": "直接明了",
-                        "interaction": "重視實際應用"
-                    },
-                    {
-                        "name": "專家C",
-                        "expertise": "相關領域專家",
-                        "background": "理論研究者",
-                        "personality": "嚴謹細致",
-                        "stance": "理論為本",
-                        "style": "學術嚴謹",
-                        "interaction": "喜歡探討原理"
-                    }
-                ]
+                return [dict(expert) for expert in DEFAULT_EXPERTS]
             
+            # 只快取成功生成的專家團隊，默認角色不保存
+            if persona_cache_enabled(self.use_cache):
+                get_persona_cache().store("agents", question, experts_data["experts"])
             return experts_data["experts"]
         except Exception as e:
             print(f"生成專家時發生錯誤: {str(e)}")
             traceback.print_exc()
-            return [
-                {
-                    "name": "專家A",
-                    "expertise": "相關領域專家",
-                    "background": "資深研究員",
-                    "personality": "分析型思考",
-                    "stance": "客觀中立",
-                    "style": "條理清晰",
-                    "interaction": "喜歡深入討論"
-                },
-                {
-                    "name": "專家B",
-                    "expertise": "相關領域專家",
-                    "background": "業界實踐者",
-                    "personality": "實用主義",
-                    "stance": "務實導向",
-                    "style": "直接明了",
-                    "interaction": "重視實際應用"
-                },
-                {
-                    "name": "專家C",
-                    "expertise": "相關領域專家",
-                    "background": "理論研究者",
-                    "personality": "嚴謹細致",
-                    "stance": "理論為本",
-                    "style": "學術嚴謹",
-                    "interaction": "喜歡探討原理"
-                }
-            ]
+            return [dict(expert) for expert in DEFAULT_EXPERTS]
     
     async def post_async(self, shared: Dict, prep_res: str, exec_res: List) -> str:
         shared["agents"] = exec_res
+        log_event("agents", agents=exec_res)
         
         # 將專家信息轉換為 Markdown 格式
         markdown_content = []
@@ -362,13 +527,34 @@ class SessionStartNode(Node):
 class DiscussionNode(Node):
     """管理討論流程"""
     
+    def __init__(
+        self,
+        parallel: Optional[bool] = None,
+        max_concurrency: Optional[int] = None,
+        speculative: Optional[bool] = None,
+        fused: Optional[bool] = None,
+        observer: Optional[ObserverChannel] = None
+    ):
+        super().__init__()
+        # 並行模式下同一輪的專家同時發言（專家提示只依賴開場白和之前輪次的總結）
+        self.parallel = PARALLEL_ROUND if parallel is None else parallel
+        self.max_concurrency = max(1, max_concurrency or MAX_CONCURRENT_AGENTS)
+        # 推測模式下本輪總結完成後立即生成下一輪的討論重點，與觀察者輸入和評估並行進行
+        self.speculative = SPECULATIVE_FOCUS if speculative is None else speculative
+        # 合併模式下本輪總結、共識分歧和是否繼續的決定由一次調用以 JSON 輸出
+        self.fused = FUSED_ROUND_EVALUATION if fused is None else fused
+        # 觀察者輸入通道，等待期間不阻塞事件循環
+        self.observer = observer or create_observer()
+    
     async def prep_async(self, shared: Dict) -> Dict:
         return {
             "question": shared["question"],
             "moderator": shared["moderator"],
             "agents": shared["agents"],
             "history": shared.get("discussion_history", []),
-            "observer_inputs": shared.get("observer_inputs", [])
+            "observer_inputs": shared.get("observer_inputs", []),
+            "context_state": shared.setdefault("context_digest", new_context_state()),
+            "speculative_focus": shared.pop("speculative_focus", None)
         }
     
     async def exec_async(self, data: Dict) -> Dict:
@@ -391,23 +577,30 @@ class DiscussionNode(Node):
         has_observer_input = len(observer_inputs) > 0 and len(observer_inputs) >= current_round - 1
         observer_input = observer_inputs[current_round - 2] if has_observer_input and current_round > 1 else None
         
+        # 討論歷史超出預算時壓縮較早的輪次，與主持人提出本輪重點並行進行
+        context = RollingContext(data.get("context_state") or new_context_state())
+        refresh_task = asyncio.create_task(context.refresh(history, question))
+        speculation = None
+        
+        # 主持人的固定前綴，開場白、本輪重點和本輪總結共用
+        moderator_system = moderator_system_prompt(question, moderator)
+        
         try:
             # 構建開場白或本輪討論重點
             if current_round == 1:
                 # 第一輪討論，由主持人開場
                 opening_prompt = f"""
-                你是一位名為 {moderator['name']} 的討論主持人，具有 {moderator['background']} 背景，主持風格是 {moderator['style']}。
-                
-                你正在主持一場關於「{question}」的專家圓桌討論。請提供一個開場白，包括：
+                請提供一個開場白，包括：
                 1. 對問題的簡要介紹
                 2. 討論的重要性和目的
                 3. 本輪討論的重點
-                
-                請直接以主持人的身份發言，無需使用引號或特殊格式。
                 """
                 
                 opening_response = await call_llm_streaming(
-                    [{"role": "user", "content": opening_prompt}],
+                    [
+                        {"role": "system", "content": moderator_system},
+                        {"role": "user", "content": opening_prompt}
+                    ],
                     context_info=f"主持人 {moderator['name']} 開場白"
                 )
                 
@@ -422,36 +615,17 @@ class DiscussionNode(Node):
             else:
                 # 非第一輪，主持人總結上一輪並提出新的討論重點
                 previous_round = history[current_round - 2]
-                previous_responses = previous_round.get('responses', [])
                 previous_summary = previous_round.get('summary', {}).get('summary', '沒有總結')
                 
-                # 檢查是否有觀察者輸入
-                observer_note = ""
-                if observer_input:
-                    observer_note = f"\n\n此外，有觀察者提出以下觀點或疑問：\n{observer_input}\n請在本輪討論中適當考慮這一觀點。"
+                new_focus_prompt = self._build_focus_prompt(current_round, previous_summary, observer_input)
                 
-                new_focus_prompt = f"""
-                你是一位名為 {moderator['name']} 的討論主持人，具有 {moderator['background']} 背景，主持風格是 {moderator['style']}。
-                
-                你正在主持一場關於「{question}」的專家圓桌討論。目前已經進行了 {current_round - 1} 輪討論。
-                
-                上一輪討論的總結是：
-                {previous_summary}
-                
-                {observer_note}
-                
-                請提出本輪（第 {current_round} 輪）討論的重點和方向，包括：
-                1. 簡要回顧已討論的內容
-                2. 指出尚未充分探討的方面
-                3. 本輪應該重點關注的問題
-                
-                請直接以主持人的身份發言，無需使用引號或特殊格式。
-                """
-                
-                new_focus_response = await call_llm_streaming(
-                    [{"role": "user", "content": new_focus_prompt}],
-                    context_info=f"主持人 {moderator['name']} 提出第 {current_round} 輪討論重點"
-                )
+                # 上一輪推測生成的討論重點，只有在提示完全相同（總結和觀察者輸入都沒有變化）時才使用
+                speculative_focus = data.get("speculative_focus")
+                if speculative_focus and speculative_focus["prompt"] == new_focus_prompt:
+                    console.print(f"[blue]使用預先生成的第 {current_round} 輪討論重點[/blue]")
+                    new_focus_response = speculative_focus["opening"]
+                else:
+                    new_focus_response = await self._request_focus(moderator_system, moderator, current_round, new_focus_prompt)
                 
                 # 保存本輪討論重點
                 opening_data = {
@@ -461,124 +635,147 @@ class DiscussionNode(Node):
                     "focus": f"第 {current_round} 輪討論重點"
                 }
             
+            log_event("turn", kind="opening", opening=opening_data)
+            
             # 顯示主持人開場白或引導語
             moderator_md = f"## 主持人 {moderator['name']}\n\n{opening_data['opening']}"
             console.print(Markdown(moderator_md))
             console.print()
             
-            # 專家依次發言
+            await refresh_task
+            history_text = context.history_text(history)
+            
+            # 專家發言（並行模式下同時請求，仍按專家順序保存和顯示）
             responses = []
-            for agent in agents:
-                # 構建專家發言提示
-                agent_prompt = self._build_agent_prompt(question, moderator, agent, history, current_round, opening_data, observer_input)
+            if self.parallel and len(agents) > 1:
+                console.print(f"[blue]{len(agents)} 位專家並行發言中（最大並發數 {self.max_concurrency}）...[/blue]")
+                semaphore = asyncio.Semaphore(self.max_concurrency)
                 
-                # 獲取專家回應
-                agent_response = await call_llm_streaming(
-                    [{"role": "user", "content": agent_prompt}],
-                    context_info=f"專家 {agent['name']} 發言中"
-                )
+                async def bounded_turn(agent):
+                    async with semaphore:
+                        return await self._agent_turn(question, moderator, agent, history_text, current_round, opening_data, observer_input, live_display=False)
                 
-                # 保存專家回應
-                response_data = {
-                    "role": "agent",
-                    "agent": agent,
-                    "content": agent_response
-                }
-                responses.append(response_data)
-                
-                # 顯示專家發言（Markdown 格式）
-                agent_md = f"## {agent['name']} ({agent['expertise']})\n\n{agent_response}"
-                console.print(Markdown(agent_md))
-                console.print()
-            
-            # 主持人總結本輪討論
-            summary_prompt = f"""
-            你是一位名為 {moderator['name']} 的討論主持人，具有 {moderator['background']} 背景，主持風格是 {moderator['style']}。
-            
-            你正在主持一場關於「{question}」的專家圓桌討論。剛剛結束了第 {current_round} 輪討論，請總結本輪討論的主要觀點和結論。
-            
-            以下是本輪討論的內容：
-            
-            討論重點：
-            {opening_data['opening']}
-            
-            專家發言：
-            """
-            
-            for response in responses:
-                summary_prompt += f"{response['agent']['name']}（{response['agent']['expertise']}）: {response['content']}\n\n"
-            
-            summary_prompt += """
-            請提供：
-            1. 本輪討論的核心觀點整合
-            2. 達成的共識（如果有）
-            3. 存在的分歧（如果有）
+                responses = list(await asyncio.gather(*(bounded_turn(agent) for agent in agents)))
+                for response_data in responses:
+                    self._print_agent_response(console, response_data)
+            else:
+                for agent in agents:
+                    response_data = await self._agent_turn(question, moderator, agent, history_text, current_round, opening_data, observer_input)
+                    responses.append(response_data)
+                    self._print_agent_response(console, response_data)
             
-            請直接以主持人的身份發言，無需使用引號或特殊格式。
-            """
+            # 合併模式下一次調用完成本輪總結和評估，失敗時退回分開的兩次調用
+            decision = None
+            if self.fused:
+                decision = await self._summarize_and_evaluate(moderator_system, current_round, opening_data, responses, history_text)
             
-            round_summary = await call_llm_streaming(
-                [{"role": "user", "content": summary_prompt}],
-                context_info=f"主持人總結第 {current_round} 輪討論"
-            )
+            if decision:
+                round_summary = format_round_summary(decision)
+            else:
+                # 主持人總結本輪討論
+                summary_prompt = f"""
+                剛剛結束了第 {current_round} 輪討論，請總結本輪討論的主要觀點和結論。
+                
+                以下是本輪討論的內容：
+                
+                討論重點：
+                {opening_data['opening']}
+                
+                專家發言：
+                """
+                
+                summary_prompt += self._format_responses(responses)
+                
+                summary_prompt += """
+                請提供：
+                1. 本輪討論的核心觀點整合
+                2. 達成的共識（如果有）
+                3. 存在的分歧（如果有）
+                """
+                
+                round_summary = await call_llm_streaming(
+                    [
+                        {"role": "system", "content": moderator_system},
+                        {"role": "user", "content": summary_prompt}
+                    ],
+                    context_info=f"主持人總結第 {current_round} 輪討論"
+                )
             
             # 顯示總結（Markdown 格式）
             summary_md = f"## 主持人總結\n\n{round_summary}"
             console.print(Markdown(summary_md))
             console.print()
             
-            # 提示觀察者是否有輸入
-            console.print(Markdown(f"## 觀察者意見\n\n主持人 {moderator['name']} 轉向您詢問：「觀察者，您對本輪討論有什麼看法或補充嗎？如果沒有，請直接按下 Enter 鍵，我們將繼續討論。」"))
-            observer_comment = input("> ").strip()
+            # 推測下一輪沒有觀察者輸入，提前生成下一輪討論重點（合併模式下已決定結束時不推測）
+            if self.speculative and (decision is None or decision["should_continue"]):
+                speculation = self._speculate_focus(moderator_system, moderator, current_round + 1, round_summary)
+            
+            # 詢問觀察者意見（推測請求等後台任務在等待期間繼續進行）
+            if self.observer.interactive:
+                console.print(Markdown(f"## 觀察者意見\n\n主持人 {moderator['name']} 轉向您詢問：「觀察者，您對本輪討論有什麼看法或補充嗎？如果沒有，請直接按下 Enter 鍵，我們將繼續討論。」"))
+            emit_progress("observer_prompt")
+            observer_comment = await self.observer.ask(current_round) or ""
+            emit_progress("observer_input", text=observer_comment or None)
+            if observer_comment and not self.observer.interactive:
+                console.print(Markdown(f"## 觀察者意見\n\n{observer_comment}"))
+            
+            # 觀察者的輸入改變了下一輪的提示，按新的輸入重新推測
+            if self.speculative and observer_comment:
+                if speculation:
+                    speculation.cancel()
+                speculation = self._speculate_focus(moderator_system, moderator, current_round + 1, round_summary, observer_comment)
             
             # 保存觀察者輸入
             while len(observer_inputs) < current_round:
                 observer_inputs.append(None)
             observer_inputs[current_round - 1] = observer_comment if observer_comment else None
             
-            # 評估討論是否需要繼續
-            evaluation_prompt = f"""
-            你是一位資深的討論評估專家。請評估以下專家討論是否已經充分探討了主題，是否需要繼續討論。
-            
-            討論問題：{question}
-            
-            當前討論輪次：{current_round}
-            
-            討論歷史摘要：
-            """
-            
-            # 添加歷史討論摘要
-            for i, round_data in enumerate(history):
-                if round_data.get('summary'):
-                    evaluation_prompt += f"第 {i+1} 輪總結：{round_data['summary'].get('summary', '無總結')}\n\n"
-            
-            # 添加當前輪次總結和觀察者輸入（如果有）
-            evaluation_prompt += f"""
-            本輪總結：{round_summary}
-            """
-            
-            if observer_comment:
+            if decision:
+                # 觀察者提出新的觀點時再進行一輪，由主持人在下一輪討論重點中回應
+                should_continue = decision["should_continue"] or bool(observer_comment)
+                evaluation_response = f"{'繼續討論' if decision['should_continue'] else '結束討論'}：{decision['reason']}"
+                if observer_comment and not decision["should_continue"]:
+                    evaluation_response += "（觀察者提出了新的觀點，繼續討論一輪）"
+            else:
+                # 評估討論是否需要繼續
+                evaluation_prompt = f"""
+                當前討論輪次：{current_round}
+                
+                討論歷史摘要：
+                """
+                
+                # 添加歷史討論摘要（較早的輪次已壓縮）
+                evaluation_prompt += history_text
+                
+                # 添加當前輪次總結和觀察者輸入（如果有）
                 evaluation_prompt += f"""
-                觀察者提出的觀點或疑問：{observer_comment}
+                本輪總結：{round_summary}
                 """
+                
+                if observer_comment:
+                    evaluation_prompt += f"""
+                    觀察者提出的觀點或疑問：{observer_comment}
+                    """
+                
+                with call_context(role="evaluator"):
+                    evaluation_response = await call_llm_streaming(
+                        [
+                            {"role": "system", "content": evaluator_system_prompt(question)},
+                            {"role": "user", "content": evaluation_prompt}
+                        ],
+                        context_info="評估討論進展"
+                    )
+                
+                # 解析評估結果
+                should_continue = "繼續討論" in evaluation_response
             
-            evaluation_prompt += f"""
-            評估討論是否應該結束的標準：
-            1. 是否已經全面覆蓋了問題的各個方面
-            2. 是否達成了一定程度的共識或清晰地表達了不同觀點
-            3. 是否已經提供了足夠的深度分析
-            4. 再繼續討論是否會產生實質性的新見解
-            
-            請回答：「繼續討論」或「結束討論」，並簡要說明理由。
-            """
-            
-            evaluation_response = await call_llm_streaming(
-                [{"role": "user", "content": evaluation_prompt}],
-                context_info="評估討論進展"
-            )
-            
-            # 解析評估結果
-            should_continue = "繼續討論" in evaluation_response
+            # 討論繼續時保留推測結果供下一輪使用，結束時丟棄
+            next_focus = None
+            if speculation:
+                if should_continue:
+                    next_focus = await speculation
+                else:
+                    speculation.cancel()
             
             # 將本輪討論數據整合到歷史中
             round_data = {
@@ -592,16 +789,23 @@ class DiscussionNode(Node):
                 },
                 "evaluation": evaluation_response
             }
+            if decision:
+                round_data["summary"].update(consensus=decision["consensus"], disagreements=decision["disagreements"])
+                round_data["decision"] = {"should_continue": decision["should_continue"], "reason": decision["reason"]}
             
             return {
                 "round_data": round_data,
                 "should_continue": should_continue,
-                "observer_inputs": observer_inputs
+                "observer_inputs": observer_inputs,
+                "speculative_focus": next_focus
             }
             
         except Exception as e:
             print(f"討論過程中發生錯誤: {str(e)}")
             traceback.print_exc()
+            refresh_task.cancel()
+            if speculation:
+                speculation.cancel()
             return {
                 "round_data": {
                     "round_number": current_round,
@@ -611,41 +815,157 @@ class DiscussionNode(Node):
                 "observer_inputs": observer_inputs
             }
     
-    def _build_agent_prompt(self, question, moderator, agent, history, current_round, opening_data, observer_input=None):
-        """構建專家發言提示"""
+    def _format_responses(self, responses):
+        """本輪專家發言，用於總結提示"""
+        return "".join(
+            f"{response['agent']['name']}（{response['agent']['expertise']}）: {response['content']}\n\n"
+            for response in responses
+        )
+    
+    async def _summarize_and_evaluate(self, moderator_system, current_round, opening_data, responses, history_text):
+        """一次調用完成本輪總結和是否繼續的評估，返回符合 ROUND_EVALUATION_SCHEMA 的數據，失敗時返回 None"""
         prompt = f"""
-        你是一位名為 {agent['name']} 的專家，專業領域是 {agent['expertise']}，具有 {agent['background']} 背景。
-        你的性格特徵是 {agent.get('personality', '未提供')}，觀點立場是 {agent.get('stance', '未提供')}。
-        你的發言風格是 {agent.get('style', '專業客觀')}，互動偏好是 {agent.get('interaction', '理性交流')}。
+        剛剛結束了第 {current_round} 輪討論。請總結本輪討論，並評估討論是否應該繼續。
+        
+        先前討論的摘要：
+        {history_text or '（這是第一輪討論）'}
+        
+        以下是本輪討論的內容：
+        
+        討論重點：
+        {opening_data['opening']}
+        
+        專家發言：
+        """
+        
+        prompt += self._format_responses(responses)
+        
+        prompt += f"""
+        {EVALUATION_CRITERIA}
+        
+        請只輸出一個 JSON 對象，不要包含代碼塊標記或其他說明文字，格式如下：
+        {{
+          "summary": "本輪討論的核心觀點整合",
+          "consensus": ["達成的共識"],
+          "disagreements": ["存在的分歧"],
+          "should_continue": true,
+          "reason": "是否繼續討論的簡要理由"
+        }}
+        沒有共識或分歧時使用空數組；討論應該結束時 should_continue 為 false。
+        """
+        
+        result = await call_llm_structured(
+            [
+                {"role": "system", "content": moderator_system},
+                {"role": "user", "content": prompt}
+            ],
+            ROUND_EVALUATION_SCHEMA,
+            "round_evaluation",
+            context_info=f"主持人總結並評估第 {current_round} 輪討論"
+        )
+        if result is None:
+            print("合併的總結和評估未能生成有效輸出，改為分別總結和評估")
+        return result
+    
+    def _build_focus_prompt(self, current_round, previous_summary, observer_input=None):
+        """構建主持人提出本輪討論重點的提示"""
+        observer_note = ""
+        if observer_input:
+            observer_note = f"\n\n此外，有觀察者提出以下觀點或疑問：\n{observer_input}\n請在本輪討論中適當考慮這一觀點。"
+        
+        return f"""
+                目前已經進行了 {current_round - 1} 輪討論。
+                
+                上一輪討論的總結是：
+                {previous_summary}
+                
+                {observer_note}
+                
+                請提出本輪（第 {current_round} 輪）討論的重點和方向，包括：
+                1. 簡要回顧已討論的內容
+                2. 指出尚未充分探討的方面
+                3. 本輪應該重點關注的問題
+                """
+    
+    async def _request_focus(self, moderator_system, moderator, current_round, focus_prompt, live_display=None):
+        """請求主持人提出本輪討論重點"""
+        return await call_llm_streaming(
+            [
+                {"role": "system", "content": moderator_system},
+                {"role": "user", "content": focus_prompt}
+            ],
+            context_info=f"主持人 {moderator['name']} 提出第 {current_round} 輪討論重點",
+            live_display=live_display
+        )
+    
+    def _speculate_focus(self, moderator_system, moderator, next_round, round_summary, observer_input=None):
+        """在後台生成下一輪的討論重點，任務結果為 {"prompt", "opening"}，失敗時為 None"""
+        focus_prompt = self._build_focus_prompt(next_round, round_summary, observer_input)
         
-        你正在參加一場由 {moderator['name']} 主持的關於「{question}」的專家圓桌討論。
+        async def speculate():
+            try:
+                with call_context(speculative=True):
+                    opening = await self._request_focus(moderator_system, moderator, next_round, focus_prompt, live_display=False)
+            except Exception as e:
+                print(f"推測生成第 {next_round} 輪討論重點失敗: {str(e)}")
+                return None
+            if not opening or opening.startswith(LLM_FAILURE_PREFIX):
+                return None
+            return {"prompt": focus_prompt, "opening": opening}
         
+        return asyncio.create_task(speculate())
+    
+    async def _agent_turn(self, question, moderator, agent, history_text, current_round, opening_data, observer_input=None, live_display=None):
+        """獲取單個專家的發言"""
+        # 構建專家發言提示：固定的角色前綴 + 本輪內容
+        agent_prompt = self._build_agent_prompt(history_text, current_round, opening_data, observer_input)
+        
+        # 獲取專家回應
+        with call_context(role="agent", agent=agent['name']):
+            agent_response = await call_llm_streaming(
+                [
+                    {"role": "system", "content": agent_system_prompt(question, moderator, agent)},
+                    {"role": "user", "content": agent_prompt}
+                ],
+                context_info=f"專家 {agent['name']} 發言中",
+                live_display=live_display,
+                route_key=agent['name']  # sticky 路由策略下同一專家固定使用同一模型
+            )
+        
+        response_data = {
+            "role": "agent",
+            "agent": agent,
+            "content": agent_response
+        }
+        # 每個發言完成後立即寫入事件日誌，崩潰時不會丟失
+        log_event("turn", kind="response", response=response_data)
+        return response_data
+    
+    def _print_agent_response(self, console, response_data):
+        """顯示專家發言（Markdown 格式）"""
+        agent = response_data["agent"]
+        agent_md = f"## {agent['name']} ({agent['expertise']})\n\n{response_data['content']}"
+        console.print(Markdown(agent_md))
+        console.print()
+    
+    def _build_agent_prompt(self, history_text, current_round, opening_data, observer_input=None):
+        """構建專家發言提示中每輪變化的部分，history_text 為經過壓縮的先前討論摘要"""
+        prompt = f"""
         以下是當前討論的情況：
         - 這是第 {current_round} 輪討論
         - 主持人提出的本輪討論重點是：{opening_data['opening']}
         """
         
         # 添加歷史討論記錄
-        if history and len(history) > 0:
-            prompt += "\n先前討論的摘要：\n"
-            for i, round_data in enumerate(history):
-                prompt += f"第 {i+1} 輪總結：{round_data.get('summary', {}).get('summary', '無總結')}\n"
+        if history_text:
+            prompt += "\n先前討論的摘要：\n" + history_text
         
         # 添加觀察者輸入（如果有）
         if observer_input:
             prompt += f"\n有觀察者提出以下觀點或疑問：\n{observer_input}\n請在你的回應中考慮這一觀點。\n"
         
         prompt += """
-        請從你的專業角度，針對當前討論重點發表見解，包括：
-        1. 你對問題的專業分析
-        2. 可能的解決方案或建議
-        3. 對其他專家觀點的回應（如果這不是第一輪討論）
-        
-        請直接以專家的身份發言，無需使用引號或特殊格式。請確保你的回應：
-        - 符合你的專業背景和觀點立場
-        - 展現你的性格特徵和發言風格
-        - 提供有深度的見解而不是泛泛而談
-        - 篇幅適中（200-400字左右）
+        請針對本輪討論重點發言。
         """
         
         return prompt
@@ -660,10 +980,16 @@ class DiscussionNode(Node):
             shared["discussion_history"] = []
         
         shared["discussion_history"].append(round_data)
+        # 開場白和發言已經逐條記錄，這裡只記錄本輪的總結和評估
+        log_event("round", round_data={key: value for key, value in round_data.items() if key not in ("opening", "responses")})
         
         # 更新觀察者輸入
         shared["observer_inputs"] = exec_res.get("observer_inputs", shared.get("observer_inputs", []))
         
+        # 保存推測生成的下一輪討論重點
+        if exec_res.get("speculative_focus"):
+            shared["speculative_focus"] = exec_res["speculative_focus"]
+        
         # 創建 Rich Console 對象
         console = Console()
         
@@ -683,7 +1009,9 @@ class DiscussionNode(Node):
         """為 FlowRunner 系統提供的統一入口"""
         try:
             prep_res = await self.prep_async(shared)
-            exec_res = await self.exec_async(prep_res)
+            # 本輪的調用按輪次歸類，未另行標註的調用屬於主持人
+            with call_context(round=len(prep_res["history"]) + 1, role="moderator"):
+                exec_res = await self.exec_async(prep_res)
             return await self.post_async(shared, prep_res, exec_res)
         except Exception as e:
             print(f"DiscussionNode 執行錯誤: {str(e)}")
@@ -699,7 +1027,8 @@ class SummaryNode(Node):
             "moderator": shared["moderator"],
             "agents": shared["agents"],
             "discussion_history": shared["discussion_history"],
-            "observer_inputs": shared.get("observer_inputs", [])
+            "observer_inputs": shared.get("observer_inputs", []),
+            "context_state": shared.setdefault("context_digest", new_context_state())
         }
     
     async def exec_async(self, data: Dict) -> str:
@@ -711,9 +1040,7 @@ class SummaryNode(Node):
         
         # 構建摘要提示
         summary_prompt = f"""
-        你是一位名為 {moderator['name']} 的討論主持人，具有 {moderator['background']} 背景。
-        
-        你剛剛主持了一場關於「{question}」的專家圓桌討論。討論已經結束，請根據以下討論記錄生成一個全面的最終摘要。
+        討論已經結束，請根據以下討論記錄生成一個全面的最終摘要。
         
         討論包含了 {len(discussion_history)} 輪交流，參與的專家有：
         """
@@ -724,27 +1051,10 @@ class SummaryNode(Node):
         
         summary_prompt += "\n討論歷程：\n"
         
-        # 添加討論歷史
-        for i, round_data in enumerate(discussion_history):
-            summary_prompt += f"\n第 {i+1} 輪討論：\n"
-            
-            # 添加開場白或重點
-            if round_data.get('opening'):
-                summary_prompt += f"討論重點：{round_data['opening'].get('opening', '未提供')}\n"
-            
-            # 添加專家回應摘要
-            if round_data.get('responses'):
-                summary_prompt += "專家觀點：\n"
-                for response in round_data['responses']:
-                    summary_prompt += f"- {response['agent']['name']}：{response['content']}\n"
-            
-            # 添加本輪總結
-            if round_data.get('summary'):
-                summary_prompt += f"本輪總結：{round_data['summary'].get('summary', '未提供')}\n"
-            
-            # 添加觀察者輸入（如果有）
-            if i < len(observer_inputs) and observer_inputs[i]:
-                summary_prompt += f"觀察者輸入：{observer_inputs[i]}\n"
+        # 添加討論歷史：最近幾輪包含專家發言原文，較早的輪次超出預算時使用壓縮摘要
+        context = RollingContext(data.get("context_state") or new_context_state(), history_budget=CONTEXT_SUMMARY_TOKENS)
+        await context.refresh(discussion_history, question, detailed=True)
+        summary_prompt += context.history_text(discussion_history, detailed=True, observer_inputs=observer_inputs)
         
         summary_prompt += """
         請提供一個全面且結構化的最終摘要，包括：
@@ -760,8 +1070,12 @@ class SummaryNode(Node):
         
         try:
             # 生成摘要
+            # 與討論中主持人的調用共用固定前綴
             summary = await call_llm_streaming(
-                [{"role": "user", "content": summary_prompt}],
+                [
+                    {"role": "system", "content": moderator_system_prompt(question, moderator)},
+                    {"role": "user", "content": summary_prompt}
+                ],
                 max_tokens=1500,
                 context_info="生成最終摘要中...",
                 idle_timeout=60  # 為最終摘要生成設置更長的空閒超時時間
@@ -794,8 +1108,8 @@ class SummaryNode(Node):
         complete_md = "\n## 討論已結束"
         console.print(Markdown(complete_md))
         
-        # 保存討論記錄
-        save_discussion_record(shared)
+        # 完整記錄由調用方在會話結束時生成，這裡只寫入事件日誌
+        log_event("summary", summary=exec_res)
         
         return "default"
         
@@ -0,0 +1,85 @@
+"""
+檢索過去的討論記錄：在 SQLite 全文索引中搜索問題、主持人和專家設定、發言、每輪總結和最終結論
+
+用法：
+    python search.py 消息隊列
+    python search.py "消息隊列 可靠性" --kind turn --limit 5
+    python search.py 成本 --dir records --dir records/batch_nightly --json
+    python search.py --sync-only
+
+檢索前先增量同步 --dir 指定的目錄（默認 records），只重新解析新增或修改過的記錄文件（*.record.jsonl，
+以及沒有對應記錄文件的舊 YAML 記錄）；
+通過 main.py、batch.py 或服務模式保存的記錄在保存時已經加入索引。
+"""
+
+import sys
+import json
+import argparse
+
+from utils.record_index import RECORD_KINDS, get_record_index
+
+KIND_LABELS = {
+    "question": "問題",
+    "persona": "角色設定",
+    "opening": "主持人開場",
+    "turn": "專家發言",
+    "round_summary": "本輪總結",
+    "observer": "觀察者輸入",
+    "summary": "最終結論"
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="檢索過去的圓桌會議記錄")
+    parser.add_argument("query", nargs="?", help="關鍵詞，多個詞以空格分隔，需同時出現在同一段內容中")
+    parser.add_argument("--kind", choices=RECORD_KINDS, help="只搜索指定類型的內容")
+    parser.add_argument("--limit", type=int, default=10, help="最多返回的記錄數")
+    parser.add_argument("--dir", action="append", dest="dirs", help="同步的記錄目錄，可指定多次（默認 records）")
+    parser.add_argument("--no-sync", action="store_true", help="不同步目錄，直接使用現有索引")
+    parser.add_argument("--sync-only", action="store_true", help="只同步索引，不檢索")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    return parser.parse_args(argv)
+
+def format_results(results) -> str:
+    lines = []
+    for result in results:
+        lines.append(f"{result['timestamp']}  [{result['status']}]  {result['question']}")
+        lines.append(f"  {result['path']}")
+        for match in result["matches"][:3]:
+            where = KIND_LABELS.get(match["kind"], match["kind"])
+            if match["round"]:
+                where += f" · 第 {match['round']} 輪"
+            if match["speaker"]:
+                where += f" · {match['speaker']}"
+            snippet = " ".join(match["snippet"].split())
+            lines.append(f"    {where}：{snippet}")
+        if len(result["matches"]) > 3:
+            lines.append(f"    ……另有 {len(result['matches']) - 3} 處匹配")
+        lines.append("")
+    return "\n".join(lines)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.query and not args.sync_only:
+        print("請提供檢索關鍵詞，或使用 --sync-only 只同步索引", file=sys.stderr)
+        return 2
+
+    index = get_record_index()
+    if not args.no_sync:
+        stats = index.sync(args.dirs or ["records"])
+        if any(stats.values()):
+            print(f"索引已同步：新增 {stats['added']}，更新 {stats['updated']}，刪除 {stats['removed']}，跳過 {stats['skipped']}", file=sys.stderr)
+    if args.sync_only:
+        print(f"索引中共有 {index.count()} 份記錄", file=sys.stderr)
+        return 0
+
+    results = index.search(args.query, kind=args.kind, limit=args.limit)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    elif results:
+        print(format_results(results))
+    else:
+        print("沒有找到匹配的記錄")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+HTTP 服務模式：在同一個事件循環中運行多個討論會話，通過 Server-Sent Events 推送逐字進度
+
+用法：
+    python server.py --port 8080 --max-sessions 8
+
+接口：
+    POST /sessions                  創建會話，請求體 {"question": "...", "observer_inputs": [...], "observer_timeout": 60}
+    GET  /sessions                  列出會話
+    GET  /sessions/<id>             會話狀態
+    GET  /sessions/<id>/events      SSE 事件流（node、llm_start、token、llm_end、observer_prompt、observer_input、session_end），
+                                    斷線後帶上 Last-Event-ID 請求頭（或 ?after=<id>）重新連接可補發錯過的事件
+    POST /sessions/<id>/observer    提交觀察者意見，請求體 {"text": "..."}
+    GET  /sessions/<id>/record      討論記錄（JSON），?format=markdown 返回 Markdown
+    GET  /records?q=<關鍵詞>          全文檢索過去的討論記錄，可選 &kind=turn&limit=10
+
+所有會話共用一個 API 客戶端、限流器和路由器；每個會話的事件保存在內存中，
+訂閱者按自己的速度讀取，消費過慢時合併積壓的 token 事件，不會拖慢討論本身。
+會話結束後連續的 token 事件合併保存，事件編號不變。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import bisect
+import argparse
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+# 訂閱者落後超過這麼多事件時，合併連續的 token 事件
+COALESCE_LAG = 200
+# 沒有新事件時發送保活註釋的間隔（秒）
+KEEPALIVE_INTERVAL = 15.0
+
+class Session:
+    """一個討論會話：保存全部事件，訂閱者各自按事件編號讀取"""
+
+    def __init__(self, session_id: str, question: str, observer):
+        self.id = session_id
+        self.question = question
+        self.observer = observer
+        self.status = "queued"
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events: List[Dict] = []
+        self.event_ids: Optional[List[int]] = None  # 壓縮後每個事件的編號，合併的 token 事件取最後一個的編號
+        self._changed = asyncio.Event()
+        self.task = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: Dict) -> None:
+        """追加事件並喚醒訂閱者；從不等待，討論不受訂閱者速度影響"""
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def finish(self, result: Dict) -> None:
+        self.result = result
+        self.status = result.get("status", "failed")
+        self.finished_at = time.time()
+        self.publish({"event": "session_end", "time": round(self.finished_at, 3), "status": self.status, "error": result.get("error")})
+        self._compact()
+
+    def _compact(self) -> None:
+        """會話結束後不會再有新事件，合併連續的 token 事件，釋放逐字事件佔用的內存"""
+        events, event_ids, cursor = [], [], 0
+        while cursor < len(self.events):
+            event_id, event, cursor = _coalesce_tokens(self.events, cursor)
+            events.append(event)
+            event_ids.append(event_id)
+        self.events, self.event_ids = events, event_ids
+
+    @property
+    def event_count(self) -> int:
+        """已發佈的事件數（壓縮前的編號總數）"""
+        return self.event_ids[-1] + 1 if self.event_ids else len(self.events)
+
+    async def subscribe(self, start: int = 0, keepalive: float = KEEPALIVE_INTERVAL):
+        """按順序產生 (事件編號, 事件)，會話結束且事件讀完後停止；沒有新事件時產生 (None, None) 作為保活
+
+        會話結束後從合併的 token 事件中間續傳時，會收到整段合併後的內容。
+        """
+        next_id = max(0, start)
+        while True:
+            changed = self._changed
+            if self.event_ids is not None:
+                position = bisect.bisect_left(self.event_ids, next_id)
+                if position < len(self.events):
+                    next_id = self.event_ids[position] + 1
+                    yield self.event_ids[position], self.events[position]
+                    continue
+            elif next_id < len(self.events):
+                # 落後太多時把連續的同一調用的 token 事件合併為一個，減少需要寫出的事件數
+                if len(self.events) - next_id > COALESCE_LAG:
+                    event_id, event, next_id = _coalesce_tokens(self.events, next_id)
+                else:
+                    event_id, event, next_id = next_id, self.events[next_id], next_id + 1
+                yield event_id, event
+                continue
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None, None
+
+    def describe(self) -> Dict:
+        return {
+            "id": self.id,
+            "question": self.question,
+            "status": self.status,
+            "events": self.event_count,
+            "created_at": round(self.created_at, 3),
+            "finished_at": round(self.finished_at, 3) if self.finished_at else None,
+            "result": self.result
+        }
+
+def _coalesce_tokens(events: List[Dict], cursor: int):
+    """從 cursor 開始合併連續的、屬於同一調用的 token 事件，返回 (最後一個事件的編號, 合併後的事件, 新遊標)"""
+    first = events[cursor]
+    if first.get("event") != "token":
+        return cursor, first, cursor + 1
+    texts = [first.get("text", "")]
+    end = cursor + 1
+    while end < len(events):
+        event = events[end]
+        if event.get("event") != "token" or event.get("label") != first.get("label") or event.get("agent") != first.get("agent"):
+            break
+        texts.append(event.get("text", ""))
+        end += 1
+    return end - 1, dict(first, text="".join(texts)), end
+
+class RoundtableService:
+    """管理會話的創建、運行和事件分發"""
+
+    def __init__(self, output_dir: str = "records/service", max_sessions: int = 4, timeout: float = 900,
+                 observer_timeout: float = 60, keep_sessions: int = 200):
+        self.output_dir = output_dir
+        self.timeout = timeout
+        self.observer_timeout = observer_timeout
+        self.keep_sessions = keep_sessions
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.slots = asyncio.Semaphore(max(1, max_sessions))
+        self.server = None
+
+    def create_session(self, question: str, observer_inputs: Optional[List] = None, observer_timeout: Optional[float] = None) -> Session:
+        from utils.observer import QueuedObserver
+
+        timeout = self.observer_timeout if observer_timeout is None else observer_timeout
+        session = Session(uuid.uuid4().hex[:12], question, QueuedObserver(observer_inputs or [], timeout=timeout))
+        self.sessions[session.id] = session
+        self._evict_finished()
+        session.task = asyncio.create_task(self._run(session))
+        return session
+
+    async def _run(self, session: Session) -> None:
+        from batch import run_question
+        from utils.progress import use_progress_sink, reset_progress_sink
+
+        async with self.slots:
+            session.status = "running"
+            token = use_progress_sink(session.publish)
+            try:
+                entry = {"id": session.id, "question": session.question}
+                result = await run_question(entry, self.output_dir, self.timeout, observer=session.observer)
+            except Exception as e:
+                result = {"id": session.id, "question": session.question, "status": "error", "error": str(e)}
+            finally:
+                reset_progress_sink(token)
+        session.finish(result)
+
+    def _evict_finished(self) -> None:
+        """只保留最近的 keep_sessions 個會話，先移除最早結束的"""
+        while len(self.sessions) > self.keep_sessions:
+            oldest = next((s for s in self.sessions.values() if s.finished), None)
+            if oldest is None:
+                break
+            del self.sessions[oldest.id]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        """啟動 HTTP 服務，port 為 0 時自動選擇端口"""
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def stop(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for session in self.sessions.values():
+            if session.task and not session.task.done():
+                session.task.cancel()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", "0")))
+
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            parts = [part for part in url.path.split("/") if part]
+            await self._route(method, parts, query, headers, body, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # 客戶端提前斷開
+            pass
+        except Exception as e:
+            try:
+                await _send_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _route(self, method: str, parts: List[str], query: Dict, headers: Dict, body: bytes, writer) -> None:
+        if parts == ["records"] and method == "GET":
+            return await self._search(query, writer)
+
+        if parts == ["sessions"]:
+            if method == "POST":
+                return await self._create(body, writer)
+            if method == "GET":
+                return await _send_json(writer, 200, {"sessions": [s.describe() for s in self.sessions.values()]})
+
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = self.sessions.get(parts[1])
+            if session is None:
+                return await _send_json(writer, 404, {"error": f"找不到會話: {parts[1]}"})
+            action = parts[2] if len(parts) > 2 else None
+            if method == "GET" and action is None:
+                return await _send_json(writer, 200, session.describe())
+            if method == "GET" and action == "events":
+                last_id = headers.get("last-event-id", query.get("after"))
+                try:
+                    start = int(last_id) + 1 if last_id not in (None, "") else 0
+                except ValueError:
+                    return await _send_json(writer, 400, {"error": "Last-Event-ID 和 after 應為整數"})
+                return await self._stream_events(session, start, writer)
+            if method == "POST" and action == "observer":
+                return await self._observer(session, body, writer)
+            if method == "GET" and action == "record":
+                return await self._record(session, query.get("format"), writer)
+
+        await _send_json(writer, 404, {"error": f"未知路徑: {method} /{'/'.join(parts)}"})
+
+    async def _create(self, body: bytes, writer) -> None:
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            return await _send_json(writer, 400, {"error": f"請求體不是有效的 JSON：{e.msg}"})
+        question = str(request.get("question") or "").strip()
+        if len(question) < 10:
+            return await _send_json(writer, 400, {"error": "問題太短或為空（至少 10 個字符）"})
+
+        session = self.create_session(question, request.get("observer_inputs"), request.get("observer_timeout"))
+        await _send_json(writer, 201, {
+            "id": session.id,
+            "status": session.status,
+            "events": f"/sessions/{session.id}/events",
+            "observer": f"/sessions/{session.id}/observer",
+            "record": f"/sessions/{session.id}/record"
+        })
+
+    async def _stream_events(self, session: Session, start: int, writer) -> None:
+        headers = {"content-type": "text/event-stream; charset=utf-8", "cache-control": "no-cache", "connection": "close"}
+        writer.write(_status_line(200) + _header_block(headers))
+        await writer.drain()
+
+        async for event_id, event in session.subscribe(start):
+            if event is None:
+                writer.write(b": keepalive\n\n")
+            else:
+                data = json.dumps(event, ensure_ascii=False)
+                writer.write(f"id: {event_id}\nevent: {event['event']}\ndata: {data}\n\n".encode("utf-8"))
+            # 等待客戶端接收，慢速連接只會讓自己的遊標落後
+            await writer.drain()
+
+    async def _observer(self, session: Session, body: bytes, writer) -> None:
+        if session.finished:
+            return await _send_json(writer, 409, {"error": "會話已經結束"})
+        try:
+            text = json.loads(body or b"{}").get("text")
+        except (json.JSONDecodeError, AttributeError):
+            return await _send_json(writer, 400, {"error": "請求體應為 {\"text\": \"...\"}"})
+        session.observer.submit(text)
+        await _send_json(writer, 202, {"accepted": True})
+
+    async def _record(self, session: Session, fmt: Optional[str], writer) -> None:
+        from utils.serialization import load_record, record_stem
+
+        record_file = (session.result or {}).get("record")
+        if not session.finished:
+            return await _send_json(writer, 409, {"error": "會話尚未結束", "status": session.status})
+        if not record_file or not os.path.exists(record_file):
+            return await _send_json(writer, 404, {"error": "沒有可用的討論記錄"})
+
+        if fmt == "markdown":
+            markdown_file = record_stem(record_file) + ".md"
+            if not os.path.exists(markdown_file):
+                return await _send_json(writer, 404, {"error": "沒有可用的 Markdown 記錄"})
+            with open(markdown_file, "r", encoding="utf-8") as f:
+                data = f.read().encode("utf-8")
+            headers = {"content-type": "text/markdown; charset=utf-8", "content-length": str(len(data)), "connection": "close"}
+            writer.write(_status_line(200) + _header_block(headers) + data)
+            await writer.drain()
+            return
+
+        record = await asyncio.to_thread(load_record, record_file)
+        await _send_json(writer, 200, record)
+
+    async def _search(self, query: Dict, writer) -> None:
+        from utils.record_index import RECORD_KINDS, search_records
+
+        if not query.get("q", "").strip():
+            return await _send_json(writer, 400, {"error": "缺少檢索關鍵詞 q"})
+        kind = query.get("kind")
+        if kind and kind not in RECORD_KINDS:
+            return await _send_json(writer, 400, {"error": f"未知的內容類型: {kind}"})
+        try:
+            limit = max(1, min(int(query.get("limit", 20)), 100))
+        except ValueError:
+            return await _send_json(writer, 400, {"error": "limit 應為整數"})
+
+        # 檢索在線程中進行，不阻塞其他會話
+        results = await asyncio.to_thread(search_records, query["q"], kind, limit)
+        await _send_json(writer, 200, {"query": query["q"], "results": results})
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Dict) -> None:
+    data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    headers = {"content-type": "application/json; charset=utf-8", "content-length": str(len(data)), "connection": "close"}
+    writer.write(_status_line(status) + _header_block(headers) + data)
+    await writer.drain()
+
+def _status_line(status: int) -> bytes:
+    reasons = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 500: "Internal Server Error"}
+    return f"HTTP/1.1 {status} {reasons.get(status, 'Error')}\r\n".encode("latin-1")
+
+def _header_block(headers: Dict) -> bytes:
+    return "".join(f"{k}: {v}\r\n" for k, v in headers.items()).encode("latin-1") + b"\r\n"
+
+async def _serve(args) -> None:
+    from utils.config import AVAILABLE_MODELS, ROUTER_HEALTH_PROBE
+    from utils.router import get_router
+
+    if ROUTER_HEALTH_PROBE and len(AVAILABLE_MODELS) > 1:
+        await get_router().probe()
+
+    service = RoundtableService(args.output, args.max_sessions, args.timeout, args.observer_timeout, args.keep_sessions)
+    await service.start(args.host, args.port)
+    host, port = service.server.sockets[0].getsockname()[:2]
+    print(f"圓桌會議服務已啟動：http://{host}:{port}", file=sys.stderr)
+    try:
+        async with service.server:
+            await service.server.serve_forever()
+    finally:
+        await service.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="圓桌會議 HTTP / SSE 服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-sessions", type=int, default=4, help="同時運行的最大會話數，超出的會話排隊等待")
+    parser.add_argument("--timeout", type=float, default=900, help="單個會話的超時時間（秒）")
+    parser.add_argument("--observer-timeout", type=float, default=60, help="每輪等待觀察者意見的秒數")
+    parser.add_argument("--keep-sessions", type=int, default=200, help="內存中保留的最大會話數")
+    parser.add_argument("--output", default="records/service", help="討論記錄的保存目錄")
+    args = parser.parse_args()
+
+    # 必須在導入 utils 之前設置：多個會話並行時不能顯示 Live 面板
+    os.environ.setdefault("LIVE_DISPLAY", "false")
+    asyncio.run(_serve(args))
@@ -19,6 +19,211 @@ def test_flow_creation():
     assert "start" in flow.nodes
     assert isinstance(flow.nodes["start"], InputNode)
 
+def test_parallel_round_keeps_agent_order(monkeypatch):
+    """測試並行發言模式保持專家順序並限制並發數"""
+    import asyncio
+    import nodes
+
+    in_flight = 0
+    peak = 0
+
+    async def fake_streaming(messages, context_info=None, **kwargs):
+        nonlocal in_flight, peak
+        if not context_info.startswith("專家"):
+            return "結束討論"
+        in_flight += 1
+        peak = max(peak, in_flight)
+        # 讓排在前面的專家較晚完成，以驗證結果仍按順序保存
+        await asyncio.sleep(0.03 if "A" in context_info else 0.01)
+        in_flight -= 1
+        return f"{context_info} 回應"
+
+    monkeypatch.setattr(nodes, "call_llm_streaming", fake_streaming)
+    monkeypatch.setattr("builtins.input", lambda prompt="": "")
+
+    node = DiscussionNode(parallel=True, max_concurrency=2)
+    data = {
+        "question": "測試並行發言的問題",
+        "moderator": {"name": "主持人", "background": "測試", "style": "測試"},
+        "agents": [{"name": name, "expertise": "測試", "background": "測試"} for name in ("A", "B", "C")],
+        "history": [],
+        "observer_inputs": []
+    }
+
+    result = asyncio.run(node.exec_async(data))
+    responses = result["round_data"]["responses"]
+    assert [r["agent"]["name"] for r in responses] == ["A", "B", "C"]
+    assert peak == 2
+
+def test_persona_prefix_is_stable_across_rounds(monkeypatch):
+    """測試專家和主持人的 system 前綴在不同輪次間逐字節相同，本輪內容只出現在 user 消息中"""
+    import asyncio
+    import nodes
+
+    requests = []
+
+    async def fake_streaming(messages, context_info=None, **kwargs):
+        requests.append((context_info, messages))
+        return "繼續討論" if context_info == "評估討論進展" else f"{context_info} 回應"
+
+    monkeypatch.setattr(nodes, "call_llm_streaming", fake_streaming)
+    monkeypatch.setattr("builtins.input", lambda prompt="": "")
+
+    node = DiscussionNode(parallel=False)
+    data = {
+        "question": "測試前綴快取的問題",
+        "moderator": {"name": "主持人", "background": "測試", "style": "測試"},
+        "agents": [{"name": "A", "expertise": "測試", "background": "測試"}],
+        "history": [],
+        "observer_inputs": []
+    }
+    first = asyncio.run(node.exec_async(data))
+    data["history"] = [first["round_data"]]
+    asyncio.run(node.exec_async(data))
+
+    def system_prompts(label):
+        return [messages[0]["content"] for info, messages in requests if info == label]
+
+    agent_prefixes = system_prompts("專家 A 發言中")
+    assert len(agent_prefixes) == 2 and agent_prefixes[0] == agent_prefixes[1]
+    assert "第 1 輪" not in agent_prefixes[0]
+    assert len(set(system_prompts("評估討論進展"))) == 1
+    moderator_prefixes = {messages[0]["content"] for info, messages in requests if info.startswith("主持人")}
+    assert len(moderator_prefixes) == 1
+
+def test_speculative_focus_reused_or_discarded(monkeypatch):
+    """測試推測生成的下一輪討論重點：討論繼續時在下一輪直接使用，觀察者輸入會觸發重新推測，討論結束時丟棄"""
+    import asyncio
+    import nodes
+
+    calls = []
+    verdict = "繼續討論"
+
+    async def fake_streaming(messages, context_info=None, **kwargs):
+        calls.append((context_info, messages[-1]["content"]))
+        return verdict if context_info == "評估討論進展" else f"{context_info} 回應"
+
+    monkeypatch.setattr(nodes, "call_llm_streaming", fake_streaming)
+    monkeypatch.setattr("builtins.input", lambda prompt="": "請談談成本")
+
+    node = DiscussionNode(parallel=False, speculative=True)
+    data = {
+        "question": "測試推測模式的問題",
+        "moderator": {"name": "主持人", "background": "測試", "style": "測試"},
+        "agents": [{"name": "A", "expertise": "測試", "background": "測試"}],
+        "history": [],
+        "observer_inputs": []
+    }
+    first = asyncio.run(node.exec_async(data))
+    speculative_focus = first["speculative_focus"]
+    assert speculative_focus is not None
+    assert "請談談成本" in speculative_focus["prompt"]
+
+    focus_label = "主持人 主持人 提出第 2 輪討論重點"
+    assert [info for info, _ in calls].count(focus_label) >= 1
+    calls.clear()
+
+    verdict = "結束討論"
+    data.update({
+        "history": [first["round_data"]],
+        "observer_inputs": first["observer_inputs"],
+        "speculative_focus": speculative_focus
+    })
+    second = asyncio.run(node.exec_async(data))
+    assert focus_label not in [info for info, _ in calls]
+    assert second["round_data"]["opening"]["opening"] == speculative_focus["opening"]
+    assert second["speculative_focus"] is None
+
+def test_fused_round_evaluation(monkeypatch):
+    """測試合併模式下本輪總結和評估只調用一次，並按結構化輸出決定是否繼續"""
+    import asyncio
+    import nodes
+
+    labels = []
+
+    async def fake_streaming(messages, context_info=None, **kwargs):
+        labels.append(context_info)
+        return f"{context_info} 回應"
+
+    async def fake_structured(messages, schema, name, **kwargs):
+        labels.append(kwargs.get("context_info"))
+        assert schema is nodes.ROUND_EVALUATION_SCHEMA
+        return {
+            "summary": "本輪討論了成本",
+            "consensus": ["需要控制成本"],
+            "disagreements": [],
+            "should_continue": False,
+            "reason": "觀點已經充分"
+        }
+
+    monkeypatch.setattr(nodes, "call_llm_streaming", fake_streaming)
+    monkeypatch.setattr(nodes, "call_llm_structured", fake_structured)
+    monkeypatch.setattr("builtins.input", lambda prompt="": "")
+
+    node = DiscussionNode(parallel=False, fused=True)
+    data = {
+        "question": "測試合併評估的問題",
+        "moderator": {"name": "主持人", "background": "測試", "style": "測試"},
+        "agents": [{"name": "A", "expertise": "測試", "background": "測試"}],
+        "history": [],
+        "observer_inputs": []
+    }
+    result = asyncio.run(node.exec_async(data))
+
+    assert "評估討論進展" not in labels
+    assert not any(label.startswith("主持人總結第") for label in labels)
+    assert result["should_continue"] is False
+    round_data = result["round_data"]
+    assert "需要控制成本" in round_data["summary"]["summary"]
+    assert round_data["decision"] == {"should_continue": False, "reason": "觀點已經充分"}
+
+    # 觀察者提出新觀點時至少再討論一輪
+    monkeypatch.setattr("builtins.input", lambda prompt="": "還沒談到風險")
+    result = asyncio.run(node.exec_async(dict(data, observer_inputs=[])))
+    assert result["should_continue"] is True
+
+def test_fork_runs_branches_concurrently_and_merges():
+    """測試分叉節點並行運行，並按聲明順序確定性地合併寫入"""
+    import asyncio
+    from flow import ForkMergeError
+
+    events = []
+
+    class WriteNode:
+        def __init__(self, name, delay, writes):
+            self.name, self.delay, self.writes = name, delay, writes
+
+        async def run_async(self, shared):
+            events.append(f"{self.name} 開始")
+            await asyncio.sleep(self.delay)
+            shared.update(self.writes)
+            events.append(f"{self.name} 結束")
+            return "default"
+
+    def build(conflict="error", merge=None):
+        flow = FlowRunner()
+        # 第一個分支較晚完成，驗證合併結果不受完成先後影響
+        flow.add_node("a", WriteNode("a", 0.03, {"moderator": "M", "note": "a"}))
+        flow.add_node("b", WriteNode("b", 0.01, {"agents": ["X"], "note": "b"}))
+        flow.add_fork("start", ["a", "b"], conflict=conflict, merge=merge)
+        flow.add_edge("start", "end", "default")
+        return flow
+
+    shared = asyncio.run(build(conflict="first").run_async({"question": "Q"}))
+    assert events[:2] == ["a 開始", "b 開始"]
+    assert shared["moderator"] == "M" and shared["agents"] == ["X"] and shared["note"] == "a"
+
+    shared = asyncio.run(build(conflict="last").run_async({"question": "Q"}))
+    assert shared["note"] == "b"
+
+    shared = asyncio.run(build(merge={"note": lambda values: "+".join(values)}).run_async({"question": "Q"}))
+    assert shared["note"] == "a+b"
+
+    # 未指定合併方式時衝突會使流程以錯誤結束
+    shared = asyncio.run(build().run_async({"question": "Q"}))
+    assert shared["status"] == "error" and "note" in shared["error"]
+    assert issubclass(ForkMergeError, ValueError)
+
 if __name__ == "__main__":
     test_node_inheritance()
     test_flow_creation()
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import batch
+
+def test_load_questions_formats(tmp_path):
+    """測試讀取 txt、jsonl 和 yaml 問題文件"""
+    txt = tmp_path / "questions.txt"
+    txt.write_text("# 註釋\n如何設計一個可靠的消息隊列？\n\n如何評估遠程辦公的效率？\n", encoding="utf-8")
+    entries = batch.load_questions(str(txt))
+    assert [e["question"] for e in entries] == ["如何設計一個可靠的消息隊列？", "如何評估遠程辦公的效率？"]
+    assert entries[0]["id"] == batch.question_id("如何設計一個可靠的消息隊列？")
+
+    jsonl = tmp_path / "questions.jsonl"
+    jsonl.write_text(
+        json.dumps({"id": "q1", "question": "問題一"}, ensure_ascii=False) + "\n"
+        + json.dumps("問題二", ensure_ascii=False) + "\n"
+        + "{損壞的行\n"
+        + json.dumps({"id": "q1", "question": "重複的編號"}, ensure_ascii=False) + "\n",
+        encoding="utf-8"
+    )
+    assert [(e["id"], e["question"]) for e in batch.load_questions(str(jsonl))] == [
+        ("q1", "問題一"), (batch.question_id("問題二"), "問題二")
+    ]
+
+    yml = tmp_path / "questions.yaml"
+    yml.write_text("questions:\n  - 問題甲\n  - id: b\n    question: 問題乙\n", encoding="utf-8")
+    assert [e["id"] for e in batch.load_questions(str(yml))] == [batch.question_id("問題甲"), "b"]
+
+def test_run_batch_resumes_and_reports(tmp_path, monkeypatch):
+    """測試並發上限、跳過已完成的問題並生成報告"""
+    in_flight = 0
+    peak = 0
+    ran = []
+
+    async def fake_run_question(entry, output_dir, timeout):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        ran.append(entry["id"])
+        status = "failed" if entry["id"] == "bad" else "completed"
+        usage = {"calls": 3, "prompt_tokens": 100, "completion_tokens": 50, "cost": None}
+        return {"id": entry["id"], "question": entry["question"], "status": status, "error": None,
+                "elapsed": 1.0, "rounds": 1, "record": None, "usage": usage}
+
+    monkeypatch.setattr(batch, "run_question", fake_run_question)
+    entries = [{"id": name, "question": f"問題 {name}"} for name in ("a", "b", "c", "bad")]
+
+    report = asyncio.run(batch.run_batch(entries, str(tmp_path), concurrency=2, timeout=10))
+    assert peak == 2
+    assert report["by_status"] == {"completed": 3, "failed": 1}
+    assert report["calls"] == 12
+    assert (tmp_path / "report.md").exists()
+
+    # 再次運行時只重跑未完成的問題，報告仍包含全部問題
+    ran.clear()
+    report = asyncio.run(batch.run_batch(entries, str(tmp_path), concurrency=2, timeout=10))
+    assert ran == ["bad"]
+    assert [r["id"] for r in report["results"]] == ["a", "b", "c", "bad"]
+
+    ran.clear()
+    asyncio.run(batch.run_batch(entries, str(tmp_path), concurrency=2, timeout=10, restart=True))
+    assert sorted(ran) == ["a", "b", "bad", "c"]
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_load_questions_formats(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
@@ -0,0 +1,77 @@
+import time
+import asyncio
+from types import SimpleNamespace
+from utils.cache import LLMCache, make_cache_key
+from utils.rate_limiter import RateLimiter
+
+def test_cache_key_depends_on_request():
+    """測試快取鍵只由請求內容決定"""
+    messages = [{"role": "user", "content": "你好"}]
+    key = make_cache_key("model-a", messages, 0.7, None)
+    assert key == make_cache_key("model-a", [{"role": "user", "content": "你好"}], 0.7, None)
+    assert key != make_cache_key("model-b", messages, 0.7, None)
+    assert key != make_cache_key("model-a", messages, 0.2, None)
+    assert key != make_cache_key("model-a", messages, 0.7, 1500)
+
+def test_cache_persists_and_evicts(tmp_path):
+    """測試磁碟快取持久化及按容量淘汰"""
+    path = str(tmp_path / "llm_cache.sqlite")
+    cache = LLMCache(path=path, memory_entries=2, max_bytes=30, ttl=3600)
+    for i in range(5):
+        cache.set(f"key{i}", "0123456789", "model-a")
+
+    # 容量只夠保留最近寫入的三條
+    reopened = LLMCache(path=path, ttl=3600)
+    assert reopened.get("key0") is None
+    assert reopened.get("key4") == "0123456789"
+
+def test_cache_expires(tmp_path):
+    """測試過期條目不會被返回"""
+    cache = LLMCache(path=str(tmp_path / "llm_cache.sqlite"), ttl=1)
+    cache.set("key", "value", "model-a")
+    assert cache.get("key") == "value"
+    time.sleep(1.1)
+    assert cache.get("key") is None
+
+def test_cache_stores_under_answering_model(tmp_path, monkeypatch):
+    """測試對沖請求由其他模型回答時，回應寫在回答模型的快取鍵下，不冒充原模型的回答"""
+    from utils import llm
+
+    class FakeStream:
+        def __init__(self, delay, text):
+            self.delay = delay
+            self.text = text
+
+        async def _chunks(self):
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.text))], usage=None)
+
+        def __aiter__(self):
+            return self._chunks()
+
+    async def create(model, **kwargs):
+        return FakeStream(1.0, "慢模型") if model == "slow/model" else FakeStream(0, "快模型")
+
+    cache = LLMCache(path=str(tmp_path / "llm_cache.sqlite"), ttl=3600)
+    monkeypatch.setattr(llm, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(llm, "get_llm_cache", lambda: cache)
+    monkeypatch.setattr(llm, "get_rate_limiter", lambda: RateLimiter(rpm=0, tpm=0, max_in_flight=4))
+    monkeypatch.setattr(llm, "_hedge_delay", lambda model: 0.05)
+    monkeypatch.setattr(llm, "_hedge_model", lambda model: "fast/model")
+
+    messages = [{"role": "user", "content": "問題"}]
+    response = asyncio.run(llm.call_llm_streaming(
+        messages, model="slow/model", retries=0, live_display=False, use_cache=True, hedge=True
+    ))
+    assert response == "快模型"
+    temperature = llm.TEMPERATURE
+    assert cache.get(make_cache_key("slow/model", messages, temperature, None)) is None
+    assert cache.get(make_cache_key("fast/model", messages, temperature, None)) == "快模型"
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_cache_key_depends_on_request()
+    test_cache_persists_and_evicts(Path(tempfile.mkdtemp()))
+    test_cache_expires(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
@@ -0,0 +1,82 @@
+import asyncio
+import tempfile
+import utils.checkpoint as checkpoint
+from flow import FlowRunner
+from utils.checkpoint import save_checkpoint, load_checkpoint, restore_shared, list_checkpoints
+
+class StepNode:
+    def __init__(self, name, runs):
+        self.name, self.runs = name, runs
+
+    async def run_async(self, shared):
+        self.runs.append(self.name)
+        shared.setdefault("steps", []).append(self.name)
+        return "default"
+
+def _build(runs, last=StepNode):
+    flow = FlowRunner()
+    flow.add_node("start", StepNode("start", runs))
+    flow.add_node("b", StepNode("b", runs))
+    flow.add_node("c", last("c", runs))
+    flow.add_edge("start", "b", "default")
+    flow.add_edge("b", "c", "default")
+    flow.add_edge("c", "end", "default")
+    return flow
+
+def test_save_load_and_restore(tmp_path):
+    """測試檢查點原子寫入、讀取，以及恢復時保留已有的 LLM 調用記錄"""
+    directory = str(tmp_path)
+    assert save_checkpoint({"question": "沒有會話編號"}, "a", directory) is None
+
+    shared = {"session_id": "s1", "question": "Q", "discussion_history": [{"round": 1}], "llm_calls": [{"id": 1}]}
+    save_checkpoint(shared, "discussion", directory)
+    saved = load_checkpoint("s1", directory)
+    assert saved["next_node"] == "discussion" and saved["round"] == 1
+    assert load_checkpoint("missing", directory) is None
+
+    # 失敗的嘗試產生了更多調用：恢復內容但不丟失這些調用
+    current = {"session_id": "s1", "question": "Q", "discussion_history": [{"round": 1}, {"round": 2}], "llm_calls": [{"id": 1}, {"id": 2}]}
+    calls = current["llm_calls"]
+    restore_shared(current, saved)
+    assert current["discussion_history"] == [{"round": 1}]
+    assert current["llm_calls"] is calls
+
+    assert [item["session_id"] for item in list_checkpoints(directory)] == ["s1"]
+
+def test_checkpoint_stores_agent_names(tmp_path):
+    """測試檢查點中的發言只保存專家名稱，讀取時還原為完整的專家信息"""
+    agent = {"name": "專家A", "background": "很長的背景介紹"}
+    history = [{"round_number": 1, "responses": [{"agent": agent, "content": "發言"}]}]
+    shared = {"session_id": "s3", "question": "Q", "agents": [agent], "discussion_history": history}
+    path = save_checkpoint(shared, "discussion", str(tmp_path))
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read().count("很長的背景介紹") == 1
+    assert shared["discussion_history"][0]["responses"][0]["agent"] is agent
+    assert load_checkpoint("s3", str(tmp_path))["shared"]["discussion_history"] == history
+
+def test_flow_resumes_from_checkpoint(tmp_path, monkeypatch):
+    """測試流程每完成一個節點保存檢查點，並能從記錄的下一個節點繼續"""
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_DIR", str(tmp_path))
+    runs = []
+
+    class FailingNode(StepNode):
+        async def run_async(self, shared):
+            raise RuntimeError("模擬中斷")
+
+    shared = asyncio.run(_build(runs, FailingNode).run_async({"session_id": "s2", "question": "Q"}))
+    assert shared["status"] == "error"
+    saved = load_checkpoint("s2")
+    assert saved["next_node"] == "c" and saved["shared"]["steps"] == ["start", "b"]
+
+    runs.clear()
+    shared = restore_shared({}, saved)
+    asyncio.run(_build(runs).run_async(shared, start=saved["next_node"]))
+    assert runs == ["c"]
+    assert shared["steps"] == ["start", "b", "c"]
+    assert load_checkpoint("s2")["next_node"] == "end"
+
+if __name__ == "__main__":
+    from pathlib import Path
+    test_save_load_and_restore(Path(tempfile.mkdtemp()))
+    test_checkpoint_stores_agent_names(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
@@ -0,0 +1,63 @@
+import asyncio
+
+from utils import context as context_module
+from utils.context import RollingContext, new_context_state
+
+def make_history(rounds, summary_length=100):
+    return [
+        {
+            "round_number": i + 1,
+            "opening": {"opening": f"第 {i + 1} 輪重點"},
+            "responses": [{"agent": {"name": "專家A"}, "content": "發言" * 50}],
+            "summary": {"summary": f"第{i + 1}輪" + "總" * summary_length}
+        }
+        for i in range(rounds)
+    ]
+
+def test_short_history_is_kept_verbatim():
+    """測試歷史未超出預算時不壓縮，原樣保留每輪總結"""
+    context = RollingContext(new_context_state(), recent_rounds=2, history_budget=2000)
+    history = make_history(3)
+    assert not context.needs_refresh(history)
+    text = context.history_text(history)
+    assert all(f"第 {i} 輪總結" in text for i in (1, 2, 3))
+
+def test_refresh_folds_only_new_rounds(monkeypatch):
+    """測試超出預算時只把新增的較早輪次折疊進摘要"""
+    prompts = []
+
+    async def fake_call_llm(messages, **kwargs):
+        prompts.append(messages[0]["content"])
+        return f"摘要{len(prompts)}"
+
+    monkeypatch.setattr(context_module, "call_llm", fake_call_llm)
+    state = new_context_state()
+    context = RollingContext(state, recent_rounds=2, history_budget=300)
+
+    asyncio.run(context.refresh(make_history(4), "問題"))
+    assert state == {"digest": "摘要1", "rounds": 2}
+    text = context.history_text(make_history(4))
+    assert text.startswith("第 1-2 輪討論摘要：摘要1")
+    assert "第 3 輪總結" in text and "第 1 輪總結" not in text
+
+    # 下一輪只折疊第 3 輪，並帶上已有摘要
+    asyncio.run(context.refresh(make_history(5), "問題"))
+    assert state["rounds"] == 3
+    assert "已有摘要：摘要1" in prompts[1]
+    assert "第 3 輪：" in prompts[1] and "第 2 輪：" not in prompts[1]
+
+def test_detailed_history_keeps_recent_responses():
+    """測試最終摘要的記錄在超出預算時只保留最近幾輪的專家發言"""
+    history = make_history(4)
+    full = RollingContext(new_context_state(), recent_rounds=2, history_budget=10000)
+    assert full.history_text(history, detailed=True).count("專家觀點") == 4
+
+    limited = RollingContext(new_context_state(), recent_rounds=2, history_budget=500)
+    text = limited.history_text(history, detailed=True)
+    assert text.count("專家觀點") == 2
+    assert "第 1 輪總結" in text
+
+if __name__ == "__main__":
+    test_short_history_is_kept_verbatim()
+    test_detailed_history_keeps_recent_responses()
+    print("所有測試通過！")
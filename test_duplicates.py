@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta
+from utils.duplicates import DuplicateFinder
+from utils.record_index import RecordIndex
+
+def _record(question, status="completed", days_ago=0, summary="之前的結論"):
+    timestamp = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d %H:%M:%S")
+    return {"question": question, "timestamp": timestamp, "status": status, "summary": summary}
+
+def test_finder_matches_recent_completed_records(tmp_path):
+    """測試只匹配足夠相似、已完成且未過期的討論，並能發現之後新增的記錄"""
+    index = RecordIndex(str(tmp_path / "index.sqlite3"))
+    finder = DuplicateFinder(index, directories=None)
+    index.add(str(tmp_path / "old.yaml"), _record("如何設計可靠的消息隊列系統？", days_ago=60, summary="過期的結論"))
+    index.add(str(tmp_path / "partial.yaml"), _record("如何設計可靠的消息隊列系統？", status="partial"))
+
+    question = "如何設計可靠的消息隊列系統"
+    assert finder.find(question, threshold=0.8, max_age_days=30) is None
+    assert finder.find(question, threshold=0.8, max_age_days=0)["summary"] == "過期的結論"
+
+    index.add(str(tmp_path / "new.yaml"), _record("如何設計可靠的消息隊列系統？", summary="最新的結論"))
+    found = finder.find(question, threshold=0.8, max_age_days=30)
+    assert found["summary"] == "最新的結論" and found["similarity"] >= 0.8
+    assert finder.find("微服務應該如何拆分？", threshold=0.8, max_age_days=30) is None
+
+    # 重新索引的記錄以新編號加入，舊編號被清理
+    index.add(str(tmp_path / "new.yaml"), _record("如何設計可靠的消息隊列系統？", summary="修改後的結論"))
+    assert finder.find(question, threshold=0.8, max_age_days=30)["summary"] == "修改後的結論"
+
+def test_duplicate_check_node_modes(monkeypatch):
+    """測試 reuse 模式直接使用之前的結論，ask 模式按確認結果決定"""
+    import nodes
+
+    record = {"id": 1, "path": "records/a.yaml", "question": "舊問題", "timestamp": "2026-01-01 00:00:00",
+              "status": "completed", "summary": "之前的結論", "similarity": 0.9}
+    monkeypatch.setattr(nodes, "find_duplicate_question", lambda question: dict(record))
+
+    shared = {"question": "新問題"}
+    assert asyncio.run(nodes.DuplicateCheckNode(mode="reuse").run_async(shared)) == "duplicate"
+    assert shared["summary"] == "之前的結論" and shared["status"] == "completed"
+    assert shared["reused_from"]["path"] == "records/a.yaml"
+
+    async def decline(found):
+        return False
+
+    shared = {"question": "新問題"}
+    assert asyncio.run(nodes.DuplicateCheckNode(mode="ask", confirm=decline).run_async(shared)) == "default"
+    assert "summary" not in shared
+    assert asyncio.run(nodes.DuplicateCheckNode(mode="ask").run_async(shared)) == "default"
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_finder_matches_recent_completed_records(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
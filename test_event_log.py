@@ -0,0 +1,77 @@
+import json
+import tempfile
+from utils.event_log import EventLog, use_event_log, reset_event_log, log_event, replay_event_log
+from utils.ledger import call_context
+from utils.progress import emit_progress
+
+AGENTS = [{"name": "甲"}, {"name": "乙"}]
+
+def _write_session(path, finish_round=True):
+    log = EventLog(path, chunk_chars=4)
+    token = use_event_log(log)
+    try:
+        log_event("session", session_id="s1", question="如何設計消息隊列？", timestamp="2026-01-01 00:00:00")
+        log_event("agents", agents=AGENTS)
+        with call_context(node="discussion", round=1):
+            log_event("turn", kind="opening", opening={"opening": "開場", "focus": "初始討論"})
+            # 並行發言按完成順序記錄
+            for name in ("乙", "甲"):
+                emit_progress("llm_start", label=f"專家 {name} 發言中")
+                for text in ("一", "二", "三", "四", "五"):
+                    emit_progress("token", label=f"專家 {name} 發言中", text=text)
+                emit_progress("llm_end", label=f"專家 {name} 發言中", status="ok", text="一二三四五")
+                log_event("turn", kind="response", response={"agent": {"name": name}, "content": "一二三四五"})
+            emit_progress("observer_input", text="請談談成本")
+            if finish_round:
+                log_event("round", round_data={"round_number": 1, "summary": {"summary": "總結"}})
+            else:
+                # 崩潰前正在進行的輸出
+                emit_progress("token", label="主持人總結第 1 輪討論", text="總結到一半")
+    finally:
+        reset_event_log(token)
+        log.close()
+
+def test_event_log_batches_tokens_and_replays(tmp_path):
+    """測試逐字輸出合併為 chunk 事件，並能從日誌重建討論記錄（恢復專家順序）"""
+    path = str(tmp_path / "s1.jsonl")
+    _write_session(path)
+
+    with open(path, "r", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    kinds = [event["event"] for event in events]
+    assert "token" not in kinds
+    assert [event["text"] for event in events if event["event"] == "chunk"] == ["一二三四", "五", "一二三四", "五"]
+    assert all("text" not in event for event in events if event["event"] == "llm_end")
+
+    shared = replay_event_log(path)
+    assert shared["question"] == "如何設計消息隊列？"
+    round_data = shared["discussion_history"][0]
+    assert round_data["opening"]["opening"] == "開場"
+    assert [response["agent"]["name"] for response in round_data["responses"]] == ["甲", "乙"]
+    assert round_data["summary"]["summary"] == "總結"
+    assert shared["observer_inputs"] == ["請談談成本"]
+    assert "partial_output" not in shared
+
+def test_replay_keeps_unfinished_round(tmp_path):
+    """測試中途崩潰時已完成的發言和未完成的輸出都能恢復，從檢查點繼續的輪次不重複"""
+    path = str(tmp_path / "s1.jsonl")
+    _write_session(path, finish_round=False)
+
+    shared = replay_event_log(path)
+    assert len(shared["discussion_history"]) == 1
+    assert len(shared["discussion_history"][0]["responses"]) == 2
+    assert shared["partial_output"] == {"主持人總結第 1 輪討論": "總結到一半"}
+
+    # 從檢查點重新開始第 1 輪，之前未完成的內容被丟棄
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"event": "resume", "round": 0, "next_node": "discussion"}) + "\n")
+        f.write('{"event": "turn", "kind"')  # 崩潰時寫了一半的行
+    shared = replay_event_log(path)
+    assert shared["discussion_history"] == []
+    assert "partial_output" not in shared
+
+if __name__ == "__main__":
+    from pathlib import Path
+    test_event_log_batches_tokens_and_replays(Path(tempfile.mkdtemp()))
+    test_replay_keeps_unfinished_round(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
@@ -0,0 +1,74 @@
+import time
+import asyncio
+from openai import AsyncOpenAI
+from utils import llm
+from utils.local_backend import LocalLLMBackend
+from utils.rate_limiter import RateLimiter
+
+MESSAGES = [{"role": "system", "content": "你是圓桌討論的專家"}, {"role": "user", "content": "請發表看法"}]
+
+# 主模型首字慢但開始輸出後仍在對沖請求輸出期間產生內容，對沖模型回應更短，兩者的輸出可以區分
+SCRIPT = {
+    "ttft": 0,
+    "tokens_per_second": 0,
+    "models": {
+        "slow/model": {"ttft": 0.4, "tokens_per_second": 50, "response_length": 30},
+        "fast/model": {"ttft": 0, "tokens_per_second": 20, "response_length": 12},
+        "broken/model": {"error_rate": 1.0, "error_status": 500}
+    }
+}
+
+def run_hedged(monkeypatch, model, hedge_delay):
+    """在替身後端上以對沖模式調用 call_llm_streaming，返回 (回應, 耗時, 各模型請求所在的任務)"""
+    attempt_tasks = {}
+
+    async def run():
+        backend = LocalLLMBackend(SCRIPT, seed=0)
+        await backend.start(port=0)
+        client = AsyncOpenAI(base_url=backend.base_url, api_key="local", max_retries=0)
+        create = client.chat.completions.create
+
+        async def tracked_create(**kwargs):
+            attempt_tasks[kwargs["model"]] = asyncio.current_task()
+            return await create(**kwargs)
+
+        monkeypatch.setattr(client.chat.completions, "create", tracked_create)
+        monkeypatch.setattr(llm, "client", client)
+        monkeypatch.setattr(llm, "get_rate_limiter", lambda: RateLimiter(rpm=0, tpm=0, max_in_flight=4))
+        monkeypatch.setattr(llm, "_hedge_delay", lambda model: hedge_delay)
+        monkeypatch.setattr(llm, "_hedge_model", lambda model: "fast/model")
+        try:
+            start = time.perf_counter()
+            response = await llm.call_llm_streaming(
+                MESSAGES, model=model, retries=0, ttft_timeout=5, total_timeout=5,
+                live_display=False, use_cache=False, hedge=True
+            )
+            elapsed = time.perf_counter() - start
+            # 讓落敗請求有機會在被取消前繼續輸出
+            await asyncio.sleep(0.3)
+            return response, elapsed
+        finally:
+            await client.close()
+            await backend.stop()
+
+    response, elapsed = asyncio.run(run())
+    return response, elapsed, attempt_tasks
+
+def test_hedge_fast_stream_wins_and_loser_is_cancelled(monkeypatch):
+    """測試主請求首字過慢時發出對沖請求，先出首字的請求勝出，落敗請求被取消且不混入輸出"""
+    response, elapsed, attempt_tasks = run_hedged(monkeypatch, "slow/model", 0.2)
+    expected = LocalLLMBackend(SCRIPT)
+    assert response == expected.render_response(MESSAGES, expected.settings_for("fast/model"))
+    # 對沖請求在 0.2 秒後發出，12 個字以每秒 20 個輸出約 0.6 秒
+    assert 0.7 <= elapsed < 1.5
+    assert set(attempt_tasks) == {"slow/model", "fast/model"}
+    assert attempt_tasks["slow/model"].cancelled()
+    assert not attempt_tasks["fast/model"].cancelled()
+
+def test_hedge_not_sent_after_early_failure(monkeypatch):
+    """測試主請求在對沖時間內出錯時立即結束等待，不再發出對沖請求"""
+    response, elapsed, attempt_tasks = run_hedged(monkeypatch, "broken/model", 3.0)
+    assert response.startswith(llm.LLM_FAILURE_PREFIX)
+    assert set(attempt_tasks) == {"broken/model"}
+    # 串流出錯後固定停留 2 秒顯示錯誤，不應再等滿 3 秒的對沖時間
+    assert elapsed < 2.8
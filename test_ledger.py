@@ -0,0 +1,83 @@
+import asyncio
+
+from utils import ledger
+from utils.ledger import use_ledger, reset_ledger, call_context, record_llm_call, summarize_usage
+
+def test_record_uses_call_context_and_prices(monkeypatch):
+    """測試調用記錄帶上節點、輪次和角色，並按價格估算成本"""
+    monkeypatch.setattr(ledger, "MODEL_PRICES", {"model-a": {"prompt": 1.0, "completion": 2.0}})
+    calls = []
+    token = use_ledger(calls)
+    try:
+        with call_context(node="discussion", round=1):
+            with call_context(role="agent", agent="專家A"):
+                record_llm_call("model-a", 1000, 500, 3.0, ttft=1.0, generation_time=2.0)
+            record_llm_call("model-b", 100, 50, 1.0)
+    finally:
+        reset_ledger(token)
+
+    assert calls[0]["node"] == "discussion" and calls[0]["round"] == 1 and calls[0]["agent"] == "專家A"
+    assert calls[0]["cost"] == 0.002
+    assert calls[0]["tokens_per_second"] == 250.0
+    assert "agent" not in calls[1] and calls[1]["cost"] is None
+
+    # 沒有啟用賬本時不記錄
+    assert record_llm_call("model-a", 1, 1, 0.1) is None
+
+def test_cached_prompt_tokens_priced_and_reported(monkeypatch):
+    """測試命中前綴快取的 token 按快取價格計算，並匯總命中率"""
+    monkeypatch.setattr(ledger, "MODEL_PRICES", {"model-a": {"prompt": 1.0, "cached_prompt": 0.1, "completion": 0.0}})
+    calls = []
+    token = use_ledger(calls)
+    try:
+        record_llm_call("model-a", 1000, 0, 1.0, cached_prompt_tokens=800)
+        record_llm_call("model-a", 1000, 0, 1.0)
+    finally:
+        reset_ledger(token)
+
+    assert calls[0]["cost"] == 0.00028
+    usage = summarize_usage(calls)
+    assert usage["total"]["cached_prompt_tokens"] == 800
+    assert usage["total"]["cache_hit_rate"] == 0.4
+
+def test_context_is_isolated_between_parallel_tasks():
+    """測試並行任務各自的角色標註互不影響"""
+    calls = []
+
+    async def turn(name):
+        with call_context(role="agent", agent=name):
+            await asyncio.sleep(0.01)
+            record_llm_call("model-a", 10, 10, 0.1)
+
+    async def run():
+        token = use_ledger(calls)
+        try:
+            with call_context(node="discussion", round=2):
+                await asyncio.gather(turn("專家A"), turn("專家B"))
+        finally:
+            reset_ledger(token)
+
+    asyncio.run(run())
+    assert sorted(c["agent"] for c in calls) == ["專家A", "專家B"]
+    assert all(c["round"] == 2 for c in calls)
+
+def test_summarize_usage_groups_by_node_and_round():
+    """測試按節點和輪次匯總"""
+    calls = [
+        {"node": "generate_agents", "model": "m", "prompt_tokens": 100, "completion_tokens": 200, "duration": 2.0, "ttft": 0.5, "retries": 0, "cost": 0.01},
+        {"node": "discussion", "round": 1, "model": "m", "prompt_tokens": 300, "completion_tokens": 100, "duration": 1.0, "ttft": 0.3, "retries": 1, "cost": 0.02},
+        {"node": "discussion", "round": 2, "model": "m", "prompt_tokens": 400, "completion_tokens": 100, "duration": 1.0, "ttft": None, "retries": 0, "cost": None}
+    ]
+    usage = summarize_usage(calls)
+    assert usage["total"]["calls"] == 3
+    assert usage["total"]["prompt_tokens"] == 800
+    assert usage["total"]["retries"] == 1
+    assert usage["total"]["cost"] == 0.03
+    assert usage["by_node"]["discussion"]["calls"] == 2
+    assert list(usage["by_round"]) == [1, 2]
+    assert usage["by_round"][2]["avg_ttft"] is None
+
+if __name__ == "__main__":
+    test_context_is_isolated_between_parallel_tasks()
+    test_summarize_usage_groups_by_node_and_round()
+    print("所有測試通過！")
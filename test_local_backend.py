@@ -0,0 +1,106 @@
+import asyncio
+import json
+import time
+from openai import AsyncOpenAI, RateLimitError
+from utils.local_backend import DEFAULT_MODERATOR, LocalLLMBackend
+
+MESSAGES = [{"role": "system", "content": "你是圓桌討論的專家"}, {"role": "user", "content": "請發表看法"}]
+
+def run_with_backend(script, scenario):
+    """在隨機端口啟動替身後端，用 OpenAI 客戶端運行 scenario(client, backend)"""
+    async def run():
+        backend = LocalLLMBackend(script, seed=0)
+        await backend.start(port=0)
+        client = AsyncOpenAI(base_url=backend.base_url, api_key="local", max_retries=0)
+        try:
+            return await scenario(client, backend)
+        finally:
+            await client.close()
+            await backend.stop()
+
+    return asyncio.run(run())
+
+def test_streaming_response_with_usage():
+    """測試串流回應逐塊返回內容，最後一塊附帶 token 用量"""
+    async def scenario(client, backend):
+        stream = await client.chat.completions.create(
+            model="local/stand-in", messages=MESSAGES, stream=True, stream_options={"include_usage": True}
+        )
+        parts, usage = [], None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return parts, usage, backend
+
+    parts, usage, backend = run_with_backend({"ttft": 0, "tokens_per_second": 0, "response_length": 40}, scenario)
+    assert len(parts) == 40 and len("".join(parts)) == 40
+    assert usage.completion_tokens == 40
+    assert backend.stats["streams"] == 1
+
+def test_non_streaming_scripted_response_and_prefix_cache():
+    """測試非串流回應按提示匹配預設內容，相同 system 前綴的第二次請求命中前綴快取"""
+    async def scenario(client, backend):
+        moderator = await client.chat.completions.create(
+            model="local/stand-in", messages=[{"role": "user", "content": "請生成一個會議主持人角色"}]
+        )
+        first = await client.chat.completions.create(model="local/stand-in", messages=MESSAGES)
+        second = await client.chat.completions.create(model="local/stand-in", messages=MESSAGES)
+        return moderator, first, second
+
+    moderator, first, second = run_with_backend({"ttft": 0, "tokens_per_second": 0}, scenario)
+    assert json.loads(moderator.choices[0].message.content) == DEFAULT_MODERATOR
+    assert first.usage.prompt_tokens_details.cached_tokens == 0
+    assert second.usage.prompt_tokens_details.cached_tokens > 0
+
+def test_injected_latency_and_rate_limit():
+    """測試按模型注入首字延遲和 429 錯誤（附帶 retry-after）"""
+    script = {
+        "ttft": 0,
+        "tokens_per_second": 0,
+        "models": {"slow/model": {"ttft": 0.3}, "limited/model": {"error_rate": 1.0, "error_status": 429}}
+    }
+
+    async def scenario(client, backend):
+        start = time.perf_counter()
+        await client.chat.completions.create(model="slow/model", messages=MESSAGES)
+        elapsed = time.perf_counter() - start
+        try:
+            await client.chat.completions.create(model="limited/model", messages=MESSAGES)
+        except RateLimitError as e:
+            error = e
+        else:
+            error = None
+        return elapsed, error, backend
+
+    elapsed, error, backend = run_with_backend(script, scenario)
+    assert elapsed >= 0.3
+    assert error is not None and error.status_code == 429
+    assert error.response.headers["retry-after"] == "1"
+    assert backend.stats["errors"] == 1
+
+def test_stop_with_request_in_flight():
+    """測試停止服務時仍在進行的請求被安靜地取消，不產生異常日誌"""
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        backend = LocalLLMBackend({"ttft": 5}, seed=0)
+        await backend.start(port=0)
+        client = AsyncOpenAI(base_url=backend.base_url, api_key="local", max_retries=0)
+        request = asyncio.create_task(client.chat.completions.create(model="local/stand-in", messages=MESSAGES, stream=True))
+        await asyncio.sleep(0.2)
+        await backend.stop()
+        request.cancel()
+        await client.close()
+
+    asyncio.run(run())
+    assert errors == []
+
+if __name__ == "__main__":
+    test_streaming_response_with_usage()
+    test_non_streaming_scripted_response_and_prefix_cache()
+    test_injected_latency_and_rate_limit()
+    test_stop_with_request_in_flight()
+    print("所有測試通過！")
@@ -75,5 +75,30 @@ def test_markdown_rendering():
     console.print(Markdown("## 張教授 (教育心理學)\n\n重要的是要考慮AI如何影響學生的社交發展和批判性思維能力。我們應該關注教育的整體目標，而不僅僅是知識傳遞的效率。"))
     console.print(Markdown("## 主持人總結\n\n本輪討論中，我們看到了AI在教育中的潛力和挑戰。專家們一致認為需要平衡技術與人文元素，確保AI輔助教育而非替代教師。"))
 
+def test_stream_renderer_parses_only_tail():
+    """測試串流渲染器合併刷新，且已完成的段落不會重新解析"""
+    from utils.render import StreamRenderer
+
+    class FakeLive:
+        def __init__(self):
+            self.updates = 0
+
+        def update(self, renderable):
+            self.updates += 1
+
+    live = FakeLive()
+    renderer = StreamRenderer(live, "測試", refresh_per_second=10)
+    text = "第一段\n\n```python\nprint(1)\n\nprint(2)\n```\n\n第二段\n\n尾部"
+    for char in text:
+        renderer.append(char)
+    renderer.flush()
+
+    # 連續追加的內容塊在同一刷新間隔內只渲染一次
+    assert live.updates < len(text)
+    assert renderer.text == text
+    # 代碼塊內的空行不會被當作段落邊界
+    assert text[renderer._stable_end:] == "尾部"
+
 if __name__ == "__main__":
-    test_markdown_rendering() 
\ No newline at end of file
+    test_markdown_rendering()
+    test_stream_renderer_parses_only_tail() 
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from utils.observer import ConsoleObserver, ObserverChannel, QueuedObserver, create_observer
+
+def test_console_observer_does_not_block_loop(monkeypatch):
+    """測試等待終端輸入時事件循環繼續運行，超時後自動繼續，遲到的輸入留給下一輪"""
+    def slow_input(prompt=""):
+        time.sleep(0.2)
+        return "  遲到的意見  "
+
+    monkeypatch.setattr("builtins.input", slow_input)
+    observer = ConsoleObserver(timeout=0.05)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        first = await observer.ask(1)
+        ticks_during_wait = ticks
+        await asyncio.sleep(0.25)
+        second = await observer.ask(2)
+        task.cancel()
+        return first, ticks_during_wait, second
+
+    first, ticks_during_wait, second = asyncio.run(run())
+    assert first is None
+    assert ticks_during_wait >= 3
+    assert second == "遲到的意見"
+
+def test_queued_observer_scripted_and_submitted():
+    """測試預設輸入按輪次使用，運行期間推送的輸入在等待時間內被接收"""
+    async def run():
+        observer = QueuedObserver(["第一輪意見", "", None], timeout=0.5)
+        answers = [await observer.ask(round_number) for round_number in (1, 2, 3)]
+
+        async def submit_later():
+            await asyncio.sleep(0.02)
+            observer.submit("推送的意見")
+
+        asyncio.create_task(submit_later())
+        answers.append(await observer.ask(4))
+
+        observer.timeout = 0
+        answers.append(await observer.ask(5))
+        return answers
+
+    assert asyncio.run(run()) == ["第一輪意見", None, None, "推送的意見", None]
+
+def test_create_observer_modes():
+    """測試根據模式和預設輸入創建通道"""
+    assert isinstance(create_observer("console"), ConsoleObserver)
+    assert isinstance(create_observer("headless"), QueuedObserver)
+    assert isinstance(create_observer("console", inputs=["意見"]), QueuedObserver)
+    assert asyncio.run(create_observer("headless").ask(1)) is None
+    assert asyncio.run(ObserverChannel().ask(1)) is None
+
+if __name__ == "__main__":
+    test_queued_observer_scripted_and_submitted()
+    test_create_observer_modes()
+    print("所有測試通過！")
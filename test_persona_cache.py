@@ -0,0 +1,71 @@
+import asyncio
+from utils.similarity import MinHashIndex, MinHasher, estimate_similarity, jaccard, shingles
+from utils.persona_cache import PersonaCache
+
+def test_minhash_estimates_similarity():
+    """測試 MinHash 估計值接近實際的 Jaccard 相似度，索引只返回相近的問題"""
+    a = "如何設計可靠的消息隊列系統？"
+    b = "如何設計一個可靠的消息隊列系統"
+    hasher = MinHasher()
+    assert abs(estimate_similarity(hasher.signature(a), hasher.signature(b)) - jaccard(shingles(a), shingles(b))) < 0.15
+    assert shingles("ＡＩ 會取代程序員嗎？") == shingles("ai會取代程序員嗎")
+
+    index = MinHashIndex()
+    index.add("queue", a)
+    index.add("microservice", "微服務應該如何拆分？")
+    matches = index.query(b, threshold=0.5)
+    assert [key for key, _ in matches] == ["queue"]
+    index.remove("queue")
+    assert index.query(b, threshold=0.5) == []
+
+def test_persona_cache_reuses_similar_questions(tmp_path):
+    """測試角色快取按相似度命中、持久化，並在同一問題重新生成時替換舊條目"""
+    path = str(tmp_path / "personas.sqlite")
+    cache = PersonaCache(path=path, ttl=0)
+    cache.store("moderator", "如何設計可靠的消息隊列系統？", {"name": "主持人甲"})
+    cache.store("agents", "如何設計可靠的消息隊列系統？", [{"name": "專家A"}, {"name": "專家B"}])
+
+    reopened = PersonaCache(path=path, ttl=0)
+    hit = reopened.lookup("moderator", "如何設計一個可靠的消息隊列系統", threshold=0.5)
+    assert hit["persona"] == {"name": "主持人甲"} and hit["question"] == "如何設計可靠的消息隊列系統？"
+    assert reopened.lookup("agents", "微服務應該如何拆分？", threshold=0.5) is None
+    assert reopened.lookup("moderator", "如何設計一個可靠的消息隊列系統", threshold=0.95) is None
+
+    reopened.store("moderator", "如何設計可靠的消息隊列系統？", {"name": "主持人乙"})
+    assert reopened.lookup("moderator", "如何設計可靠的消息隊列系統？")["persona"] == {"name": "主持人乙"}
+
+def test_generator_nodes_use_persona_cache(tmp_path, monkeypatch):
+    """測試生成節點命中快取時不調用 LLM，未命中時生成並寫入快取，關閉快取時總是生成"""
+    import nodes
+
+    calls = []
+
+    async def fake_structured(messages, schema, name, **kwargs):
+        calls.append(name)
+        if name == "moderator":
+            return {"name": "新主持人", "background": "b", "style": "s", "expertise": "e", "personality": "p"}
+        return {"experts": [{"name": "新專家", "expertise": "e"}]}
+
+    cache = PersonaCache(path=str(tmp_path / "personas.sqlite"), ttl=0)
+    monkeypatch.setattr(nodes, "call_llm_structured", fake_structured)
+    monkeypatch.setattr(nodes, "get_persona_cache", lambda: cache)
+
+    question = "如何設計可靠的消息隊列系統？"
+    moderator = asyncio.run(nodes.ModeratorGeneratorNode(use_cache=True).exec_async(question))
+    agents = asyncio.run(nodes.AgentGeneratorNode(use_cache=True).exec_async(question))
+    assert calls == ["moderator", "experts"]
+
+    similar = "如何設計一個可靠的消息隊列系統"
+    assert asyncio.run(nodes.ModeratorGeneratorNode(use_cache=True).exec_async(similar)) == moderator
+    assert asyncio.run(nodes.AgentGeneratorNode(use_cache=True).exec_async(similar)) == agents
+    assert calls == ["moderator", "experts"]
+
+    asyncio.run(nodes.ModeratorGeneratorNode(use_cache=False).exec_async(similar))
+    assert calls == ["moderator", "experts", "moderator"]
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_minhash_estimates_similarity()
+    test_persona_cache_reuses_similar_questions(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
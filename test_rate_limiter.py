@@ -0,0 +1,54 @@
+import asyncio
+import time
+from utils.rate_limiter import RateLimiter
+
+class FakeRateLimitError(Exception):
+    """模擬服務商返回的 429 錯誤"""
+    status_code = 429
+
+    class response:
+        headers = {"retry-after": "0.2"}
+
+def test_max_in_flight():
+    """測試同一模型的並發請求數不超過上限"""
+    limiter = RateLimiter(rpm=0, tpm=0, max_in_flight=2)
+    in_flight = 0
+    peak = 0
+
+    async def job():
+        nonlocal in_flight, peak
+        async with limiter.acquire("model-a"):
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+
+    async def run():
+        await asyncio.gather(*(job() for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+
+def test_rate_limit_slows_down_model():
+    """測試收到 429 後降低速率並按 retry-after 暫停"""
+    limiter = RateLimiter(rpm=60, tpm=0, max_in_flight=0)
+
+    async def run():
+        try:
+            async with limiter.acquire("model-a"):
+                raise FakeRateLimitError("Error code: 429")
+        except FakeRateLimitError:
+            pass
+        start = time.monotonic()
+        async with limiter.acquire("model-a"):
+            pass
+        return time.monotonic() - start
+
+    waited = asyncio.run(run())
+    assert waited >= 0.15
+    assert limiter.stats()["model-a"]["rate_limited"] == 1
+
+if __name__ == "__main__":
+    test_max_in_flight()
+    test_rate_limit_slows_down_model()
+    print("所有測試通過！")
@@ -0,0 +1,78 @@
+import os
+import yaml
+from utils.record_index import RecordIndex, record_documents
+
+def _record(question, agent_text, summary="最終結論"):
+    return {
+        "timestamp": "2026-01-01 00:00:00",
+        "question": question,
+        "moderator": {"name": "主持人", "background": "資深架構師"},
+        "agents": [{"name": "甲", "expertise": "分布式系統"}, {"name": "乙", "expertise": "成本控制"}],
+        "discussion_history": [{
+            "round_number": 1,
+            "opening": {"name": "主持人", "opening": "今天討論可靠性"},
+            "responses": [
+                {"agent": {"name": "甲"}, "content": agent_text},
+                {"agent": {"name": "乙"}, "content": "預算有限時先保證核心鏈路"}
+            ],
+            "summary": {"name": "主持人", "summary": "本輪聚焦於重試與冪等"}
+        }],
+        "observer_inputs": ["請談談成本", None],
+        "summary": summary,
+        "status": "completed"
+    }
+
+def test_record_documents_cover_all_parts():
+    """測試問題、角色設定、發言、每輪總結、觀察者輸入和最終結論都被索引"""
+    docs = record_documents(_record("如何設計可靠的消息隊列？", "至少一次投遞需要冪等消費"))
+    kinds = [doc["kind"] for doc in docs]
+    assert kinds == ["question", "persona", "persona", "persona", "opening", "turn", "turn", "round_summary", "observer", "summary"]
+    assert docs[5]["speaker"] == "甲" and docs[5]["round"] == 1
+
+def test_index_search_and_incremental_update(tmp_path):
+    """測試全文檢索（含少於三個字的詞）、按類型過濾以及重新索引同一文件"""
+    index = RecordIndex(str(tmp_path / "index.sqlite3"))
+    first = str(tmp_path / "a.yaml")
+    second = str(tmp_path / "b.yaml")
+    index.add(first, _record("如何設計可靠的消息隊列？", "至少一次投遞需要冪等消費"))
+    index.add(second, _record("微服務如何拆分？", "按業務邊界拆分服務"))
+
+    results = index.search("冪等消費")
+    assert [result["path"] for result in results] == [os.path.abspath(first)]
+    assert results[0]["matches"][0]["speaker"] == "甲"
+    assert "[冪等消費]" in results[0]["matches"][0]["snippet"]
+
+    # 兩個字的詞走 LIKE 過濾
+    assert {result["path"] for result in index.search("成本")} == {os.path.abspath(first), os.path.abspath(second)}
+    assert [result["path"] for result in index.search("拆分", kind="question")] == [os.path.abspath(second)]
+    assert index.search("冪等消費", kind="summary") == []
+
+    # 重新保存同一文件時替換舊的內容
+    index.add(second, _record("微服務如何拆分？", "先拆分讀寫再談冪等消費"))
+    assert len(index.search("冪等消費")) == 2
+    assert index.count() == 2
+
+def test_sync_only_parses_changed_files(tmp_path):
+    """測試同步目錄時只解析新增或修改過的文件，並清理已刪除文件的索引"""
+    records = tmp_path / "records"
+    records.mkdir()
+    path = records / "discussion_1.yaml"
+    path.write_text(yaml.dump(_record("如何設計可靠的消息隊列？", "冪等消費"), allow_unicode=True), encoding="utf-8")
+    (records / "report.yaml").write_text("not: a record\n", encoding="utf-8")
+
+    index = RecordIndex(str(tmp_path / "index.sqlite3"))
+    assert index.sync([str(records)]) == {"added": 1, "updated": 0, "removed": 0, "skipped": 1}
+    assert index.sync([str(records)])["added"] == 0
+    assert index.search("消息隊列")[0]["question"] == "如何設計可靠的消息隊列？"
+
+    os.remove(path)
+    assert index.sync([str(records)])["removed"] == 1
+    assert index.search("消息隊列") == []
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_record_documents_cover_all_parts()
+    test_index_search_and_incremental_update(Path(tempfile.mkdtemp()))
+    test_sync_only_parses_changed_files(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
@@ -0,0 +1,46 @@
+from utils.router import ModelRouter
+from utils.model_stats import ModelStats
+
+def make_router(**kwargs):
+    router = ModelRouter(models=["model-a", "model-b", "model-c"], **kwargs)
+    # 使用獨立的統計實例，避免受其他測試影響
+    router.stats = ModelStats()
+    return router
+
+def test_fastest_policy_prefers_low_latency():
+    """測試 fastest 策略選擇延遲最低的模型"""
+    router = make_router(policy="fastest")
+    router.stats.record_ttft("model-a", 3.0)
+    router.stats.record_ttft("model-b", 0.5)
+    router.stats.record_ttft("model-c", 1.0)
+    assert router.select() == "model-b"
+
+def test_circuit_breaker_excludes_failing_model():
+    """測試連續失敗的模型被暫時排除"""
+    router = make_router(policy="round_robin", threshold=2, cooldown=60)
+    router.record_failure("model-b")
+    router.record_failure("model-b")
+    assert not router.is_available("model-b")
+    assert "model-b" not in {router.select() for _ in range(6)}
+
+def test_sticky_policy_keeps_agent_on_same_model():
+    """測試 sticky 策略讓同一專家固定使用同一模型"""
+    router = make_router(policy="sticky")
+    first = router.select(key="專家A")
+    assert all(router.select(key="專家A") == first for _ in range(5))
+    assert router.select(key="專家B") != first
+
+def test_cheapest_policy_uses_prices():
+    """測試 cheapest 策略按價格選擇模型"""
+    router = make_router(policy="cheapest", prices={
+        "model-a": {"prompt": 3.0, "completion": 15.0},
+        "model-c": {"prompt": 0.1, "completion": 0.2}
+    })
+    assert router.select() == "model-c"
+
+if __name__ == "__main__":
+    test_fastest_policy_prefers_low_latency()
+    test_circuit_breaker_excludes_failing_model()
+    test_sticky_policy_keeps_agent_on_same_model()
+    test_cheapest_policy_uses_prices()
+    print("所有測試通過！")
@@ -0,0 +1,76 @@
+from utils.serialization import (
+    RECORD_SUFFIX, compact_rounds, dump_record, dump_yaml, export_yaml, iter_record, iter_rounds, load_record, load_yaml
+)
+from utils.record_index import RecordIndex
+
+AGENTS = [
+    {"name": "專家A", "expertise": "分佈式系統", "background": "架構師"},
+    {"name": "專家B", "expertise": "數據庫", "background": "DBA"}
+]
+
+def _record(rounds=3):
+    history = [
+        {
+            "round_number": number,
+            "opening": {"opening": f"第 {number} 輪開場", "focus": "重點"},
+            "responses": [{"agent": dict(agent), "content": f"{agent['name']} 第 {number} 輪發言"} for agent in AGENTS],
+            "summary": {"summary": f"第 {number} 輪總結"}
+        }
+        for number in range(1, rounds + 1)
+    ]
+    return {
+        "timestamp": "2026-01-01 00:00:00",
+        "question": "如何設計可靠的消息隊列？",
+        "moderator": {"name": "主持人"},
+        "agents": AGENTS,
+        "discussion_history": history,
+        "summary": "最終結論",
+        "status": "completed",
+        "usage": {"total": {"calls": 2}, "calls": [{"node": "discussion"}, {"node": "summary"}]}
+    }
+
+def test_record_round_trip_and_streaming(tmp_path):
+    """測試記錄文件只保存專家名稱、讀取時完整還原，並能逐輪讀取"""
+    record = _record()
+    path = dump_record(record, str(tmp_path / f"a{RECORD_SUFFIX}"))
+    assert load_record(path) == record
+    assert list(load_record(path)) == list(record)
+
+    # 發言中的專家只保存名稱；與專家列表不一致的專家信息原樣保留
+    lines = (tmp_path / f"a{RECORD_SUFFIX}").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 + 3 + 2 and "架構師" not in lines[1]
+    changed = dict(AGENTS[0], stance="臨時修改")
+    compacted = compact_rounds([{"responses": [{"agent": changed, "content": "x"}]}], AGENTS)
+    assert compacted[0]["responses"][0]["agent"] == changed
+
+    kinds = [kind for kind, _ in iter_record(path)]
+    assert kinds == ["record", "round", "round", "round", "call", "call"]
+    first = next(iter_rounds(path))
+    assert first["responses"][1]["agent"] == AGENTS[1]
+
+def test_yaml_export_and_load(tmp_path):
+    """測試 YAML 導出視圖與記錄內容一致，YAML 記錄也能逐輪讀取"""
+    record = _record(rounds=2)
+    path = dump_record(record, str(tmp_path / f"a{RECORD_SUFFIX}"))
+    yaml_path = export_yaml(path)
+    assert yaml_path == str(tmp_path / "a.yaml")
+    assert load_record(yaml_path) == record
+    assert [r["round_number"] for r in iter_rounds(yaml_path)] == [1, 2]
+    assert load_yaml(dump_yaml({"pair": (1, 2)})) == {"pair": [1, 2]}
+
+def test_index_sync_prefers_record_files(tmp_path):
+    """測試索引同步讀取記錄文件，並跳過同名的 YAML 導出視圖"""
+    records = tmp_path / "records"
+    records.mkdir()
+    export_yaml(dump_record(_record(), str(records / f"a{RECORD_SUFFIX}")))
+    index = RecordIndex(str(tmp_path / "index.sqlite3"))
+    assert index.sync([str(records)])["added"] == 1
+    assert index.search("可靠的消息隊列", kind="question")[0]["path"].endswith(RECORD_SUFFIX)
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_record_round_trip_and_streaming(Path(tempfile.mkdtemp()))
+    test_yaml_export_and_load(Path(tempfile.mkdtemp()))
+    test_index_sync_prefers_record_files(Path(tempfile.mkdtemp()))
+    print("所有測試通過！")
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import batch
+import server
+from utils.progress import emit_progress
+
+async def _request(port, method, path, payload=None, headers=None):
+    """發送一個 HTTP 請求，返回 (狀態碼, 響應體)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nhost: localhost\r\ncontent-length: {len(body)}\r\n"
+    head += "".join(f"{k}: {v}\r\n" for k, v in (headers or {}).items())
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split()[1]), rest.partition(b"\r\n\r\n")[2].decode("utf-8")
+
+def _parse_sse(text):
+    events = []
+    for block in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "data" in fields:
+            events.append((int(fields["id"]), json.loads(fields["data"])))
+    return events
+
+def test_service_streams_events_and_accepts_observer(tmp_path, monkeypatch):
+    """測試創建會話、SSE 推送逐字事件、提交觀察者意見以及斷線後從指定事件續傳"""
+    record_file = tmp_path / "discussion.record.jsonl"
+    record_file.write_text("{}\n", encoding="utf-8")
+
+    async def fake_run_question(entry, output_dir, timeout, observer=None):
+        for token in ("你", "好"):
+            emit_progress("token", label="專家 A 發言中", text=token)
+            await asyncio.sleep(0.01)
+        emit_progress("observer_prompt")
+        comment = await observer.ask(1)
+        emit_progress("observer_input", text=comment)
+        return {"id": entry["id"], "question": entry["question"], "status": "completed", "record": str(record_file)}
+
+    monkeypatch.setattr(batch, "run_question", fake_run_question)
+
+    async def run():
+        service = server.RoundtableService(observer_timeout=2)
+        await service.start(port=0)
+        port = service.server.sockets[0].getsockname()[1]
+        try:
+            status, body = await _request(port, "POST", "/sessions", {"question": "太短"})
+            assert status == 400
+
+            status, body = await _request(port, "POST", "/sessions", {"question": "如何設計一個可靠的消息隊列系統？"})
+            assert status == 201
+            session_id = json.loads(body)["id"]
+
+            stream = asyncio.create_task(_request(port, "GET", f"/sessions/{session_id}/events"))
+            await asyncio.sleep(0.1)
+            status, _ = await _request(port, "POST", f"/sessions/{session_id}/observer", {"text": "請談談成本"})
+            assert status == 202
+
+            status, body = await stream
+            events = _parse_sse(body)
+            names = [event["event"] for _, event in events]
+            assert names == ["token", "token", "observer_prompt", "observer_input", "session_end"]
+            assert events[3][1]["text"] == "請談談成本"
+            assert events[-1][1]["status"] == "completed"
+
+            # 帶上 Last-Event-ID 重新連接，只補發之後的事件
+            status, body = await _request(port, "GET", f"/sessions/{session_id}/events", headers={"last-event-id": "2"})
+            assert [event["event"] for _, event in _parse_sse(body)] == ["observer_input", "session_end"]
+            status, _ = await _request(port, "GET", f"/sessions/{session_id}/events", headers={"last-event-id": "abc"})
+            assert status == 400
+
+            # 記錄文件存在但沒有對應的 Markdown 文件
+            status, _ = await _request(port, "GET", f"/sessions/{session_id}/record?format=markdown")
+            assert status == 404
+
+            status, _ = await _request(port, "POST", f"/sessions/{session_id}/observer", {"text": "太晚了"})
+            assert status == 409
+            status, _ = await _request(port, "GET", "/sessions/unknown")
+            assert status == 404
+        finally:
+            await service.stop()
+
+    asyncio.run(run())
+
+def test_slow_subscriber_gets_coalesced_tokens():
+    """測試落後太多的訂閱者讀到合併後的 token 事件，內容不丟失"""
+    async def run():
+        session = server.Session("s1", "問題", observer=None)
+        for index in range(server.COALESCE_LAG + 50):
+            session.publish({"event": "token", "label": "主持人", "text": str(index % 10)})
+        session.finish({"status": "completed"})
+
+        received = [event async for _, event in session.subscribe()]
+        return received
+
+    received = asyncio.run(run())
+    assert received[-1]["event"] == "session_end"
+    text = "".join(event["text"] for event in received if event["event"] == "token")
+    assert text == "".join(str(index % 10) for index in range(server.COALESCE_LAG + 50))
+    assert len(received) < 10
+
+def test_finished_session_compacts_tokens():
+    """測試會話結束後合併連續的 token 事件，事件編號和續傳位置保持不變"""
+    async def run():
+        session = server.Session("s1", "問題", observer=None)
+        for text in ("一", "二", "三", "四", "五"):
+            session.publish({"event": "token", "label": "主持人", "text": text})
+        session.publish({"event": "llm_end", "label": "主持人"})
+        session.finish({"status": "completed"})
+
+        async def read(start):
+            return [(event_id, event) async for event_id, event in session.subscribe(start)]
+
+        return session, await read(0), await read(6), await read(2)
+
+    session, full, tail, middle = asyncio.run(run())
+    assert len(session.events) == 3
+    assert session.describe()["events"] == 7
+    assert [event_id for event_id, _ in full] == [4, 5, 6]
+    assert full[0][1]["text"] == "一二三四五"
+    assert [event["event"] for _, event in tail] == ["session_end"]
+    # 從合併範圍中間續傳時收到整段內容
+    assert [event_id for event_id, _ in middle] == [4, 5, 6]
+
+if __name__ == "__main__":
+    test_slow_subscriber_gets_coalesced_tokens()
+    test_finished_session_compacts_tokens()
+    print("所有測試通過！")
@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+from utils import llm, structured
+from utils.llm import LLM_FAILURE_PREFIX, UnsupportedParameterError
+from utils.structured import parse_structured, validate_schema, call_llm_structured
+from nodes import MODERATOR_SCHEMA, EXPERTS_SCHEMA
+
+MODERATOR_JSON = '{"name": "林主持", "background": "研究員", "style": "引導式", "expertise": "議題整合", "personality": "冷靜"}'
+
+def test_parse_accepts_wrapped_json():
+    """測試解析帶代碼塊或說明文字的 JSON"""
+    data, errors = parse_structured(f"```json\n{MODERATOR_JSON}\n```", MODERATOR_SCHEMA)
+    assert errors == []
+    assert data["name"] == "林主持"
+
+def test_validate_reports_field_paths():
+    """測試校驗錯誤指出具體字段"""
+    data = {"experts": [{"name": "A", "expertise": "x", "background": "x", "personality": "x", "stance": "", "style": "x"}]}
+    errors = validate_schema(data, EXPERTS_SCHEMA)
+    assert "$.experts 至少需要 2 項，實際 1 項" in errors
+    assert "$.experts[0].stance 不能為空" in errors
+    assert "$.experts[0].interaction 缺少必填字段" in errors
+
+def test_reask_once_with_errors(monkeypatch):
+    """測試校驗失敗時帶著錯誤重新詢問一次"""
+    replies = ['{"name": "林主持"}', MODERATOR_JSON]
+    requests = []
+
+    async def fake_streaming(messages, response_format=None, **kwargs):
+        requests.append((messages, response_format))
+        return replies.pop(0)
+
+    monkeypatch.setattr(structured, "call_llm_streaming", fake_streaming)
+    data = asyncio.run(call_llm_structured([{"role": "user", "content": "生成主持人"}], MODERATOR_SCHEMA, "moderator", mode="json_object"))
+
+    assert data["style"] == "引導式"
+    assert len(requests) == 2
+    assert requests[0][1] == {"type": "json_object"}
+    reask = requests[1][0][-1]["content"]
+    assert "$.background 缺少必填字段" in reask
+
+def test_give_up_after_one_reask(monkeypatch):
+    """測試重新詢問後仍失敗時返回 None"""
+    calls = []
+
+    async def fake_streaming(messages, response_format=None, **kwargs):
+        calls.append(messages)
+        return "不是 JSON"
+
+    monkeypatch.setattr(structured, "call_llm_streaming", fake_streaming)
+    data = asyncio.run(call_llm_structured([{"role": "user", "content": "生成主持人"}], MODERATOR_SCHEMA, "moderator", mode="off"))
+    assert data is None
+    assert len(calls) == 2
+
+def test_failure_does_not_disable_response_format(monkeypatch):
+    """測試超時等一般失敗只返回 None，之後的請求仍然帶上 response_format"""
+    requests = []
+
+    async def fake_streaming(messages, response_format=None, **kwargs):
+        requests.append(response_format)
+        return f"{LLM_FAILURE_PREFIX}。請稍後再試。錯誤: API 數據流超時" if len(requests) == 1 else MODERATOR_JSON
+
+    monkeypatch.setattr(structured, "call_llm_streaming", fake_streaming)
+    messages = [{"role": "user", "content": "生成主持人"}]
+    assert asyncio.run(call_llm_structured(messages, MODERATOR_SCHEMA, "moderator", mode="json_object")) is None
+    assert asyncio.run(call_llm_structured(messages, MODERATOR_SCHEMA, "moderator", mode="json_object"))["name"] == "林主持"
+    assert requests == [{"type": "json_object"}, {"type": "json_object"}]
+
+def test_unsupported_response_format_is_remembered_per_model(monkeypatch):
+    """測試模型以 400 拒絕 response_format 時拋出異常，之後只對該模型省略這個參數"""
+    class BadRequestError(Exception):
+        status_code = 400
+
+    requests = []
+
+    async def create(model, response_format=None, **kwargs):
+        requests.append((model, response_format))
+        if model == "plain/model" and response_format:
+            raise BadRequestError("Error code: 400 - response_format is not supported by this model")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=MODERATOR_JSON))], usage=None)
+
+    monkeypatch.setattr(llm, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(llm, "_response_format_unsupported", set())
+    messages = [{"role": "user", "content": "生成主持人"}]
+    json_object = {"type": "json_object"}
+
+    async def run():
+        try:
+            await llm.call_llm(messages, model="plain/model", use_cache=False, response_format=json_object)
+        except UnsupportedParameterError as e:
+            assert e.model == "plain/model"
+        else:
+            raise AssertionError("應拋出 UnsupportedParameterError")
+        await llm.call_llm(messages, model="plain/model", use_cache=False, response_format=json_object)
+        await llm.call_llm(messages, model="json/model", use_cache=False, response_format=json_object)
+
+    asyncio.run(run())
+    assert requests == [("plain/model", json_object), ("plain/model", None), ("json/model", json_object)]
+
+if __name__ == "__main__":
+    test_parse_accepts_wrapped_json()
+    test_validate_reports_field_paths()
+    print("所有測試通過！")
@@ -0,0 +1,44 @@
+import pytest
+
+from utils import tokens
+from utils.tokens import count_tokens, count_message_tokens, enforce_budget, register_tokenizer, PromptBudgetError
+
+def test_family_tokenizers_and_registration(monkeypatch):
+    """測試按模型系列選擇分詞器，並可註冊自定義分詞器"""
+    text = "人工智慧" * 100
+    assert count_tokens(text, "deepseek/deepseek-chat-v3-0324") < count_tokens(text, "unknown/model")
+
+    # 在註冊表的副本上註冊，測試結束後自動還原，不影響其他測試
+    monkeypatch.setattr(tokens, "_tokenizers", dict(tokens._tokenizers))
+    monkeypatch.setattr(tokens, "_lazy_tokenizers", dict(tokens._lazy_tokenizers))
+    register_tokenizer("custom/", lambda text: 7)
+    assert count_tokens("任意內容", "custom/model-a") == 7
+    assert count_message_tokens([{"role": "user", "content": "x"}], "custom/model-a") == 7 + tokens.MESSAGE_OVERHEAD + tokens.REPLY_OVERHEAD
+
+def test_trim_keeps_head_and_tail(monkeypatch):
+    """測試提示超出預算時截斷中間部分，保留開頭和結尾"""
+    monkeypatch.setattr(tokens, "PROMPT_TOKEN_BUDGET", 200)
+    content = "開頭指示" + "歷史" * 500 + "結尾要求"
+    messages, _ = enforce_budget("unknown/model", [{"role": "user", "content": content}], policy="trim")
+
+    assert count_message_tokens(messages, "unknown/model") <= 200
+    assert messages[0]["content"].startswith("開頭指示")
+    assert messages[0]["content"].endswith("結尾要求")
+    assert "省略" in messages[0]["content"]
+
+def test_reject_before_sending(monkeypatch):
+    """測試 reject 策略在發出請求前拒絕超出預算的提示"""
+    monkeypatch.setattr(tokens, "PROMPT_TOKEN_BUDGET", 50)
+    with pytest.raises(PromptBudgetError):
+        enforce_budget("unknown/model", [{"role": "user", "content": "字" * 500}], policy="reject")
+
+def test_completion_fits_remaining_context(monkeypatch):
+    """測試回應上限不超過上下文剩餘空間和回應預算"""
+    monkeypatch.setattr(tokens, "MODEL_CONTEXT_LIMITS", {"small/model": 1000})
+    messages = [{"role": "user", "content": "字" * 800}]
+    _, max_tokens = enforce_budget("small/model", messages, max_tokens=1500)
+    assert max_tokens == 1000 - count_message_tokens(messages, "small/model")
+
+    monkeypatch.setattr(tokens, "COMPLETION_TOKEN_BUDGET", 100)
+    _, max_tokens = enforce_budget("small/model", [{"role": "user", "content": "你好"}])
+    assert max_tokens == 100
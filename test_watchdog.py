@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+from utils.watchdog import StreamWatchdog
+from utils.rate_limiter import RateLimiter
+
+def run_watchdog(deadlines, chunk_delays):
+    """按給定間隔送入內容塊，返回看門狗的超時原因"""
+    async def run():
+        task = None
+
+        async def consume():
+            for delay in chunk_delays:
+                await asyncio.sleep(delay)
+                watchdog.feed()
+
+        watchdog = StreamWatchdog(deadlines, on_expire=lambda: task.cancel())
+        task = asyncio.create_task(consume())
+        watchdog.start()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            watchdog.stop()
+        return watchdog.expired_reason
+
+    return asyncio.run(run())
+
+def test_watchdog_detects_slow_first_token():
+    """測試首字過慢時觸發 ttft 期限"""
+    assert run_watchdog({"ttft": 0.1, "gap": 1.0, "total": 5.0}, [0.5]) == "ttft"
+
+def test_watchdog_detects_stall_between_chunks():
+    """測試中途停頓時觸發 gap 期限"""
+    assert run_watchdog({"ttft": 1.0, "gap": 0.1, "total": 5.0}, [0.01, 0.01, 0.5]) == "gap"
+
+def test_watchdog_detects_total_duration():
+    """測試持續有內容但總時長過長時觸發 total 期限"""
+    assert run_watchdog({"ttft": 1.0, "gap": 1.0, "total": 0.2}, [0.05] * 10) == "total"
+
+def test_watchdog_allows_healthy_stream():
+    """測試正常串流不會觸發期限"""
+    assert run_watchdog({"ttft": 1.0, "gap": 1.0, "total": 5.0}, [0.01] * 5) is None
+
+def test_queue_wait_does_not_count_towards_deadlines(monkeypatch):
+    """測試限流器名額已滿時，排隊等待的時間不計入首字和總時長期限"""
+    from utils import llm
+
+    class FakeStream:
+        async def _chunks(self):
+            await asyncio.sleep(0.3)
+            for text in ("排隊", "完成"):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+        def __aiter__(self):
+            return self._chunks()
+
+    async def create(**kwargs):
+        return FakeStream()
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    limiter = RateLimiter(rpm=0, tpm=0, max_in_flight=1)
+    monkeypatch.setattr(llm, "client", fake_client)
+    monkeypatch.setattr(llm, "get_rate_limiter", lambda: limiter)
+
+    async def run():
+        # 每個請求佔用名額 0.3 秒，第三個請求要排隊 0.6 秒，超過 0.5 秒的首字期限
+        return await asyncio.gather(*(
+            llm.call_llm_streaming(
+                [{"role": "user", "content": "問題"}], model="fake/model", retries=0, idle_timeout=0.5,
+                ttft_timeout=0.5, total_timeout=0.5, live_display=False, use_cache=False, hedge=False
+            )
+            for _ in range(3)
+        ))
+
+    assert asyncio.run(run()) == ["排隊完成"] * 3
+
+if __name__ == "__main__":
+    test_watchdog_detects_slow_first_token()
+    test_watchdog_detects_stall_between_chunks()
+    test_watchdog_detects_total_duration()
+    test_watchdog_allows_healthy_stream()
+    print("所有測試通過！")
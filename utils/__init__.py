@@ -1,7 +1,36 @@
 """
 AI Roundtable Utils
+
+常用函數在首次訪問時才從子模組載入，只用到序列化、索引等工具時不會初始化 LLM 客戶端
 """
 
-from utils.llm import call_llm, call_llm_streaming, get_next_model
-from utils.yaml_utils import yaml_safe_load
-from utils.record import save_discussion_record, print_summary 
\ No newline at end of file
+import importlib
+
+_EXPORTS = {
+    "utils.llm": ("call_llm", "call_llm_streaming", "get_next_model"),
+    "utils.structured": ("call_llm_structured",),
+    "utils.cache": ("LLMCache", "get_llm_cache"),
+    "utils.rate_limiter": ("RateLimiter", "get_rate_limiter"),
+    "utils.router": ("ModelRouter", "get_router"),
+    "utils.ledger": ("call_context", "summarize_usage"),
+    "utils.tokens": ("count_tokens", "register_tokenizer", "PromptBudgetError"),
+    "utils.observer": ("create_observer", "QueuedObserver"),
+    "utils.checkpoint": ("save_checkpoint", "load_checkpoint"),
+    "utils.event_log": ("log_event", "replay_event_log"),
+    "utils.yaml_utils": ("yaml_safe_load",),
+    "utils.serialization": ("load_record", "iter_rounds", "export_yaml"),
+    "utils.record": ("save_discussion_record", "render_event_log", "print_summary"),
+    "utils.record_index": ("RecordIndex", "search_records"),
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module 'utils' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,187 @@
+"""
+LLM 回應快取（內存 LRU + SQLite 磁碟快取）
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from utils.config import (
+    LLM_CACHE,
+    LLM_CACHE_PATH,
+    LLM_CACHE_MEMORY_ENTRIES,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_TTL
+)
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: Optional[int],
+    response_format: Optional[Dict] = None
+) -> str:
+    """根據請求內容生成快取鍵"""
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    # 只在指定時加入，保持普通請求的快取鍵不變
+    if response_format is not None:
+        request["response_format"] = response_format
+    payload = json.dumps(request, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """兩級 LLM 回應快取：內存 LRU 在前，SQLite 在後，支持按容量和時間淘汰"""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        ttl: int = LLM_CACHE_TTL
+    ):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # 磁碟快取不可用時只使用內存快取
+            print(f"警告: 無法打開 LLM 磁碟快取 {path}: {str(e)}")
+            self._conn = None
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """讀取快取，未命中或已過期時返回 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    return response
+                del self._memory[key]
+
+            if self._conn is None:
+                return None
+
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                response, created_at = row
+                if self._expired(created_at):
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    return None
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 讀取 LLM 快取失敗: {str(e)}")
+                return None
+
+            self._remember(key, response, created_at)
+            return response
+
+    def set(self, key: str, response: str, model: Optional[str] = None) -> None:
+        """寫入快取並執行淘汰"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, len(response.encode("utf-8")), now, now)
+                )
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 寫入 LLM 快取失敗: {str(e)}")
+
+    def _evict(self) -> None:
+        """刪除過期條目，並在超出容量時按最近訪問時間淘汰"""
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at ASC").fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale_keys)
+        for (key,) in stale_keys:
+            self._memory.pop(key, None)
+
+    def clear(self) -> None:
+        """清空所有快取"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM llm_cache")
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"警告: 清空 LLM 快取失敗: {str(e)}")
+
+# 進程內共享的快取實例，首次使用時創建
+_llm_cache = None
+
+def get_llm_cache() -> LLMCache:
+    """獲取共享的 LLM 快取實例"""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache()
+    return _llm_cache
+
+def cache_enabled(use_cache: Optional[bool] = None) -> bool:
+    """判斷本次調用是否使用快取，use_cache 為 None 時跟隨 LLM_CACHE 設置"""
+    return LLM_CACHE if use_cache is None else use_cache
@@ -0,0 +1,101 @@
+"""
+檢查點：每完成一個節點（包括每一輪討論）後保存 shared 和下一個節點，失敗或中斷後從最後完成的步驟繼續
+"""
+
+import os
+import json
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from utils.config import CHECKPOINTS, CHECKPOINT_DIR
+from utils.serialization import compact_rounds, expand_rounds
+
+def new_session_id() -> str:
+    """生成會話編號，同時用作檢查點文件名"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+def checkpoint_path(session_id: str, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or CHECKPOINT_DIR, f"{session_id}.json")
+
+def checkpoints_enabled(shared: Dict) -> bool:
+    """只有帶 session_id 的會話保存檢查點"""
+    return CHECKPOINTS and bool(shared.get("session_id"))
+
+def save_checkpoint(shared: Dict, next_node: str, directory: Optional[str] = None) -> Optional[str]:
+    """保存檢查點，先寫臨時文件再替換，中途崩潰不會留下損壞的檢查點；返回文件路徑
+
+    每輪都會保存一次，發言中的專家信息只保存名稱（讀取時還原），避免檢查點隨輪數成倍增大。
+    """
+    if not checkpoints_enabled(shared):
+        return None
+    path = checkpoint_path(shared["session_id"], directory)
+    if shared.get("discussion_history"):
+        shared = dict(shared, discussion_history=compact_rounds(shared["discussion_history"], shared.get("agents")))
+    checkpoint = {
+        "session_id": shared["session_id"],
+        "next_node": next_node,
+        "round": len(shared.get("discussion_history") or []),
+        "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "shared": shared
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False, separators=(",", ":"), default=str)
+        os.replace(temp_path, path)
+        return path
+    except Exception as e:
+        # 檢查點只是保險，保存失敗不影響討論
+        print(f"保存檢查點失敗: {str(e)}")
+        return None
+
+def load_checkpoint(session_id: str, directory: Optional[str] = None) -> Optional[Dict]:
+    """讀取檢查點，不存在或損壞時返回 None"""
+    path = checkpoint_path(session_id, directory)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"讀取檢查點失敗: {str(e)}")
+        return None
+    saved = checkpoint["shared"]
+    if saved.get("discussion_history"):
+        saved["discussion_history"] = expand_rounds(saved["discussion_history"], saved.get("agents"))
+    return checkpoint
+
+def restore_shared(shared: Dict, checkpoint: Dict) -> Dict:
+    """用檢查點中的數據替換 shared 的內容
+
+    失敗嘗試中已經發生的 LLM 調用仍然計入賬本：shared 中已有調用記錄時保留當前的列表。
+    """
+    calls = shared.get("llm_calls")
+    shared.clear()
+    shared.update(checkpoint["shared"])
+    if calls is not None and len(calls) >= len(shared.get("llm_calls") or []):
+        shared["llm_calls"] = calls
+    shared.setdefault("llm_calls", [])
+    return shared
+
+def list_checkpoints(directory: Optional[str] = None) -> List[Dict]:
+    """列出檢查點（最新的在前），只包含會話編號、問題、輪次和下一個節點"""
+    directory = directory or CHECKPOINT_DIR
+    if not os.path.isdir(directory):
+        return []
+    items = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        checkpoint = load_checkpoint(name[:-5], directory)
+        if checkpoint:
+            items.append({
+                "session_id": checkpoint["session_id"],
+                "question": checkpoint["shared"].get("question"),
+                "round": checkpoint["round"],
+                "next_node": checkpoint["next_node"],
+                "saved_at": checkpoint["saved_at"]
+            })
+    return sorted(items, key=lambda item: item["saved_at"], reverse=True)
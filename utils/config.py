@@ -3,6 +3,7 @@
 """
 
 import os
+import json
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
@@ -11,16 +12,55 @@ load_dotenv()
 
 # 獲取環境變數
 API_KEY = os.getenv("OPENROUTER_API_KEY")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")  # 可指向本地替身後端（utils/local_backend.py）
+USING_OPENROUTER = "openrouter.ai" in LLM_BASE_URL
 TIMEOUT = int(os.getenv("TIMEOUT", "900"))  # 默認900秒
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))  # 默認0.7
+PARALLEL_SETUP = os.getenv("PARALLEL_SETUP", "false").lower() in ("1", "true", "yes")  # 並行生成主持人和專家（關閉兩者的 Live 面板），默認關閉
+PARALLEL_ROUND = os.getenv("PARALLEL_ROUND", "false").lower() in ("1", "true", "yes")  # 同一輪專家並行發言，默認關閉
+MAX_CONCURRENT_AGENTS = int(os.getenv("MAX_CONCURRENT_AGENTS", "3"))  # 並行發言的最大並發數
+LIVE_DISPLAY = os.getenv("LIVE_DISPLAY", "true").lower() in ("1", "true", "yes")  # 是否顯示串流 Live 面板，多會話並行時應關閉
+OBSERVER_MODE = os.getenv("OBSERVER_MODE", "console")  # console（終端輸入）或 headless（無人值守，始終沒有觀察者意見）
+OBSERVER_TIMEOUT = float(os.getenv("OBSERVER_TIMEOUT", "0"))  # 等待觀察者輸入的秒數，超時自動繼續；0 表示一直等待
+OBSERVER_SCRIPT = os.getenv("OBSERVER_SCRIPT", "")  # 預設觀察者輸入文件（每行或每項對應一輪），設置後不再從終端讀取
+SPECULATIVE_FOCUS = os.getenv("SPECULATIVE_FOCUS", "false").lower() in ("1", "true", "yes")  # 本輪總結後提前生成下一輪討論重點，默認關閉
+FUSED_ROUND_EVALUATION = os.getenv("FUSED_ROUND_EVALUATION", "false").lower() in ("1", "true", "yes")  # 本輪總結和評估合併為一次 JSON 輸出的調用，默認關閉
 
-if not API_KEY:
+# LLM 回應快取設置（默認關閉）
+LLM_CACHE = os.getenv("LLM_CACHE", "false").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite")
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))  # 內存 LRU 最大條目數
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))  # 磁碟快取最大容量，默認 100MB
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # 快取有效期（秒），默認 7 天
+
+# 角色快取（默認關閉）：問題與之前的問題足夠相似時重用當時生成的主持人和專家
+PERSONA_CACHE = os.getenv("PERSONA_CACHE", "false").lower() in ("1", "true", "yes")
+PERSONA_CACHE_PATH = os.getenv("PERSONA_CACHE_PATH", "cache/personas.sqlite")
+PERSONA_CACHE_THRESHOLD = float(os.getenv("PERSONA_CACHE_THRESHOLD", "0.6"))  # 問題字符二元組的 Jaccard 相似度（MinHash 估計）下限
+PERSONA_CACHE_TTL = int(os.getenv("PERSONA_CACHE_TTL", str(30 * 24 * 3600)))  # 有效期（秒），默認 30 天，0 表示不過期
+PERSONA_CACHE_ADAPT = os.getenv("PERSONA_CACHE_ADAPT", "false").lower() in ("1", "true", "yes")  # 重用時按新問題微調角色（多一次調用）
+
+# 請求限流設置（按模型計算，0 表示不限制）
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "60"))  # 每分鐘請求數
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "0"))  # 每分鐘 token 數
+RATE_LIMIT_MAX_IN_FLIGHT = int(os.getenv("RATE_LIMIT_MAX_IN_FLIGHT", "8"))  # 同一模型的最大並發請求數
+# 單個模型的覆蓋設置，JSON 格式，例如 {"deepseek/deepseek-chat-v3-0324": {"rpm": 30, "max_in_flight": 4}}
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}") or "{}")
+
+# 對沖請求設置（默認關閉）：首字延遲超過最近 TTFT 的指定百分位時發出重複請求
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))  # 最短等待時間（秒）
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8.0"))  # 樣本不足時的等待時間（秒）
+HEDGE_NEXT_MODEL = os.getenv("HEDGE_NEXT_MODEL", "true").lower() in ("1", "true", "yes")  # 對沖請求是否發往下一個模型
+
+if not API_KEY and USING_OPENROUTER:
     print("警告: 未設置 OPENROUTER_API_KEY 環境變數")
 
 # 初始化 OpenAI 客戶端（使用異步版本）
 client = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=API_KEY,
+    base_url=LLM_BASE_URL,
+    api_key=API_KEY if USING_OPENROUTER else (API_KEY or "local-backend"),
     timeout=TIMEOUT
 )
 
@@ -32,5 +72,56 @@ AVAILABLE_MODELS = [
     "deepseek/deepseek-chat-v3-0324"
 ]
 
-# 模型輪詢計數器
-model_counter = 0 
\ No newline at end of file
+# 串流看門狗設置：期限根據模型的歷史統計自動調整，並以 idle_timeout 為上限
+WATCHDOG_TTFT_FACTOR = float(os.getenv("WATCHDOG_TTFT_FACTOR", "3"))  # 首字期限 = 觀察到的 p95 TTFT × 係數
+WATCHDOG_GAP_FACTOR = float(os.getenv("WATCHDOG_GAP_FACTOR", "3"))  # 間隔期限 = 觀察到的 p95 最大間隔 × 係數
+WATCHDOG_MIN_TTFT = float(os.getenv("WATCHDOG_MIN_TTFT", "5"))  # 首字期限下限（秒）
+WATCHDOG_MIN_GAP = float(os.getenv("WATCHDOG_MIN_GAP", "2"))  # 間隔期限下限（秒）
+WATCHDOG_TOTAL_TIMEOUT = float(os.getenv("WATCHDOG_TOTAL_TIMEOUT", "300"))  # 單次串流總時長上限（秒）
+
+# 模型路由設置
+ROUTING_POLICY = os.getenv("ROUTING_POLICY", "round_robin")  # round_robin、fastest、cheapest、sticky
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "3"))  # 連續失敗多少次後暫停使用模型
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "60"))  # 暫停時長（秒）
+ROUTER_HEALTH_PROBE = os.getenv("ROUTER_HEALTH_PROBE", "true").lower() in ("1", "true", "yes")  # 啟動時並行探測模型
+# 模型價格（美元 / 百萬 token），JSON 格式，例如 {"deepseek/deepseek-chat-v3-0324": {"prompt": 0.27, "cached_prompt": 0.07, "completion": 1.1}}
+# cached_prompt 為命中前綴快取的輸入價格（可選）
+MODEL_PRICES = json.loads(os.getenv("MODEL_PRICES", "{}") or "{}")
+
+# 提示預算：發出請求前在本地估算 token 數，超出模型上下文或預算時按策略處理
+MODEL_CONTEXT_LIMITS = json.loads(os.getenv("MODEL_CONTEXT_LIMITS", "{}") or "{}")  # 按模型設置上下文長度（JSON）
+DEFAULT_CONTEXT_LIMIT = int(os.getenv("DEFAULT_CONTEXT_LIMIT", "65536"))  # 未知模型的上下文長度
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))  # 單次請求提示的 token 上限，0 表示只受上下文長度限制
+COMPLETION_TOKEN_BUDGET = int(os.getenv("COMPLETION_TOKEN_BUDGET", "0"))  # 單次請求回應的 token 上限，0 表示不限制
+TOKEN_BUDGET_POLICY = os.getenv("TOKEN_BUDGET_POLICY", "trim")  # trim（裁剪）、reject（拒絕）或 off（不檢查）
+
+# 討論上下文壓縮：最近幾輪保留原文，歷史超出預算時把更早的輪次折疊為摘要
+CONTEXT_RECENT_ROUNDS = int(os.getenv("CONTEXT_RECENT_ROUNDS", "2"))  # 保留原文的最近輪數
+CONTEXT_HISTORY_TOKENS = int(os.getenv("CONTEXT_HISTORY_TOKENS", "2000"))  # 提示中討論歷史的 token 預算
+CONTEXT_DIGEST_TOKENS = int(os.getenv("CONTEXT_DIGEST_TOKENS", "500"))  # 壓縮摘要的長度上限
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "6000"))  # 最終摘要提示中討論記錄（含專家發言）的 token 預算
+
+# 檢查點：每完成一個節點（每輪討論）保存一次，失敗重試和 --resume 從最後完成的步驟繼續
+CHECKPOINTS = os.getenv("CHECKPOINTS", "true").lower() in ("1", "true", "yes")
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "cache/checkpoints")
+
+# 事件日誌：討論過程逐條追加到 JSONL 文件，由後台線程寫入並批量 fsync，YAML / Markdown 記錄從日誌生成
+EVENT_LOG = os.getenv("EVENT_LOG", "true").lower() in ("1", "true", "yes")
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "records/events")
+EVENT_LOG_FSYNC_INTERVAL = float(os.getenv("EVENT_LOG_FSYNC_INTERVAL", "1.0"))  # 兩次 fsync 之間的最長秒數
+EVENT_LOG_CHUNK_CHARS = int(os.getenv("EVENT_LOG_CHUNK_CHARS", "200"))  # 逐字輸出累積到多少字符寫入一條 chunk 事件
+
+# 討論記錄全文索引（SQLite FTS5），保存記錄時增量更新
+RECORD_INDEX = os.getenv("RECORD_INDEX", "true").lower() in ("1", "true", "yes")
+RECORD_INDEX_PATH = os.getenv("RECORD_INDEX_PATH", "cache/record_index.sqlite3")
+
+# 討論記錄保存為緊湊的 JSON Lines 記錄文件（*.record.jsonl），開啟時另外導出 YAML 閱讀視圖
+RECORD_YAML_EXPORT = os.getenv("RECORD_YAML_EXPORT", "false").lower() in ("1", "true", "yes")
+
+# 重複問題：新問題與已完成的討論幾乎相同時提供之前的結論（off 關閉、ask 詢問是否使用、reuse 直接使用）
+DUPLICATE_MODE = os.getenv("DUPLICATE_MODE", "off")
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.85"))  # 問題字符二元組的 Jaccard 相似度（MinHash 估計）下限
+DUPLICATE_MAX_AGE_DAYS = float(os.getenv("DUPLICATE_MAX_AGE_DAYS", "30"))  # 只使用這麼多天內完成的討論，0 表示不限
+
+# 結構化輸出模式（主持人、專家生成）：json_schema、json_object 或 off（只在提示中要求 JSON）
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "json_object")
@@ -0,0 +1,123 @@
+"""
+討論上下文管理：最近幾輪保留原文，更早的輪次增量折疊為一份壓縮摘要，使提示長度不隨輪次無限增長
+"""
+
+from typing import Dict, List, Optional
+
+from utils.config import CONTEXT_RECENT_ROUNDS, CONTEXT_HISTORY_TOKENS, CONTEXT_DIGEST_TOKENS
+from utils.llm import call_llm, LLM_FAILURE_PREFIX
+from utils.ledger import call_context
+from utils.tokens import count_tokens
+
+def new_context_state() -> Dict:
+    """創建上下文狀態（保存在 shared["context_digest"] 中）"""
+    return {"digest": "", "rounds": 0}
+
+def _round_summary(round_data: Dict) -> str:
+    return (round_data.get("summary") or {}).get("summary", "無總結")
+
+def _round_detail(round_data: Dict, round_number: int, observer_input: Optional[str] = None) -> str:
+    """單輪的完整記錄：討論重點、專家發言、本輪總結和觀察者輸入"""
+    lines = [f"\n第 {round_number} 輪討論："]
+    if round_data.get("opening"):
+        lines.append(f"討論重點：{round_data['opening'].get('opening', '未提供')}")
+    if round_data.get("responses"):
+        lines.append("專家觀點：")
+        for response in round_data["responses"]:
+            lines.append(f"- {response['agent']['name']}：{response['content']}")
+    if round_data.get("summary"):
+        lines.append(f"本輪總結：{_round_summary(round_data)}")
+    if observer_input:
+        lines.append(f"觀察者輸入：{observer_input}")
+    return "\n".join(lines) + "\n"
+
+class RollingContext:
+    """按 token 預算維護討論歷史
+
+    前 state["rounds"] 輪已經折疊進 state["digest"]；其餘輪次中，最近 recent_rounds 輪保留原文，
+    之間的輪次只保留本輪總結。歷史超出預算時，refresh() 把超出最近窗口的輪次折疊進摘要。
+    """
+
+    def __init__(
+        self,
+        state: Dict,
+        recent_rounds: int = CONTEXT_RECENT_ROUNDS,
+        history_budget: int = CONTEXT_HISTORY_TOKENS,
+        digest_budget: int = CONTEXT_DIGEST_TOKENS
+    ):
+        self.state = state
+        self.recent_rounds = max(1, recent_rounds)
+        self.history_budget = history_budget
+        self.digest_budget = digest_budget
+
+    def history_text(self, history: List[Dict], detailed: bool = False, observer_inputs: Optional[List] = None) -> str:
+        """生成放入提示的討論歷史
+
+        detailed 為 True 時包含專家發言原文：未折疊的輪次全部放得下就全部保留，否則只保留最近幾輪。
+        """
+        folded = min(self.state["rounds"], len(history))
+        if detailed:
+            text = self._render(history, folded, folded, observer_inputs)
+            if count_tokens(text) <= self.history_budget:
+                return text
+        recent_start = max(folded, len(history) - self.recent_rounds) if detailed else len(history)
+        return self._render(history, folded, recent_start, observer_inputs)
+
+    def _render(self, history: List[Dict], folded: int, detail_start: int, observer_inputs: Optional[List]) -> str:
+        parts = []
+        if self.state["digest"] and folded:
+            parts.append(f"第 1-{folded} 輪討論摘要：{self.state['digest']}\n")
+
+        for index in range(folded, len(history)):
+            round_data = history[index]
+            if index >= detail_start:
+                observer_input = observer_inputs[index] if observer_inputs and index < len(observer_inputs) else None
+                parts.append(_round_detail(round_data, index + 1, observer_input))
+            else:
+                parts.append(f"第 {index + 1} 輪總結：{_round_summary(round_data)}\n")
+        return "".join(parts)
+
+    def needs_refresh(self, history: List[Dict], detailed: bool = False) -> bool:
+        """歷史超出預算且有可折疊的輪次時需要刷新"""
+        foldable = len(history) - self.recent_rounds - self.state["rounds"]
+        if foldable <= 0:
+            return False
+        return count_tokens(self.history_text(history, detailed)) > self.history_budget
+
+    async def refresh(self, history: List[Dict], question: str, detailed: bool = False) -> None:
+        """把超出最近窗口的輪次增量折疊進摘要，只處理上次刷新之後新增的輪次"""
+        if not self.needs_refresh(history, detailed):
+            return
+
+        fold_until = len(history) - self.recent_rounds
+        new_rounds = "\n".join(
+            f"第 {index + 1} 輪：{_round_summary(history[index])}"
+            for index in range(self.state["rounds"], fold_until)
+        )
+        prompt = f"""
+        你是一位討論記錄員。請把「已有摘要」和「新增輪次總結」合併成一份新的討論摘要，
+        保留各專家的核心觀點、已達成的共識和尚存的分歧，刪去重複內容。
+
+        討論問題：{question}
+
+        已有摘要：{self.state['digest'] or '（無）'}
+
+        新增輪次總結：
+        {new_rounds}
+
+        摘要不超過 {self.digest_budget} 字，直接輸出摘要內容，無需使用引號或特殊格式。
+        """
+
+        print(f"正在壓縮第 1-{fold_until} 輪的討論歷史...")
+        with call_context(role="context"):
+            digest = await call_llm(
+                [{"role": "user", "content": prompt}],
+                max_tokens=self.digest_budget * 2
+            )
+
+        if not digest or digest.startswith(LLM_FAILURE_PREFIX):
+            # 壓縮失敗時退回截斷，保證提示不超出預算
+            digest = f"{self.state['digest']}\n{new_rounds}".strip()[-self.digest_budget:]
+
+        self.state["digest"] = digest.strip()
+        self.state["rounds"] = fold_until
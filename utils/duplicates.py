@@ -0,0 +1,72 @@
+"""
+重複問題檢測：在已完成的討論記錄中查找與新問題幾乎相同的問題，以便直接提供之前的結論
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from utils.config import DUPLICATE_THRESHOLD, DUPLICATE_MAX_AGE_DAYS
+from utils.record_index import RecordIndex, get_record_index
+from utils.similarity import MinHashIndex
+
+DUPLICATE_MODES = ("off", "ask", "reuse")
+
+class DuplicateFinder:
+    """基於記錄索引的近似重複問題查找
+
+    只把已完成且有最終結論的記錄的問題放入內存中的 MinHash 索引；每次查找前增量同步記錄目錄，
+    並只為新增的記錄計算簽名。
+    """
+
+    def __init__(self, index: Optional[RecordIndex] = None, directories: Optional[Iterable[str]] = ("records",)):
+        self.index = index or get_record_index()
+        self.directories = list(directories) if directories else []
+        self._questions = MinHashIndex()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """把上次之後加入記錄索引的已完成記錄加入相似度索引"""
+        if self.directories:
+            self.index.sync(self.directories)
+        for record in self.index.records_after(self._last_id):
+            self._last_id = record["id"]
+            if record["status"] == "completed" and record["question"]:
+                self._questions.add(record["id"], record["question"])
+
+    def find(self, question: str, threshold: float = DUPLICATE_THRESHOLD, max_age_days: float = DUPLICATE_MAX_AGE_DAYS) -> Optional[Dict]:
+        """返回最相近的已完成記錄 {"id", "path", "question", "timestamp", "status", "summary", "similarity"}
+
+        只考慮相似度不低於 threshold、且在 max_age_days 天內（0 表示不限）完成的記錄。
+        """
+        with self._lock:
+            self.refresh()
+            cutoff = None
+            if max_age_days and max_age_days > 0:
+                cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+            for record_id, similarity in self._questions.query(question, threshold):
+                record = self.index.get(record_id)
+                if record is None:
+                    # 記錄已被刪除或重新索引（重新索引的記錄會以新編號加入）
+                    self._questions.remove(record_id)
+                    continue
+                if not record["summary"] or (cutoff and record["timestamp"] < cutoff):
+                    continue
+                record["similarity"] = similarity
+                return record
+        return None
+
+# 進程內共享的查找器，首次使用時創建
+_duplicate_finder = None
+
+def get_duplicate_finder() -> DuplicateFinder:
+    global _duplicate_finder
+    if _duplicate_finder is None:
+        _duplicate_finder = DuplicateFinder()
+    return _duplicate_finder
+
+def find_duplicate_question(question: str, threshold: float = DUPLICATE_THRESHOLD, max_age_days: float = DUPLICATE_MAX_AGE_DAYS) -> Optional[Dict]:
+    """在 records 目錄的已完成討論中查找與 question 近似重複的問題"""
+    return get_duplicate_finder().find(question, threshold, max_age_days)
@@ -0,0 +1,230 @@
+"""
+事件日誌：把討論過程（節點切換、每個發言、逐字輸出片段、LLM 調用等）逐條追加到 JSONL 文件
+
+寫入由後台線程完成並批量 fsync，不阻塞事件循環；程式中途崩潰時已寫入的事件不會丟失。
+YAML / Markdown 記錄在需要時由 replay_event_log 重建數據後生成。
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import contextvars
+from typing import Dict, Optional
+
+from utils.config import EVENT_LOG, EVENT_LOG_DIR, EVENT_LOG_FSYNC_INTERVAL, EVENT_LOG_CHUNK_CHARS
+from utils.ledger import current_call_context
+
+# 累積多少條事件後即使未到時間間隔也執行 fsync
+FSYNC_EVENTS = 100
+
+_STOP = object()
+
+# 當前會話的事件日誌，未設置時不記錄任何事件
+_event_log = contextvars.ContextVar("event_log", default=None)
+
+def event_log_path(session_id: str, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or EVENT_LOG_DIR, f"{session_id}.jsonl")
+
+class EventLog:
+    """只追加的 JSONL 事件日誌
+
+    append() 只把事件放入隊列；後台線程寫入文件，隊列清空時把數據交給操作系統，
+    每 fsync_interval 秒或每 FSYNC_EVENTS 條事件 fsync 一次。逐字輸出按調用標籤累積成 chunk 事件，
+    避免每個 token 一行。append=False 時清空已有的日誌（重新運行同一個問題）。
+    """
+
+    def __init__(self, path: str, append: bool = True, fsync_interval: Optional[float] = None, chunk_chars: Optional[int] = None):
+        self.path = path
+        self.fsync_interval = EVENT_LOG_FSYNC_INTERVAL if fsync_interval is None else fsync_interval
+        self.chunk_chars = EVENT_LOG_CHUNK_CHARS if chunk_chars is None else chunk_chars
+        self.closed = False
+        self._chunks = {}
+        self._queue = queue.Queue()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+        self._thread = threading.Thread(target=self._write_loop, name="event-log", daemon=True)
+        self._thread.start()
+        # 程式退出前寫完隊列中剩餘的事件
+        atexit.register(self.close)
+
+    def append(self, event: Dict) -> None:
+        """追加一個事件（線程安全，不阻塞）"""
+        if self.closed:
+            return
+        if event["event"] == "token":
+            self._add_token(event)
+            return
+        if event["event"] in ("llm_start", "llm_end"):
+            self._flush_chunks(event.get("label"))
+            # 完整輸出由發言事件記錄，這裡不重複保存
+            event = {key: value for key, value in event.items() if key != "text"}
+        self._queue.put(event)
+
+    def _add_token(self, event: Dict) -> None:
+        label = event.get("label")
+        buffered = self._chunks.get(label)
+        if buffered is None:
+            buffered = self._chunks[label] = {key: value for key, value in event.items() if key != "text"}
+            buffered["text"] = ""
+        buffered["text"] += event.get("text") or ""
+        if len(buffered["text"]) >= self.chunk_chars:
+            self._flush_chunks(label)
+
+    def _flush_chunks(self, label=None) -> None:
+        """把累積的逐字輸出寫成 chunk 事件，label 為 None 時寫出全部"""
+        labels = list(self._chunks) if label is None else [label]
+        for key in labels:
+            buffered = self._chunks.pop(key, None)
+            if buffered and buffered["text"]:
+                self._queue.put(dict(buffered, event="chunk"))
+
+    def _write_loop(self) -> None:
+        pending = 0
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.fsync_interval or None)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            try:
+                if item is not None:
+                    self._file.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                    pending += 1
+                if pending and self._queue.empty():
+                    # 進程崩潰時已交給操作系統的數據不會丟失
+                    self._file.flush()
+                if pending and (pending >= FSYNC_EVENTS or time.monotonic() - last_sync >= self.fsync_interval):
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    pending = 0
+                    last_sync = time.monotonic()
+            except Exception as e:
+                # 事件日誌只是記錄，寫入失敗不影響討論
+                print(f"寫入事件日誌失敗: {str(e)}")
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+    def close(self) -> None:
+        """寫出剩餘的事件並關閉文件，可重複調用"""
+        if self.closed:
+            return
+        self._flush_chunks()
+        self.closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+def use_event_log(log: Optional[EventLog]) -> contextvars.Token:
+    """把此後（包括其中創建的任務）的事件寫入 log，返回用於恢復的 token"""
+    return _event_log.set(log)
+
+def reset_event_log(token: contextvars.Token) -> None:
+    _event_log.reset(token)
+
+def current_event_log() -> Optional[EventLog]:
+    return _event_log.get()
+
+def open_event_log(path: str, append: bool = True) -> Optional[EventLog]:
+    """創建事件日誌並在當前上下文中啟用，EVENT_LOG 關閉時返回 None"""
+    if not EVENT_LOG:
+        return None
+    log = EventLog(path, append=append)
+    use_event_log(log)
+    return log
+
+def log_event(event: str, **data) -> None:
+    """記錄一個事件，自動帶上當前調用的歸屬信息（節點、輪次、角色等）"""
+    log = _event_log.get()
+    if log is None:
+        return
+    log.append({"event": event, "time": round(time.time(), 3), **current_call_context(), **data})
+
+def _agent_order(agents):
+    names = [agent.get("name") for agent in agents or [] if isinstance(agent, dict)]
+
+    def key(response):
+        name = (response.get("agent") or {}).get("name")
+        return names.index(name) if name in names else len(names)
+
+    return key
+
+def replay_event_log(path: str) -> Dict:
+    """逐行讀取事件日誌，重建生成記錄所需的數據（與 shared 的結構相同）
+
+    只有發言沒有輪次結束事件的輪次（中途崩潰）也會保留；未完成的逐字輸出放在 partial_output 中。
+    """
+    shared = {"discussion_history": [], "observer_inputs": [], "summary": None, "llm_calls": []}
+    current = None  # 尚未結束的輪次
+    partial = {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 崩潰時最後一行可能不完整
+            kind = event.get("event")
+            history = shared["discussion_history"]
+
+            if kind == "session":
+                shared.update({key: event[key] for key in ("session_id", "question", "timestamp") if key in event})
+            elif kind == "resume":
+                # 從檢查點繼續：之後的輪次重新進行
+                del history[event.get("round", len(history)):]
+                current = None
+                partial.clear()
+            elif kind in ("moderator", "agents", "summary"):
+                shared[kind] = event[kind]
+            elif kind == "duplicate":
+                shared["reused_from"] = event["reused_from"]
+            elif kind == "status":
+                shared.update({key: event[key] for key in ("status", "error", "total_time") if key in event})
+            elif kind == "llm_call":
+                shared["llm_calls"].append(event["call"])
+            elif kind == "turn":
+                round_number = event.get("round")
+                if event["kind"] == "opening" or current is None or current["round_number"] != round_number:
+                    current = {"round_number": round_number, "opening": None, "responses": []}
+                if event["kind"] == "opening":
+                    current["opening"] = event["opening"]
+                else:
+                    current["responses"].append(event["response"])
+            elif kind == "round":
+                round_data = event["round_data"]
+                if current and current["round_number"] == round_data.get("round_number"):
+                    # 並行發言按完成順序記錄，這裡恢復專家順序
+                    current["responses"].sort(key=_agent_order(shared.get("agents")))
+                    round_data = {**current, **round_data}
+                del history[round_data.get("round_number", len(history) + 1) - 1:]
+                history.append(round_data)
+                current = None
+            elif kind == "observer_input" and event.get("round"):
+                inputs = shared["observer_inputs"]
+                while len(inputs) < event["round"]:
+                    inputs.append(None)
+                inputs[event["round"] - 1] = event.get("text")
+            elif kind == "chunk":
+                partial[event.get("label")] = partial.get(event.get("label"), "") + event.get("text", "")
+            elif kind == "llm_end":
+                partial.pop(event.get("label"), None)
+
+    if current:
+        current["responses"].sort(key=_agent_order(shared.get("agents")))
+        shared["discussion_history"].append(current)
+    if partial:
+        shared["partial_output"] = {str(label): text for label, text in partial.items()}
+    return shared
@@ -0,0 +1,132 @@
+"""
+LLM 調用賬本：記錄每次調用的 token 用量、延遲、重試次數和估算成本
+"""
+
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from utils.config import MODEL_PRICES
+
+# 當前會話的調用記錄列表（保存在 shared["llm_calls"] 中）
+_current_calls = contextvars.ContextVar("llm_calls", default=None)
+
+# 當前調用的歸屬信息，例如節點、角色、輪次
+_call_context = contextvars.ContextVar("llm_call_context", default={})
+
+def use_ledger(calls: List[Dict]) -> contextvars.Token:
+    """將調用記錄寫入指定列表，返回用於恢復的 token"""
+    return _current_calls.set(calls)
+
+def reset_ledger(token: contextvars.Token) -> None:
+    """恢復之前的調用記錄列表"""
+    _current_calls.reset(token)
+
+@contextmanager
+def call_context(**fields):
+    """在此範圍內的 LLM 調用都會帶上給定的歸屬信息（node、role、round、agent 等）"""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+def current_call_context() -> Dict:
+    """當前調用的歸屬信息"""
+    return dict(_call_context.get())
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> Optional[float]:
+    """按 MODEL_PRICES（美元 / 百萬 token）估算成本，未配置價格時返回 None
+
+    命中前綴快取的 prompt token 按 cached_prompt 價格計算，未配置時按 prompt 價格計算。
+    """
+    price = MODEL_PRICES.get(model)
+    if not price:
+        return None
+    prompt_price = price.get("prompt", 0.0)
+    cached_price = price.get("cached_prompt", prompt_price)
+    return (
+        (prompt_tokens - cached_prompt_tokens) * prompt_price
+        + cached_prompt_tokens * cached_price
+        + completion_tokens * price.get("completion", 0.0)
+    ) / 1_000_000
+
+def record_llm_call(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    duration: float,
+    ttft: Optional[float] = None,
+    generation_time: Optional[float] = None,
+    retries: int = 0,
+    cached_prompt_tokens: int = 0,
+    usage_estimated: bool = False,
+    cached: bool = False,
+    status: str = "ok",
+    label: Optional[str] = None
+) -> Optional[Dict]:
+    """記錄一次 LLM 調用；當前沒有啟用賬本時不做任何事
+
+    duration 為整次調用（含重試）的耗時，generation_time 為成功那次請求的生成耗時，用於計算生成速度。
+    """
+    calls = _current_calls.get()
+    if calls is None:
+        return None
+
+    cost = 0.0 if cached else estimate_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens)
+    entry = dict(_call_context.get())
+    if label:
+        entry["label"] = label
+    entry.update({
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "ttft": round(ttft, 3) if ttft is not None else None,
+        "duration": round(duration, 3),
+        "tokens_per_second": round(completion_tokens / generation_time, 1) if generation_time and completion_tokens else None,
+        "retries": retries,
+        "cost": round(cost, 6) if cost is not None else None,
+        "usage_estimated": usage_estimated,
+        "cached": cached,
+        "status": status
+    })
+    calls.append(entry)
+
+    # 事件日誌依賴本模塊的調用歸屬信息，在此處導入以避免循環導入
+    from utils.event_log import log_event
+    log_event("llm_call", call=entry)
+    return entry
+
+def _aggregate(calls: List[Dict]) -> Dict:
+    ttfts = [c["ttft"] for c in calls if c.get("ttft") is not None]
+    costs = [c["cost"] for c in calls if c.get("cost") is not None]
+    prompt_tokens = sum(c.get("prompt_tokens", 0) for c in calls)
+    cached_prompt_tokens = sum(c.get("cached_prompt_tokens", 0) for c in calls)
+    return {
+        "calls": len(calls),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(c.get("completion_tokens", 0) for c in calls),
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "cache_hit_rate": round(cached_prompt_tokens / prompt_tokens, 3) if prompt_tokens else None,
+        "duration": round(sum(c.get("duration", 0.0) for c in calls), 2),
+        "avg_ttft": round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+        "retries": sum(c.get("retries", 0) for c in calls),
+        "cost": round(sum(costs), 6) if costs else None
+    }
+
+def summarize_usage(calls: List[Dict]) -> Dict:
+    """按節點、輪次和模型匯總調用記錄"""
+    by_node, by_round, by_model = {}, {}, {}
+    for call in calls:
+        by_node.setdefault(call.get("node", "unknown"), []).append(call)
+        if call.get("round") is not None:
+            by_round.setdefault(call["round"], []).append(call)
+        by_model.setdefault(call.get("model", "unknown"), []).append(call)
+
+    return {
+        "total": _aggregate(calls),
+        "by_node": {node: _aggregate(items) for node, items in by_node.items()},
+        "by_round": {round_number: _aggregate(items) for round_number, items in sorted(by_round.items())},
+        "by_model": {model: _aggregate(items) for model, items in by_model.items()}
+    }
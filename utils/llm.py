@@ -11,42 +11,189 @@ from rich.panel import Panel
 from rich.markdown import Markdown
 from rich.text import Text
 
-from utils.config import client, AVAILABLE_MODELS, TEMPERATURE, model_counter
+from utils.config import (
+    client,
+    AVAILABLE_MODELS,
+    TEMPERATURE,
+    LIVE_DISPLAY,
+    HEDGE_REQUESTS,
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_DELAY,
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_NEXT_MODEL
+)
+from utils.cache import get_llm_cache, make_cache_key, cache_enabled
+from utils.rate_limiter import get_rate_limiter, estimate_request_tokens, is_rate_limit_error
+from utils.model_stats import get_model_stats
+from utils.router import get_router
+from utils.render import StreamRenderer, LIVE_REFRESH_PER_SECOND
+from utils.watchdog import StreamWatchdog, stream_deadlines
+from utils.ledger import record_llm_call
+from utils.progress import emit_progress
+from utils.tokens import enforce_budget, count_message_tokens, count_tokens
 
-def get_next_model() -> str:
-    """輪詢選擇下一個模型"""
-    global model_counter
-    model = AVAILABLE_MODELS[model_counter]
-    model_counter = (model_counter + 1) % len(AVAILABLE_MODELS)
+# 重試耗盡時返回的應急回應前綴，調用方可據此判斷調用失敗
+LLM_FAILURE_PREFIX = "無法從 AI 模型獲取有效回應"
+
+# 拒絕過 response_format 的模型，本進程內不再對它們發送該參數
+_response_format_unsupported = set()
+
+class UnsupportedParameterError(Exception):
+    """模型拒絕了請求中的 response_format 參數，重試沒有意義；之後對該模型的請求不再帶上這個參數"""
+
+    def __init__(self, model: str, message: str):
+        super().__init__(f"模型 {model} 不接受 response_format：{message}")
+        self.model = model
+
+def is_unsupported_parameter_error(error: Exception) -> bool:
+    """判斷異常是否為服務商因不支持請求參數返回的 400 錯誤"""
+    message = str(error).lower()
+    if getattr(error, "status_code", None) not in (400, 422) and "error code: 400" not in message:
+        return False
+    return any(word in message for word in ("response_format", "json_schema", "json_object", "unsupported", "not supported"))
+
+def _unsupported_parameter(model: str, error: Exception) -> UnsupportedParameterError:
+    """記錄模型不支持 response_format，返回應拋給調用方的異常"""
+    _response_format_unsupported.add(model)
+    return UnsupportedParameterError(model, str(error))
+
+def _supported_response_format(model: str, response_format: Optional[Dict]) -> Optional[Dict]:
+    return None if model in _response_format_unsupported else response_format
+
+class _SilentLive:
+    """不輸出任何內容的 Live 替代品，供多個串流並行時使用（Rich 同一時間只允許一個 Live）"""
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def update(self, *args, **kwargs):
+        pass
+
+def get_next_model(policy: Optional[str] = None, key: Optional[str] = None) -> str:
+    """按路由策略選擇下一個模型（默認策略由 ROUTING_POLICY 設置）"""
+    return get_router().select(policy, key)
+
+def _reroute_if_unavailable(model: str, model_pinned: bool, routing: Optional[str], route_key: Optional[str]) -> str:
+    """模型被熔斷且調用方未指定模型時，改用路由器選出的其他模型"""
+    router = get_router()
+    if model_pinned or router.is_available(model):
+        return model
+    new_model = router.select(routing, route_key)
+    if new_model != model:
+        print(f"模型 {model} 暫時不可用，切換到 {new_model}")
+    return new_model
+
+def _hedge_delay(model: str) -> float:
+    """根據最近觀察到的首字延遲計算對沖等待時間"""
+    observed = get_model_stats().ttft_percentile(model, HEDGE_PERCENTILE)
+    if observed is None:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, observed)
+
+def _hedge_model(model: str) -> str:
+    """選擇對沖請求使用的模型：AVAILABLE_MODELS 中下一個可用的模型"""
+    if HEDGE_NEXT_MODEL and model in AVAILABLE_MODELS:
+        router = get_router()
+        start = AVAILABLE_MODELS.index(model)
+        for offset in range(1, len(AVAILABLE_MODELS)):
+            candidate = AVAILABLE_MODELS[(start + offset) % len(AVAILABLE_MODELS)]
+            if router.is_available(candidate):
+                return candidate
     return model
 
+def _usage_field(obj, name: str):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+def _usage_counts(usage, model: str, messages: List[Dict[str, str]], content: str):
+    """從 API 返回的 usage 提取 token 數，缺失時在本地估算
+
+    返回 (prompt, completion, 命中前綴快取的 prompt token 數, 是否估算)。
+    前綴快取命中數兼容 OpenAI / OpenRouter 的 prompt_tokens_details.cached_tokens 和 DeepSeek 的 prompt_cache_hit_tokens。
+    """
+    prompt_tokens = _usage_field(usage, "prompt_tokens")
+    completion_tokens = _usage_field(usage, "completion_tokens")
+    if prompt_tokens is None or completion_tokens is None:
+        return count_message_tokens(messages, model), count_tokens(content, model), 0, True
+    cached_tokens = _usage_field(_usage_field(usage, "prompt_tokens_details"), "cached_tokens")
+    if cached_tokens is None:
+        cached_tokens = _usage_field(usage, "prompt_cache_hit_tokens")
+    return prompt_tokens, completion_tokens, cached_tokens or 0, False
+
+def _lookup_cache(model, messages, temperature, max_tokens, use_cache, response_format=None):
+    """查詢回應快取，返回 (快取鍵, 快取內容)；未啟用快取時快取鍵為 None"""
+    if not cache_enabled(use_cache):
+        return None, None
+    cache_key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+    return cache_key, get_llm_cache().get(cache_key)
+
+def _replay_cached_response(response: str, title: str, live_display: bool = True) -> None:
+    """通過與串流相同的 Live 面板顯示快取命中的回應"""
+    live_cls = Live if live_display else _SilentLive
+    with live_cls(Panel("正在讀取快取...", title=title, border_style="blue"), refresh_per_second=LIVE_REFRESH_PER_SECOND) as live:
+        try:
+            live.update(Panel(Markdown(response), title=f"{title}（快取）", border_style="green"))
+        except Exception:
+            live.update(Panel(Text(response), title=f"{title}（快取）", border_style="green"))
+
 async def call_llm(
     messages: List[Dict[str, str]],
     temperature: float = None,
     max_tokens: Optional[int] = None,
     model: Optional[str] = None,
-    retries: int = 3
+    retries: int = 3,
+    use_cache: Optional[bool] = None,  # 是否使用回應快取，None 表示跟隨 LLM_CACHE 設置
+    routing: Optional[str] = None,  # 路由策略：round_robin、fastest、cheapest、sticky
+    route_key: Optional[str] = None,  # sticky 策略使用的鍵，例如專家名稱
+    response_format: Optional[Dict] = None  # 結構化輸出格式，例如 {"type": "json_object"}
 ) -> str:
     """調用 LLM API，支持自動重試"""
     if temperature is None:
         temperature = TEMPERATURE
+    
+    model_pinned = model is not None
+    if model is None:
+        model = get_next_model(routing, route_key)
+    
+    # 發出請求前檢查 token 預算，超出時裁剪或拒絕
+    messages, max_tokens = enforce_budget(model, messages, max_tokens)
+    response_format = _supported_response_format(model, response_format)
+    
+    # 檢查快取
+    cache_key, cached = _lookup_cache(model, messages, temperature, max_tokens, use_cache, response_format)
+    if cached is not None:
+        print(f"命中回應快取: {model}")
+        record_llm_call(model, 0, 0, 0.0, cached=True)
+        emit_progress("llm_end", model=model, status="ok", cached=True, text=cached)
+        return cached
         
     current_retry = 0
+    call_start = time.time()
+    extra_params = {"response_format": response_format} if response_format else {}
     
     while current_retry <= retries:
         try:
-            if model is None:
-                model = get_next_model()
-            
             print(f"正在使用模型: {model}")
+            emit_progress("llm_start", model=model, attempt=current_retry)
             
-            # 使用異步方法創建聊天補全
-            response = await client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            # 使用異步方法創建聊天補全（經過進程級限流器）
+            async with get_rate_limiter().acquire(model, estimate_request_tokens(messages, max_tokens, model)):
+                attempt_start = time.time()
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **extra_params
+                )
             
             # 更安全的結果提取方式
             if not response or not hasattr(response, 'choices') or not response.choices:
@@ -65,14 +212,38 @@ async def call_llm(
             content = first_choice.message.content
             if content is None or content.strip() == "":
                 raise ValueError("收到空回應")
-                
+            
+            get_router().record_success(model)
+            
+            prompt_tokens, completion_tokens, cached_tokens, estimated = _usage_counts(getattr(response, "usage", None), model, messages, content)
+            record_llm_call(
+                model, prompt_tokens, completion_tokens, time.time() - call_start,
+                generation_time=time.time() - attempt_start, retries=current_retry,
+                cached_prompt_tokens=cached_tokens, usage_estimated=estimated
+            )
+            
+            # 重路由後回答的模型可能與查詢快取時不同，按實際回答的模型重建快取鍵
+            if cache_key:
+                get_llm_cache().set(make_cache_key(model, messages, temperature, max_tokens, response_format), content, model)
+            
+            emit_progress("llm_end", model=model, status="ok", text=content)
             return content
             
         except Exception as e:
+            # 參數不受支持時重試沒有意義，交給調用方改用其他方式
+            if response_format and is_unsupported_parameter_error(e):
+                emit_progress("llm_end", model=model, status="failed", error=str(e))
+                raise _unsupported_parameter(model, e) from e
+            
             current_retry += 1
             error_msg = f"API 調用錯誤 (重試 {current_retry}/{retries}): {str(e)}"
             print(error_msg)
             
+            # 限流不代表模型故障，不計入熔斷
+            if not is_rate_limit_error(e):
+                get_router().record_failure(model)
+                model = _reroute_if_unavailable(model, model_pinned, routing, route_key)
+            
             # 捕獲特定的錯誤類型並提供更多詳細信息
             if "list index out of range" in str(e):
                 print("可能是 API 返回了空響應或響應格式異常")
@@ -85,10 +256,15 @@ async def call_llm(
             
             if current_retry > retries:
                 print(f"API 調用失敗 ({retries}次重試後): {str(e)}")
+                record_llm_call(model, 0, 0, time.time() - call_start, retries=retries, status="failed")
+                emit_progress("llm_end", model=model, status="failed", error=str(e))
                 # 返回一個應急回應而不是拋出異常
-                return f"無法從 AI 模型獲取有效回應。請稍後再試。錯誤: {str(e)}"
+                return f"{LLM_FAILURE_PREFIX}。請稍後再試。錯誤: {str(e)}"
             
-            # 指數退避重試
+            # 限流錯誤由限流器控制等待時間，其他錯誤使用指數退避重試
+            if is_rate_limit_error(e):
+                print("觸發限流，等待限流器放行後重試...")
+                continue
             retry_delay = 2 ** current_retry
             print(f"等待 {retry_delay} 秒後重試...")
             await asyncio.sleep(retry_delay)
@@ -100,138 +276,261 @@ async def call_llm_streaming(
     model: Optional[str] = None,
     retries: int = 3,
     context_info: str = None,  # 添加上下文信息參數，例如"生成主持人中..."
-    idle_timeout: int = 30  # 新增數據流空閒超時參數，默認 30 秒
+    idle_timeout: int = 30,  # 數據流空閒超時上限（首字和內容塊間隔），默認 30 秒
+    ttft_timeout: Optional[float] = None,  # 首字期限，None 表示根據模型統計自動計算
+    total_timeout: Optional[float] = None,  # 總時長期限，None 表示使用 WATCHDOG_TOTAL_TIMEOUT
+    live_display: Optional[bool] = None,  # 是否顯示實時 Live 面板，並行調用時應關閉；None 表示跟隨 LIVE_DISPLAY 設置
+    use_cache: Optional[bool] = None,  # 是否使用回應快取，None 表示跟隨 LLM_CACHE 設置
+    hedge: Optional[bool] = None,  # 首字過慢時是否發出對沖請求，None 表示跟隨 HEDGE_REQUESTS 設置
+    routing: Optional[str] = None,  # 路由策略：round_robin、fastest、cheapest、sticky
+    route_key: Optional[str] = None,  # sticky 策略使用的鍵，例如專家名稱
+    response_format: Optional[Dict] = None  # 結構化輸出格式，例如 {"type": "json_object"}
 ) -> str:
-    """調用 LLM API，支持串流響應和自動重試，並檢測長時間無數據的情況"""
+    """調用 LLM API，支持串流響應和自動重試，並用看門狗檢測首字過慢、中途停頓和總時長過長的情況"""
     if temperature is None:
         temperature = TEMPERATURE
+    
+    if live_display is None:
+        live_display = LIVE_DISPLAY
+    
+    use_hedge = HEDGE_REQUESTS if hedge is None else hedge
+    
+    model_pinned = model is not None
+    if model is None:
+        model = get_next_model(routing, route_key)
+    
+    # 創建一個上下文標題
+    title = context_info if context_info else "AI 正在思考中..."
+    
+    # 發出請求前檢查 token 預算，超出時裁剪或拒絕
+    messages, max_tokens = enforce_budget(model, messages, max_tokens)
+    response_format = _supported_response_format(model, response_format)
+    
+    # 檢查快取，命中時直接重放到 Live 面板
+    cache_key, cached = _lookup_cache(model, messages, temperature, max_tokens, use_cache, response_format)
+    if cached is not None:
+        print(f"命中回應快取: {model}")
+        _replay_cached_response(cached, title, live_display)
+        record_llm_call(model, 0, 0, 0.0, cached=True, label=title)
+        emit_progress("llm_end", label=title, model=model, status="ok", cached=True, text=cached)
+        return cached
         
     current_retry = 0
     console = Console()
     tried_fallback = False
+    call_start = time.time()
+    extra_params = {"response_format": response_format} if response_format else {}
     
     while current_retry <= retries:
         try:
-            if model is None:
-                model = get_next_model()
-            
             print(f"正在使用模型: {model}")
+            emit_progress("llm_start", label=title, model=model, attempt=current_retry)
             
             # 使用串流模式創建聊天補全
             full_response = ""
             
-            # 創建一個上下文標題
-            title = context_info if context_info else "AI 正在思考中..."
-            
             # 如果之前嘗試流式失敗，直接回退到普通 API 調用
             if tried_fallback:
                 console.print(f"[yellow]使用普通 API 調用模式...[/yellow]")
-                return await call_llm(messages, temperature, max_tokens, model, retries)
+                return await call_llm(
+                    messages, temperature, max_tokens, model, retries,
+                    use_cache=use_cache, routing=routing, route_key=route_key, response_format=response_format
+                )
             
             # 創建一個 Live 顯示區域來實時更新內容
-            with Live(Panel("正在連接 API...", title=title, border_style="blue"), refresh_per_second=10) as live:
+            live_cls = Live if live_display else _SilentLive
+            with live_cls(Panel("正在連接 API...", title=title, border_style="blue"), refresh_per_second=LIVE_REFRESH_PER_SECOND) as live:
                 try:
                     # 初始化變量
-                    stream = None
                     stream_task = None
-                    idle_check_task = None
-                    last_activity_time = time.time()
-                    idle_timeout_occurred = False
                     
-                    # 定義一個內部函數來檢查空閒狀態
-                    async def check_idle_timeout():
-                        nonlocal idle_timeout_occurred, stream_task
-                        while True:
-                            current_idle_time = time.time() - last_activity_time
-                            if current_idle_time > idle_timeout:
-                                print(f"數據流空閒超過 {idle_timeout} 秒")
-                                idle_timeout_occurred = True
+                    # 內容塊先累積，再按 Live 刷新頻率合併渲染
+                    renderer = StreamRenderer(live, title, enabled=live_display)
+                    
+                    # 看門狗：任一期限到期時取消流處理任務
+                    deadlines = stream_deadlines(model, idle_timeout, ttft_timeout, total_timeout, max_tokens)
+                    watchdog = StreamWatchdog(deadlines, on_expire=lambda: stream_task.cancel())
+                    
+                    # 定義單次串流請求，對沖模式下可能有多個請求同時進行
+                    first_token_event = asyncio.Event()
+                    winner = None
+                    result = {}  # 勝出請求的模型、首字延遲、生成耗時和 usage
+                    
+                    async def run_attempt(attempt_model):
+                        nonlocal winner
+                        attempt_stream = None
+                        usage = None
+                        first_token_time = None
+                        last_chunk_time = None
+                        max_gap = 0.0
+                        token_count = 0
+                        
+                        # 經過進程級限流器，整個串流期間佔用一個並發名額
+                        async with get_rate_limiter().acquire(attempt_model, estimate_request_tokens(messages, max_tokens, attempt_model)):
+                            # 取得名額後才開始計時，排隊等待的時間不計入首字和總時長期限；
+                            # 對沖請求取得名額時看門狗已在運行，只重新開始首字計時
+                            if watchdog.started:
+                                watchdog.restart_ttft()
+                            else:
+                                watchdog.start()
+                            attempt_start = time.time()
+                            
+                            try:
+                                # 使用異步方法創建聊天補全，啟用串流模式
+                                attempt_stream = await client.chat.completions.create(
+                                    model=attempt_model,
+                                    messages=messages,
+                                    temperature=temperature,
+                                    max_tokens=max_tokens,
+                                    stream=True,  # 啟用串流模式
+                                    stream_options={"include_usage": True},  # 最後一個數據塊附帶 token 用量
+                                    **extra_params
+                                )
+                                
+                                # 顯示初始連接成功信息
+                                if winner is None:
+                                    live.update(Panel("", title=title, border_style="green"))
                                 
-                                # 取消主流程任務
-                                if stream_task and not stream_task.done():
-                                    stream_task.cancel()
+                                # 逐步接收並顯示串流內容
+                                async for chunk in attempt_stream:
+                                    # 收到首字後，每個數據塊都重置間隔期限
+                                    if first_token_time is not None:
+                                        now = time.time()
+                                        max_gap = max(max_gap, now - last_chunk_time)
+                                        last_chunk_time = now
+                                        watchdog.feed()
+                                    
+                                    if getattr(chunk, "usage", None):
+                                        usage = chunk.usage
+                                        
+                                    if not chunk.choices:
+                                        continue
+                                        
+                                    content_delta = chunk.choices[0].delta.content
+                                    if content_delta is None:
+                                        continue
+                                    
+                                    # 其他請求已經勝出，本請求的內容不再輸出
+                                    if winner is not None and winner is not asyncio.current_task():
+                                        return
                                     
-                                # 結束檢查任務
-                                return
+                                    # 第一個產生內容的請求勝出，取消其他請求
+                                    if winner is None:
+                                        winner = asyncio.current_task()
+                                        first_token_event.set()
+                                        first_token_time = time.time()
+                                        last_chunk_time = first_token_time
+                                        watchdog.feed()
+                                        get_model_stats().record_ttft(attempt_model, first_token_time - attempt_start)
+                                        for other in attempts:
+                                            if other is not winner and not other.done():
+                                                other.cancel()
+                                    
+                                    renderer.append(content_delta)
+                                    emit_progress("token", label=title, text=content_delta)
+                                    token_count += 1
                                 
-                            await asyncio.sleep(1)
+                                # 以收到的內容塊數近似 token 數，記錄生成速度
+                                if first_token_time is not None:
+                                    generation_time = time.time() - first_token_time
+                                    if generation_time > 0 and token_count > 1:
+                                        get_model_stats().record_throughput(attempt_model, token_count / generation_time)
+                                        get_model_stats().record_chunk_gap(attempt_model, max_gap)
+                                    get_router().record_success(attempt_model)
+                                    result.update(
+                                        model=attempt_model,
+                                        ttft=first_token_time - attempt_start,
+                                        generation_time=generation_time,
+                                        usage=usage
+                                    )
+                            except asyncio.CancelledError:
+                                raise
+                            except Exception as e:
+                                if extra_params and is_unsupported_parameter_error(e):
+                                    raise _unsupported_parameter(attempt_model, e) from e
+                                if not is_rate_limit_error(e):
+                                    get_router().record_failure(attempt_model)
+                                raise
+                            finally:
+                                # 關閉被取消或已完成的連接
+                                if attempt_stream is not None and hasattr(attempt_stream, "close"):
+                                    try:
+                                        await attempt_stream.close()
+                                    except Exception:
+                                        pass
                     
                     # 定義處理流數據的函數
+                    attempts = []
+                    
                     async def process_stream():
-                        nonlocal full_response, last_activity_time
-                        
-                        # 使用異步方法創建聊天補全，啟用串流模式
-                        nonlocal stream
-                        stream = await client.chat.completions.create(
-                            model=model,
-                            messages=messages,
-                            temperature=temperature,
-                            max_tokens=max_tokens,
-                            stream=True  # 啟用串流模式
-                        )
-                        
-                        # 顯示初始連接成功信息
-                        live.update(Panel("", title=title, border_style="green"))
-                        
-                        # 逐步接收並顯示串流內容
-                        async for chunk in stream:
-                            # 重置空閒計時器
-                            last_activity_time = time.time()
-                                
-                            if not chunk.choices:
-                                continue
-                                
-                            content_delta = chunk.choices[0].delta.content
-                            if content_delta is not None:
-                                full_response += content_delta
-                                # 更新顯示內容 (使用 Markdown 格式)
+                        attempts.append(asyncio.create_task(run_attempt(model)))
+                        try:
+                            # 對沖模式：首字遲遲未到時發出重複請求
+                            if use_hedge:
+                                hedge_delay = _hedge_delay(model)
+                                # 首字到達或第一個請求提前結束（例如出錯）時不必等滿對沖時間
+                                first_token = asyncio.create_task(first_token_event.wait())
                                 try:
-                                    live.update(Panel(Markdown(full_response), title=title, border_style="green"))
-                                except Exception:
-                                    # 如果 Markdown 解析失敗，使用純文本顯示
-                                    live.update(Panel(Text(full_response), title=title, border_style="green"))
+                                    await asyncio.wait({first_token, attempts[0]}, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                                finally:
+                                    first_token.cancel()
+                                if winner is None and not attempts[0].done():
+                                    hedge_model = _hedge_model(model)
+                                    print(f"{hedge_delay:.1f} 秒內未收到首字，發出對沖請求: {hedge_model}")
+                                    attempts.append(asyncio.create_task(run_attempt(hedge_model)))
+                            
+                            # 等待勝出的請求完成；沒有請求勝出時拋出第一個錯誤
+                            pending = set(attempts)
+                            first_error = None
+                            while pending:
+                                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                                for task in done:
+                                    if task.cancelled():
+                                        continue
+                                    error = task.exception()
+                                    if task is winner:
+                                        if error is not None:
+                                            raise error
+                                        return
+                                    if error is not None and first_error is None:
+                                        first_error = error
+                            if winner is None and first_error is not None:
+                                raise first_error
+                        finally:
+                            for task in attempts:
+                                if not task.done():
+                                    task.cancel()
                     
-                    # 啟動空閒檢查任務
-                    idle_check_task = asyncio.create_task(check_idle_timeout())
-                    
-                    # 啟動流處理任務
+                    # 啟動流處理任務，看門狗在請求取得限流器名額後開始計時
                     stream_task = asyncio.create_task(process_stream())
+                    try:
+                        await stream_task
+                    except asyncio.CancelledError:
+                        # 由看門狗取消時轉換為超時，其他情況（例如外部取消）照常傳播
+                        if watchdog.expired_reason is None:
+                            raise
+                        raise asyncio.TimeoutError(watchdog.describe())
+                    finally:
+                        watchdog.stop()
                     
-                    # 等待兩個任務中的任何一個完成
-                    done, pending = await asyncio.wait(
-                        [stream_task, idle_check_task],
-                        return_when=asyncio.FIRST_COMPLETED
-                    )
-                    
-                    # 檢查是哪個任務完成了
-                    for task in done:
-                        if task == idle_check_task and idle_timeout_occurred:
-                            # 如果是空閒檢查任務完成且檢測到空閒超時
-                            raise asyncio.TimeoutError(f"數據流空閒超過 {idle_timeout} 秒")
-                        elif task == stream_task:
-                            # 如果是流處理任務完成，獲取結果或可能的異常
-                            try:
-                                await task
-                            except Exception as e:
-                                raise e
-                    
-                    # 取消所有尚未完成的任務
-                    for task in pending:
-                        task.cancel()
-                        try:
-                            await task
-                        except asyncio.CancelledError:
-                            pass
+                    # 顯示最後一批尚未渲染的內容
+                    renderer.flush()
+                    full_response = renderer.text
                 
-                except asyncio.TimeoutError:
+                except asyncio.TimeoutError as timeout_error:
                     current_retry += 1
+                    get_router().record_failure(model)
+                    model = _reroute_if_unavailable(model, model_pinned, routing, route_key)
                     if current_retry < retries:
-                        console.print(f"[yellow]API 數據流空閒超時 (重試 {current_retry}/{retries})")
+                        console.print(f"[yellow]API 數據流超時：{timeout_error} (重試 {current_retry}/{retries})")
                         console.print(f"等待 2 秒後重試...")
                         await asyncio.sleep(2)
                         continue
                     else:
-                        raise Exception("API 數據流空閒超時，已達到最大重試次數")
+                        raise Exception(f"API 數據流超時（{timeout_error}），已達到最大重試次數")
+                
+                except UnsupportedParameterError:
+                    raise
                         
                 except Exception as stream_error:
                     # 如果串流模式出錯，提供視覺反饋並在下次迭代嘗試普通 API
@@ -241,16 +540,33 @@ async def call_llm_streaming(
                     raise ValueError(f"串流模式失敗: {str(stream_error)}")
                 finally:
                     # 確保所有任務都被正確取消
-                    if 'idle_check_task' in locals() and idle_check_task and not idle_check_task.done():
-                        idle_check_task.cancel()
-                    if 'stream_task' in locals() and stream_task and not stream_task.done():
+                    if stream_task and not stream_task.done():
                         stream_task.cancel()
             
             # 確保響應不為空
             if not full_response or full_response.strip() == "":
                 raise ValueError("收到空回應")
-                
+            
+            prompt_tokens, completion_tokens, cached_tokens, estimated = _usage_counts(result.get("usage"), result.get("model", model), messages, full_response)
+            record_llm_call(
+                result.get("model", model), prompt_tokens, completion_tokens, time.time() - call_start,
+                ttft=result.get("ttft"), generation_time=result.get("generation_time"), retries=current_retry,
+                cached_prompt_tokens=cached_tokens, usage_estimated=estimated, label=title
+            )
+            
+            # 重路由或對沖後回答的模型可能與查詢快取時不同，按實際回答的模型重建快取鍵
+            if cache_key:
+                answered_model = result.get("model", model)
+                get_llm_cache().set(make_cache_key(answered_model, messages, temperature, max_tokens, response_format), full_response, answered_model)
+            
+            emit_progress("llm_end", label=title, model=result.get("model", model), status="ok", text=full_response)
             return full_response
+        
+        except UnsupportedParameterError as e:
+            # 回退到普通 API 時 call_llm 已經發出結束事件
+            if not tried_fallback:
+                emit_progress("llm_end", label=title, model=model, status="failed", error=str(e))
+            raise
             
         except Exception as e:
             current_retry += 1
@@ -271,10 +587,15 @@ async def call_llm_streaming(
             # 如果已經嘗試過回退或最後一次重試
             if current_retry > retries:
                 print(f"API 串流調用失敗 ({retries}次重試後): {str(e)}")
+                record_llm_call(model, 0, 0, time.time() - call_start, retries=retries, status="failed", label=title)
+                emit_progress("llm_end", label=title, model=model, status="failed", error=str(e))
                 # 返回一個應急回應而不是拋出異常
-                return f"無法從 AI 模型獲取有效回應。請稍後再試。錯誤: {str(e)}"
+                return f"{LLM_FAILURE_PREFIX}。請稍後再試。錯誤: {str(e)}"
             
-            # 指數退避重試
+            # 限流錯誤由限流器控制等待時間，其他錯誤使用指數退避重試
+            if is_rate_limit_error(e):
+                print("觸發限流，等待限流器放行後重試...")
+                continue
             retry_delay = 2 ** current_retry
             print(f"等待 {retry_delay} 秒後重試...")
             await asyncio.sleep(retry_delay) 
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+本地 OpenAI 兼容替身後端（用於離線測試和壓力測試）
+
+實現 /v1/chat/completions（串流和非串流）以及 /v1/models，
+可以配置首字延遲、生成速度、錯誤注入，並為主持人、專家生成提供預設的 JSON 輸出。
+
+運行方式：
+    python -m utils.local_backend --port 8765 --script backend.yaml
+然後設置 LLM_BASE_URL=http://127.0.0.1:8765/v1
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+
+import yaml
+
+# 默認行為設置，可被腳本文件或 models 下的單個模型設置覆蓋
+DEFAULT_SETTINGS = {
+    "ttft": 0.3,                # 首字延遲（秒）
+    "tokens_per_second": 80,    # 生成速度
+    "error_rate": 0.0,          # 直接返回錯誤的概率
+    "error_status": 500,        # 注入錯誤的 HTTP 狀態碼（429 會附帶 retry-after）
+    "stall_rate": 0.0,          # 串流在首字後停頓的概率
+    "stall_seconds": 60,        # 停頓時長（秒）
+    "discussion_rounds": 2,     # 評估請求在第幾輪返回「結束討論」
+    "response_length": 300      # 通用回應的字數
+}
+
+DEFAULT_MODERATOR = {
+    "name": "林主持",
+    "background": "資深跨領域研究員",
+    "style": "引導式、重視平衡",
+    "expertise": "議題整合",
+    "personality": "冷靜客觀"
+}
+
+DEFAULT_EXPERTS = {
+    "experts": [
+        {
+            "name": "陳博士",
+            "expertise": "技術架構",
+            "background": "大型系統架構師",
+            "personality": "分析型思考",
+            "stance": "技術優先",
+            "style": "條理清晰",
+            "interaction": "喜歡用數據說話"
+        },
+        {
+            "name": "王經理",
+            "expertise": "產品管理",
+            "background": "十年產品經驗",
+            "personality": "務實",
+            "stance": "用戶導向",
+            "style": "直接明了",
+            "interaction": "重視落地"
+        },
+        {
+            "name": "張教授",
+            "expertise": "理論研究",
+            "background": "大學教授",
+            "personality": "嚴謹細致",
+            "stance": "理論為本",
+            "style": "學術嚴謹",
+            "interaction": "喜歡追問原理"
+        }
+    ]
+}
+
+# 按順序匹配提示內容的預設回應
+DEFAULT_RESPONSES = [
+    {"match": "會議主持人角色", "content": json.dumps(DEFAULT_MODERATOR, ensure_ascii=False)},
+    {"match": "專家角色", "content": json.dumps(DEFAULT_EXPERTS, ensure_ascii=False)}
+]
+
+_FILLER = "這是本地替身後端生成的測試內容，用於模擬專家在圓桌討論中的發言。"
+
+# 英文單詞、連續空白或單個字符各算一個 token
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+|\s+|.", re.S)
+
+def split_tokens(text: str) -> List[str]:
+    """將文本切分為模擬 token"""
+    return _TOKEN_PATTERN.findall(text)
+
+class LocalLLMBackend:
+    """本地 OpenAI 兼容替身後端"""
+
+    def __init__(self, script: Optional[Dict] = None, seed: Optional[int] = None):
+        script = dict(script or {})
+        self.model_settings = script.pop("models", {}) or {}
+        self.responses = (script.pop("responses", []) or []) + DEFAULT_RESPONSES
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(script)
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "stalls": 0, "cached_prompt_tokens": 0}
+        self.server = None
+        self._prefix_cache = set()  # 見過的 (模型, system 前綴)，模擬服務商的前綴快取
+
+    @classmethod
+    def from_file(cls, path: str, seed: Optional[int] = None) -> "LocalLLMBackend":
+        """從 YAML 腳本文件創建後端"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(yaml.safe_load(f) or {}, seed=seed)
+
+    def settings_for(self, model: str) -> Dict:
+        """獲取指定模型的行為設置"""
+        settings = dict(self.settings)
+        settings.update(self.model_settings.get(model, {}) or {})
+        return settings
+
+    def render_response(self, messages: List[Dict], settings: Dict) -> str:
+        """根據提示內容生成回應文本"""
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+
+        for rule in self.responses:
+            if rule.get("match") and rule["match"] in prompt:
+                return rule["content"]
+
+        # 評估請求：達到指定輪次後結束討論
+        round_match = re.search(r"當前討論輪次：\s*(\d+)", prompt)
+        if round_match:
+            if int(round_match.group(1)) >= settings["discussion_rounds"]:
+                return "結束討論。各方觀點已充分表達。"
+            return "繼續討論。仍有尚未覆蓋的方面。"
+
+        length = int(settings["response_length"])
+        return (_FILLER * (length // len(_FILLER) + 1))[:length]
+
+    def _cached_prefix_tokens(self, model: str, messages: List[Dict]) -> int:
+        """開頭的 system 消息與之前的請求完全相同時，視為命中前綴快取"""
+        prefix = []
+        for message in messages:
+            if message.get("role") != "system":
+                break
+            prefix.append(str(message.get("content", "")))
+        if not prefix:
+            return 0
+        key = (model, "\n".join(prefix))
+        if key not in self._prefix_cache:
+            self._prefix_cache.add(key)
+            return 0
+        return sum(len(split_tokens(content)) for content in prefix)
+
+    def _usage(self, messages: List[Dict], completion: str, cached_tokens: int = 0) -> Dict:
+        prompt_tokens = sum(len(split_tokens(str(m.get("content", "")))) for m in messages)
+        completion_tokens = len(split_tokens(completion))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """啟動 HTTP 服務，port 為 0 時自動選擇端口"""
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    @property
+    def base_url(self) -> str:
+        """服務的 API 基礎地址"""
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self) -> None:
+        """停止 HTTP 服務"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", "0")))
+
+            if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                await self._chat_completions(json.loads(body or b"{}"), writer)
+            elif method == "GET" and path.rstrip("/").endswith("/models"):
+                models = sorted(set(self.model_settings) | {"local/stand-in"})
+                await self._send_json(writer, 200, {"object": "list", "data": [{"id": m, "object": "model"} for m in models]})
+            else:
+                await self._send_json(writer, 404, {"error": {"message": f"未知路徑: {path}", "type": "not_found"}})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # 客戶端提前斷開（例如請求被取消）
+            pass
+        except asyncio.CancelledError:
+            # 停止服務或事件循環關閉時取消了仍在進行的請求，直接關閉連接
+            writer.close()
+            return
+        except Exception as e:
+            try:
+                await self._send_json(writer, 500, {"error": {"message": str(e), "type": "server_error"}})
+            except ConnectionError:
+                pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict, extra_headers: Optional[Dict] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"content-type": "application/json", "content-length": str(len(data)), "connection": "close"}
+        headers.update(extra_headers or {})
+        writer.write(self._status_line(status) + self._header_block(headers) + data)
+        await writer.drain()
+
+    @staticmethod
+    def _status_line(status: int) -> bytes:
+        reasons = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+        return f"HTTP/1.1 {status} {reasons.get(status, 'Error')}\r\n".encode("latin-1")
+
+    @staticmethod
+    def _header_block(headers: Dict) -> bytes:
+        return "".join(f"{k}: {v}\r\n" for k, v in headers.items()).encode("latin-1") + b"\r\n"
+
+    async def _chat_completions(self, request: Dict, writer: asyncio.StreamWriter) -> None:
+        self.stats["requests"] += 1
+        model = request.get("model", "local/stand-in")
+        messages = request.get("messages", [])
+        settings = self.settings_for(model)
+
+        # 錯誤注入
+        if self.random.random() < settings["error_rate"]:
+            self.stats["errors"] += 1
+            status = int(settings["error_status"])
+            await asyncio.sleep(settings["ttft"])
+            extra = {"retry-after": "1"} if status == 429 else None
+            await self._send_json(writer, status, {"error": {"message": "本地後端注入的錯誤", "type": "injected_error", "code": status}}, extra)
+            return
+
+        content = self.render_response(messages, settings)
+        cached_tokens = self._cached_prefix_tokens(model, messages)
+        self.stats["cached_prompt_tokens"] += cached_tokens
+        tokens = split_tokens(content)
+        max_tokens = request.get("max_tokens")
+        if max_tokens:
+            tokens = tokens[:max_tokens]
+            content = "".join(tokens)
+        delay = 1.0 / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0.0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not request.get("stream"):
+            await asyncio.sleep(settings["ttft"] + delay * len(tokens))
+            await self._send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": self._usage(messages, content, cached_tokens)
+            })
+            return
+
+        self.stats["streams"] += 1
+        headers = {"content-type": "text/event-stream", "cache-control": "no-cache", "transfer-encoding": "chunked", "connection": "close"}
+        writer.write(self._status_line(200) + self._header_block(headers))
+        await writer.drain()
+
+        async def send_event(payload) -> None:
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            event = f"data: {data}\n\n".encode("utf-8")
+            writer.write(f"{len(event):X}\r\n".encode("latin-1") + event + b"\r\n")
+            await writer.drain()
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        await asyncio.sleep(settings["ttft"])
+        stall_at = 1 if self.random.random() < settings["stall_rate"] else None
+        for i, token in enumerate(tokens):
+            if i == stall_at:
+                self.stats["stalls"] += 1
+                await asyncio.sleep(settings["stall_seconds"])
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            await send_event(chunk(delta))
+            if delay:
+                await asyncio.sleep(delay)
+        await send_event(chunk({}, "stop"))
+
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await send_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": self._usage(messages, content, cached_tokens)
+            })
+
+        await send_event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+async def _serve(args) -> None:
+    backend = LocalLLMBackend.from_file(args.script, seed=args.seed) if args.script else LocalLLMBackend(seed=args.seed)
+    await backend.start(args.host, args.port)
+    print(f"本地替身後端已啟動：{backend.base_url}")
+    print(f"請設置 LLM_BASE_URL={backend.base_url}")
+    async with backend.server:
+        await backend.server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容替身後端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="YAML 腳本文件，用於設置延遲、錯誤注入和預設回應")
+    parser.add_argument("--seed", type=int, help="隨機種子，用於重現錯誤注入")
+    asyncio.run(_serve(parser.parse_args()))
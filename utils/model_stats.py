@@ -0,0 +1,88 @@
+"""
+模型延遲與錯誤統計（供對沖請求、模型路由等決策使用）
+"""
+
+import math
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+# 計算百分位數所需的最少樣本數
+MIN_SAMPLES = 5
+
+# EWMA 平滑係數，越大越重視最近的觀察
+EWMA_ALPHA = 0.3
+
+def percentile(values, p: float) -> Optional[float]:
+    """計算百分位數（最近秩法），p 取值 0-1"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p * len(ordered)) - 1))
+    return ordered[index]
+
+class ModelStats:
+    """按模型保存最近的首字延遲（TTFT）和最大內容塊間隔樣本，以及 TTFT、生成速度和錯誤率的 EWMA"""
+
+    def __init__(self, window: int = 50, alpha: float = EWMA_ALPHA):
+        self.alpha = alpha
+        self._ttft = defaultdict(lambda: deque(maxlen=window))
+        self._gaps = defaultdict(lambda: deque(maxlen=window))
+        self.ewma_ttft = {}
+        self.ewma_tps = {}
+        self.error_rate = {}
+        self.calls = defaultdict(int)
+
+    def _update(self, table: Dict[str, float], model: str, value: float) -> None:
+        previous = table.get(model)
+        table[model] = value if previous is None else self.alpha * value + (1 - self.alpha) * previous
+
+    def record_ttft(self, model: str, seconds: float) -> None:
+        """記錄一次首字延遲"""
+        self._ttft[model].append(seconds)
+        self._update(self.ewma_ttft, model, seconds)
+
+    def record_chunk_gap(self, model: str, seconds: float) -> None:
+        """記錄一次串流中最大的內容塊間隔"""
+        self._gaps[model].append(seconds)
+
+    def record_throughput(self, model: str, tokens_per_second: float) -> None:
+        """記錄一次生成速度"""
+        self._update(self.ewma_tps, model, tokens_per_second)
+
+    def record_result(self, model: str, ok: bool) -> None:
+        """記錄一次調用結果，用於計算錯誤率"""
+        self.calls[model] += 1
+        self._update(self.error_rate, model, 0.0 if ok else 1.0)
+
+    def ttft_percentile(self, model: str, p: float) -> Optional[float]:
+        """返回最近 TTFT 的百分位數，樣本不足時返回 None"""
+        samples = self._ttft.get(model)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, p)
+
+    def gap_percentile(self, model: str, p: float) -> Optional[float]:
+        """返回最近最大內容塊間隔的百分位數，樣本不足時返回 None"""
+        samples = self._gaps.get(model)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, p)
+
+    def snapshot(self, model: str) -> Dict:
+        """返回指定模型的統計摘要"""
+        return {
+            "calls": self.calls.get(model, 0),
+            "ewma_ttft": self.ewma_ttft.get(model),
+            "ewma_tps": self.ewma_tps.get(model),
+            "error_rate": self.error_rate.get(model, 0.0)
+        }
+
+# 進程內共享的統計實例
+_model_stats = None
+
+def get_model_stats() -> ModelStats:
+    """獲取共享的模型統計實例"""
+    global _model_stats
+    if _model_stats is None:
+        _model_stats = ModelStats()
+    return _model_stats
@@ -0,0 +1,143 @@
+"""
+觀察者輸入：在不阻塞事件循環的情況下等待觀察者意見，支持超時自動繼續和預設輸入（無人值守運行）
+"""
+
+import os
+import asyncio
+import threading
+from collections import deque
+from typing import Iterable, List, Optional
+
+from utils.config import OBSERVER_MODE, OBSERVER_TIMEOUT, OBSERVER_SCRIPT
+from utils.serialization import load_yaml
+
+OBSERVER_MODES = ("console", "headless")
+
+def _clean(text) -> Optional[str]:
+    text = str(text or "").strip()
+    return text or None
+
+class ObserverChannel:
+    """觀察者輸入通道：ask() 返回觀察者對本輪的意見，沒有意見時返回 None
+
+    基類本身是一個始終沒有意見的通道，子類覆蓋 ask() 提供實際的輸入來源。
+    """
+
+    # 是否有真人在終端前輸入，決定是否顯示詢問提示
+    interactive = False
+
+    async def ask(self, round_number: int) -> Optional[str]:
+        return None
+
+class ConsoleObserver(ObserverChannel):
+    """從終端讀取觀察者輸入
+
+    input() 在後台守護線程中調用，等待期間事件循環照常運行；timeout 秒內沒有輸入時自動繼續討論。
+    超時後才輸入完的內容會在下一輪詢問時使用。
+    """
+
+    interactive = True
+
+    def __init__(self, timeout: Optional[float] = None, prompt: str = "> "):
+        self.timeout = OBSERVER_TIMEOUT if timeout is None else timeout
+        self.prompt = prompt
+        self._pending = None
+
+    def _start_read(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(text):
+            if not future.done():
+                future.set_result(text)
+
+        def read():
+            try:
+                text = input(self.prompt)
+            except EOFError:
+                text = ""
+            except Exception as e:
+                print(f"讀取觀察者輸入失敗: {str(e)}")
+                text = ""
+            try:
+                loop.call_soon_threadsafe(resolve, text)
+            except RuntimeError:
+                pass  # 事件循環已經關閉
+
+        # 守護線程不會阻止程序退出，即使觀察者一直沒有輸入
+        threading.Thread(target=read, name="observer-input", daemon=True).start()
+        return future
+
+    async def ask(self, round_number: int) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        if self._pending is None or self._pending.get_loop() is not loop:
+            self._pending = self._start_read()
+
+        try:
+            if self.timeout and self.timeout > 0:
+                text = await asyncio.wait_for(asyncio.shield(self._pending), self.timeout)
+            else:
+                text = await asyncio.shield(self._pending)
+        except asyncio.TimeoutError:
+            print(f"\n{self.timeout:g} 秒內沒有收到觀察者輸入，自動繼續")
+            return None
+
+        self._pending = None
+        return _clean(text)
+
+class QueuedObserver(ObserverChannel):
+    """預設或運行期間推送的觀察者輸入
+
+    inputs 按輪次依次使用（空字符串或 None 表示該輪沒有意見）；submit() 可在運行期間追加輸入，
+    例如來自服務接口。timeout 為隊列為空時等待推送的秒數，0 表示不等待。
+    """
+
+    def __init__(self, inputs: Iterable = (), timeout: float = 0.0):
+        self.timeout = timeout
+        self._queue = deque(inputs)
+        self._arrived = None
+
+    def submit(self, text: Optional[str]) -> None:
+        """追加一條觀察者輸入"""
+        self._queue.append(text)
+        if self._arrived is not None:
+            self._arrived.set()
+
+    async def ask(self, round_number: int) -> Optional[str]:
+        if not self._queue and self.timeout > 0:
+            self._arrived = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._arrived = None
+
+        if not self._queue:
+            return None
+        return _clean(self._queue.popleft())
+
+def load_observer_script(path: str) -> List[Optional[str]]:
+    """讀取預設的觀察者輸入：YAML / JSON 列表，或每行一條的文本文件（空行表示該輪沒有意見）"""
+    with open(path, "r", encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml", ".json"):
+            data = load_yaml(f) or []
+            if not isinstance(data, list):
+                raise ValueError(f"觀察者輸入文件應為列表: {path}")
+            return data
+        return [line.rstrip("\n") for line in f]
+
+def create_observer(mode: Optional[str] = None, inputs: Optional[Iterable] = None, timeout: Optional[float] = None) -> ObserverChannel:
+    """根據配置創建觀察者輸入通道
+
+    指定了 inputs 或 OBSERVER_SCRIPT 時使用預設輸入；headless 模式始終沒有觀察者意見；
+    否則從終端讀取，等待時間由 OBSERVER_TIMEOUT 決定。
+    """
+    mode = mode or OBSERVER_MODE
+    if inputs is None and OBSERVER_SCRIPT:
+        inputs = load_observer_script(OBSERVER_SCRIPT)
+    if inputs is not None:
+        return QueuedObserver(inputs)
+    if mode == "headless":
+        return QueuedObserver()
+    return ConsoleObserver(timeout)
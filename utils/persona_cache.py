@@ -0,0 +1,117 @@
+"""
+角色快取：按問題相似度重用之前為相近問題生成的主持人和專家，省去會話開始時的兩次生成調用
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from utils.config import PERSONA_CACHE, PERSONA_CACHE_PATH, PERSONA_CACHE_THRESHOLD, PERSONA_CACHE_TTL
+from utils.similarity import MinHashIndex
+
+PERSONA_KINDS = ("moderator", "agents")
+
+class PersonaCache:
+    """持久化的角色快取：SQLite 保存角色和問題的 MinHash 簽名，查詢通過內存中的 LSH 索引進行
+
+    主持人和專家分開保存（kind 為 moderator 或 agents），兩個生成節點可以並行各自查詢。
+    """
+
+    def __init__(self, path: str = PERSONA_CACHE_PATH, ttl: int = PERSONA_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes = {kind: MinHashIndex() for kind in PERSONA_KINDS}
+        self._conn = None
+
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS personas (
+                    id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    persona TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (kind, question)
+                )
+                """
+            )
+            self._conn.commit()
+            self._load()
+        except sqlite3.Error as e:
+            # 磁碟快取不可用時只在本進程內重用
+            print(f"警告: 無法打開角色快取 {path}: {str(e)}")
+            self._conn = None
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _load(self) -> None:
+        """啟動時用保存的簽名重建索引，不需要重新計算"""
+        rows = self._conn.execute("SELECT id, kind, signature, created_at FROM personas").fetchall()
+        for row_id, kind, signature, created_at in rows:
+            if kind in self._indexes and not self._expired(created_at):
+                self._indexes[kind].add(row_id, signature=json.loads(signature))
+
+    def lookup(self, kind: str, question: str, threshold: float = PERSONA_CACHE_THRESHOLD) -> Optional[Dict]:
+        """查找與 question 最相近的已保存角色
+
+        返回 {"question", "similarity", "persona"}，沒有相似度不低於 threshold 的條目時返回 None。
+        """
+        with self._lock:
+            if self._conn is None:
+                return None
+            for row_id, similarity in self._indexes[kind].query(question, threshold):
+                try:
+                    row = self._conn.execute(
+                        "SELECT question, persona, created_at FROM personas WHERE id = ?", (row_id,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"警告: 讀取角色快取失敗: {str(e)}")
+                    return None
+                if row is None or self._expired(row[2]):
+                    self._indexes[kind].remove(row_id)
+                    continue
+                return {"question": row[0], "similarity": similarity, "persona": json.loads(row[1])}
+        return None
+
+    def store(self, kind: str, question: str, persona) -> None:
+        """保存為 question 生成的角色（同一問題只保留最新的一份）"""
+        with self._lock:
+            if self._conn is None:
+                return
+            signature = self._indexes[kind].hasher.signature(question)
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR REPLACE INTO personas (kind, question, signature, persona, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (kind, question, json.dumps(signature), json.dumps(persona, ensure_ascii=False), time.time())
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 寫入角色快取失敗: {str(e)}")
+                return
+            # INSERT OR REPLACE 會刪除舊行，舊的編號留在索引中時查詢會自動清理
+            self._indexes[kind].add(cursor.lastrowid, signature=signature)
+
+# 進程內共享的角色快取實例，首次使用時創建
+_persona_cache = None
+
+def get_persona_cache() -> PersonaCache:
+    """獲取共享的角色快取實例"""
+    global _persona_cache
+    if _persona_cache is None:
+        _persona_cache = PersonaCache()
+    return _persona_cache
+
+def persona_cache_enabled(use_cache: Optional[bool] = None) -> bool:
+    """判斷是否使用角色快取，use_cache 為 None 時跟隨 PERSONA_CACHE 設置"""
+    return PERSONA_CACHE if use_cache is None else use_cache
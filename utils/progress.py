@@ -0,0 +1,33 @@
+"""
+進度事件：把節點切換、LLM 調用和逐字輸出等事件發送給當前會話的訂閱者（例如服務模式的 SSE 連接），
+並寫入當前會話的事件日誌
+"""
+
+import time
+import contextvars
+from typing import Callable, Dict
+
+from utils.ledger import current_call_context
+from utils.event_log import current_event_log
+
+# 當前會話的事件接收函數，未設置時不發送任何事件
+_progress_sink = contextvars.ContextVar("progress_sink", default=None)
+
+def use_progress_sink(sink: Callable[[Dict], None]) -> contextvars.Token:
+    """把此後（包括其中創建的任務）的進度事件發送給 sink，返回用於恢復的 token"""
+    return _progress_sink.set(sink)
+
+def reset_progress_sink(token: contextvars.Token) -> None:
+    _progress_sink.reset(token)
+
+def emit_progress(event: str, **data) -> None:
+    """發送一個進度事件，自動帶上當前調用的歸屬信息（節點、輪次、角色等）"""
+    sink = _progress_sink.get()
+    log = current_event_log()
+    if sink is None and log is None:
+        return
+    payload = {"event": event, "time": round(time.time(), 3), **current_call_context(), **data}
+    if sink is not None:
+        sink(payload)
+    if log is not None:
+        log.append(payload)
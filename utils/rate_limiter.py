@@ -0,0 +1,184 @@
+"""
+進程級的 LLM 請求限流器（按模型的令牌桶 + 並發上限，遇到 429 自動降速）
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from utils.config import (
+    RATE_LIMIT_RPM,
+    RATE_LIMIT_TPM,
+    RATE_LIMIT_MAX_IN_FLIGHT,
+    MODEL_RATE_LIMITS
+)
+from utils.tokens import count_message_tokens, DEFAULT_COMPLETION_RESERVE
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int] = None, model: Optional[str] = None) -> int:
+    """估算一次請求消耗的 token 數（提示 + 回應預留）"""
+    return count_message_tokens(messages, model) + (max_tokens or DEFAULT_COMPLETION_RESERVE)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """判斷異常是否為服務商返回的限流錯誤"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    # 串流路徑會把原始異常包裝成 ValueError，只能從錯誤信息判斷
+    message = str(error).lower()
+    return "error code: 429" in message or "rate limit" in message
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """從限流錯誤的響應頭中讀取 retry-after 秒數"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """按分鐘速率補充的令牌桶，rate_per_minute 為 0 表示不限制"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.scale = 1.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        rate = self.rate_per_minute * self.scale / 60.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """返回可以取出 amount 個令牌前需要等待的秒數"""
+        if self.rate_per_minute <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate_per_minute * self.scale / 60.0)
+
+    def consume(self, amount: float) -> None:
+        if self.rate_per_minute > 0:
+            self.tokens -= min(amount, self.capacity)
+
+class ModelLimiter:
+    """單個模型的限流狀態"""
+
+    # 遇到 429 時速率減半，成功後緩慢恢復
+    MIN_SCALE = 0.1
+    DECREASE_FACTOR = 0.5
+    RECOVERY_STEP = 0.05
+
+    def __init__(self, rpm: float, tpm: float, max_in_flight: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+        self.lock = asyncio.Lock()
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.rate_limited_count = 0
+        self.consecutive_rate_limits = 0
+
+    def _set_scale(self, scale: float) -> None:
+        self.scale = scale
+        self.requests.scale = scale
+        self.tokens.scale = scale
+
+    async def wait_for_budget(self, estimated_tokens: int) -> None:
+        """等待直到速率預算允許發送請求（按到達順序排隊）"""
+        async with self.lock:
+            while True:
+                wait = max(
+                    self.paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens)
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(estimated_tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def on_success(self) -> None:
+        self.consecutive_rate_limits = 0
+        if self.scale < 1.0:
+            self._set_scale(min(1.0, self.scale + self.RECOVERY_STEP))
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        self.rate_limited_count += 1
+        self.consecutive_rate_limits += 1
+        self._set_scale(max(self.MIN_SCALE, self.scale * self.DECREASE_FACTOR))
+        # 沒有 retry-after 時按連續限流次數退避，最長 60 秒
+        pause = retry_after if retry_after is not None else min(60.0, 2.0 ** min(self.consecutive_rate_limits, 6))
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+class RateLimiter:
+    """進程級限流器，為每個模型維護獨立的令牌桶和並發上限"""
+
+    def __init__(
+        self,
+        rpm: float = RATE_LIMIT_RPM,
+        tpm: float = RATE_LIMIT_TPM,
+        max_in_flight: int = RATE_LIMIT_MAX_IN_FLIGHT,
+        model_limits: Optional[Dict[str, Dict]] = None
+    ):
+        self.defaults = {"rpm": rpm, "tpm": tpm, "max_in_flight": max_in_flight}
+        self.model_limits = MODEL_RATE_LIMITS if model_limits is None else model_limits
+        self._models = {}
+
+    def for_model(self, model: str) -> ModelLimiter:
+        """獲取（必要時創建）指定模型的限流狀態"""
+        if model not in self._models:
+            limits = dict(self.defaults)
+            limits.update(self.model_limits.get(model, {}))
+            self._models[model] = ModelLimiter(limits["rpm"], limits["tpm"], int(limits["max_in_flight"]))
+        return self._models[model]
+
+    @asynccontextmanager
+    async def acquire(self, model: str, estimated_tokens: int = 0):
+        """在限流預算內執行一次請求，並根據結果調整速率"""
+        limiter = self.for_model(model)
+        if limiter.in_flight:
+            await limiter.in_flight.acquire()
+        try:
+            await limiter.wait_for_budget(estimated_tokens)
+            try:
+                yield limiter
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    limiter.on_rate_limited(get_retry_after(e))
+                    print(f"模型 {model} 觸發限流，請求速率降至 {limiter.scale:.0%}")
+                raise
+            else:
+                limiter.on_success()
+        finally:
+            if limiter.in_flight:
+                limiter.in_flight.release()
+
+    def stats(self) -> Dict[str, Dict]:
+        """返回每個模型的當前限流狀態"""
+        return {
+            model: {
+                "scale": round(limiter.scale, 3),
+                "rate_limited": limiter.rate_limited_count,
+                "paused_for": max(0.0, round(limiter.paused_until - time.monotonic(), 2))
+            }
+            for model, limiter in self._models.items()
+        }
+
+# 進程內共享的限流器
+_rate_limiter = None
+
+def get_rate_limiter() -> RateLimiter:
+    """獲取共享的限流器實例"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -4,18 +4,51 @@
 
 import os
 import json
-import yaml
 import time
-from typing import Dict
+from typing import Dict, Optional
 from datetime import datetime
 from rich.console import Console
 from rich.markdown import Markdown
 
-def save_discussion_record(shared: Dict) -> str:
-    """保存討論記錄（YAML 和 Markdown 格式）"""
+from utils.ledger import summarize_usage
+from utils.event_log import replay_event_log
+from utils.record_index import index_record
+from utils.config import RECORD_YAML_EXPORT
+from utils.serialization import RECORD_SUFFIX, dump_record, dump_yaml
+
+def _format_cost(cost) -> str:
+    return "未配置價格" if cost is None else f"${cost:.4f}"
+
+def _format_rate(rate) -> str:
+    return "-" if rate is None else f"{rate:.0%}"
+
+def _usage_markdown(usage: Dict) -> list:
+    """將用量匯總轉換為 Markdown 行"""
+    total = usage["total"]
+    lines = [
+        f"- **LLM 調用**：{total['calls']} 次（重試 {total['retries']} 次）",
+        f"- **Token**：輸入 {total['prompt_tokens']}（前綴快取命中 {_format_rate(total['cache_hit_rate'])}），輸出 {total['completion_tokens']}",
+        f"- **估算成本**：{_format_cost(total['cost'])}"
+    ]
+    if usage["by_node"]:
+        lines.append("\n| 節點 | 調用 | 輸入 Token | 快取命中 | 輸出 Token | 平均首字延遲 | 成本 |")
+        lines.append("| --- | --- | --- | --- | --- | --- | --- |")
+        for node, item in usage["by_node"].items():
+            avg_ttft = f"{item['avg_ttft']:.2f} 秒" if item["avg_ttft"] is not None else "-"
+            lines.append(
+                f"| {node} | {item['calls']} | {item['prompt_tokens']} | {_format_rate(item['cache_hit_rate'])} | {item['completion_tokens']} | {avg_ttft} | {_format_cost(item['cost'])} |"
+            )
+    return lines
+
+def save_discussion_record(shared: Dict, directory: str = "records", name: Optional[str] = None) -> str:
+    """保存討論記錄（緊湊的記錄文件和 Markdown，開啟 RECORD_YAML_EXPORT 時另外導出 YAML），返回記錄文件路徑
+    
+    name 為不含擴展名的文件名，未指定時按問題和時間生成；批量運行時用於避免同名衝突。
+    啟用事件日誌時應使用 render_event_log，從日誌生成記錄。
+    """
     try:
         # 確保記錄目錄存在
-        os.makedirs("records", exist_ok=True)
+        os.makedirs(directory, exist_ok=True)
         
         # 檢查必要的字段是否存在
         if not shared.get("question"):
@@ -37,7 +70,8 @@ def save_discussion_record(shared: Dict) -> str:
         # 生成檔案名稱
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         question_slug = shared["question"][:20].replace(" ", "_").replace("/", "_").replace("\\", "_")
-        filename_base = f"records/discussion_{question_slug}_{timestamp}"
+        filename_base = os.path.join(directory, name or f"discussion_{question_slug}_{timestamp}")
+        record_filename = f"{filename_base}{RECORD_SUFFIX}"
         yaml_filename = f"{filename_base}.yaml"
         md_filename = f"{filename_base}.md"
         
@@ -52,6 +86,7 @@ def save_discussion_record(shared: Dict) -> str:
             "summary": shared.get("summary", "未生成摘要"),
             "status": shared.get("status", "未知"),
             "error": shared.get("error"),
+            "total_time": shared.get("total_time"),
             "progress": {
                 "total_rounds": len(shared.get("discussion_history", [])),
                 "completed_rounds": len([r for r in shared.get("discussion_history", []) if r.get("summary") is not None]),
@@ -59,9 +94,28 @@ def save_discussion_record(shared: Dict) -> str:
             }
         }
         
-        # 保存為 YAML 檔案
-        with open(yaml_filename, "w", encoding="utf-8") as f:
-            yaml.dump(record, f, allow_unicode=True, sort_keys=False)
+        # 直接使用了之前相似討論的結論
+        if shared.get("reused_from"):
+            record["reused_from"] = shared["reused_from"]
+        
+        # 程式中斷時尚未完成的逐字輸出（從事件日誌恢復）
+        if shared.get("partial_output"):
+            record["partial_output"] = shared["partial_output"]
+        
+        # LLM 調用的用量、延遲和成本
+        llm_calls = shared.get("llm_calls", [])
+        usage = summarize_usage(llm_calls) if llm_calls else None
+        if usage:
+            record["usage"] = dict(usage, calls=llm_calls)
+        
+        # 保存記錄文件，YAML 只作為閱讀視圖按需導出
+        dump_record(record, record_filename)
+        if RECORD_YAML_EXPORT:
+            with open(yaml_filename, "w", encoding="utf-8") as f:
+                dump_yaml(record, f)
+        
+        # 增量更新全文索引
+        index_record(record_filename, record)
         
         # 生成 Markdown 格式記錄
         md_content = []
@@ -71,6 +125,9 @@ def save_discussion_record(shared: Dict) -> str:
         md_content.append(f"**時間**：{shared['timestamp']}")
         md_content.append(f"**問題**：{shared['question']}")
         md_content.append(f"**狀態**：{shared.get('status', '未知')}")
+        reused_from = shared.get("reused_from")
+        if reused_from:
+            md_content.append(f"**結論來源**：直接使用了 {reused_from.get('timestamp')} 的相似討論（相似度 {reused_from.get('similarity', 0):.2f}）「{reused_from.get('question')}」，記錄見 {reused_from.get('path')}")
         
         # 主持人信息
         md_content.append("\n## 主持人")
@@ -126,21 +183,36 @@ def save_discussion_record(shared: Dict) -> str:
                 md_content.append(f"\n### 輸入 {i}")
                 md_content.append(f"{input_data}")
         
+        # 未完成的輸出
+        if shared.get("partial_output"):
+            md_content.append("\n## 未完成的輸出")
+            for label, text in shared["partial_output"].items():
+                md_content.append(f"\n### {label}")
+                md_content.append(text)
+        
         # 最終總結
         md_content.append("\n## 最終結論")
         md_content.append(shared.get("summary", "未生成摘要"))
         
+        # 資源使用
+        if usage:
+            md_content.append("\n## 資源使用")
+            md_content.extend(_usage_markdown(usage))
+        
         # 保存 Markdown 文件
         with open(md_filename, "w", encoding="utf-8") as f:
             f.write("\n".join(md_content))
             
-        print(f"討論記錄已保存至：\n- YAML: {yaml_filename}\n- Markdown: {md_filename}")
-        return yaml_filename
+        saved = [f"- 記錄: {record_filename}", f"- Markdown: {md_filename}"]
+        if RECORD_YAML_EXPORT:
+            saved.append(f"- YAML: {yaml_filename}")
+        print("討論記錄已保存至：\n" + "\n".join(saved))
+        return record_filename
     except Exception as e:
         print(f"保存記錄時發生錯誤：{str(e)}")
         try:
             # 嘗試緊急保存到簡單文件
-            emergency_file = f"records/emergency_backup_{int(time.time())}.json"
+            emergency_file = os.path.join(directory, f"emergency_backup_{int(time.time())}.json")
             with open(emergency_file, "w", encoding="utf-8") as f:
                 json.dump(shared, f, ensure_ascii=False, default=str)
             print(f"已創建緊急備份：{emergency_file}")
@@ -148,8 +220,23 @@ def save_discussion_record(shared: Dict) -> str:
             print("無法創建緊急備份")
         return None
 
+def render_event_log(path: str, directory: str = "records", name: Optional[str] = None) -> Optional[str]:
+    """從事件日誌生成討論記錄，返回記錄文件路徑
+    
+    可以隨時調用，包括會話仍在進行或中途崩潰時；name 的含義與 save_discussion_record 相同。
+    """
+    try:
+        shared = replay_event_log(path)
+    except OSError as e:
+        print(f"讀取事件日誌失敗：{str(e)}")
+        return None
+    return save_discussion_record(shared, directory=directory, name=name)
+
 def print_summary(shared: Dict) -> None:
-    """格式化並打印會議摘要（使用 Rich 庫渲染 Markdown）"""
+    """格式化並打印會議摘要（使用 Rich 庫渲染 Markdown）
+    
+    只在終端顯示，完整內容見 save_discussion_record / render_event_log 生成的 Markdown 記錄。
+    """
     try:
         # 創建 Rich Console 對象
         console = Console()
@@ -214,6 +301,12 @@ def print_summary(shared: Dict) -> None:
             markdown_content.append("\n## 最終結論")
             markdown_content.append("未生成最終結論")
             
+        # 資源使用
+        llm_calls = shared.get("llm_calls", [])
+        if llm_calls:
+            markdown_content.append("\n## 資源使用")
+            markdown_content.extend(_usage_markdown(summarize_usage(llm_calls)))
+        
         # 討論狀態
         status = shared.get("status", "未知")
         markdown_content.append(f"\n**討論狀態**：{status}")
@@ -226,20 +319,9 @@ def print_summary(shared: Dict) -> None:
         # 轉換為 Markdown 字符串
         markdown_string = "\n".join(markdown_content)
         
-        # 保存 Markdown 文件
-        os.makedirs("records", exist_ok=True)
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        md_filename = f"records/summary_{current_time}.md"
-        
-        with open(md_filename, "w", encoding="utf-8") as f:
-            f.write(markdown_string)
-        
         # 使用 Rich 庫渲染 Markdown
         markdown = Markdown(markdown_string)
         console.print(markdown)
-        
-        # 顯示保存信息
-        print(f"\n摘要已保存為 Markdown 文件：{md_filename}")
             
     except Exception as e:
         print(f"打印摘要時發生錯誤：{str(e)}") 
\ No newline at end of file
@@ -0,0 +1,299 @@
+"""
+討論記錄索引：用 SQLite 全文檢索（FTS5）索引問題、主持人和專家設定、發言、每輪總結和最終結論
+
+save_discussion_record 每次寫入記錄時增量更新索引；sync() 補充索引目錄中其他方式產生或修改過的記錄。
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import yaml
+
+from utils.config import RECORD_INDEX, RECORD_INDEX_PATH
+from utils.serialization import RECORD_SUFFIX, YAML_SUFFIXES, is_record_file, load_record, record_stem
+
+# 全文索引按三字元切分，能匹配中文任意子串；少於三個字元的詞改用 LIKE 過濾
+MIN_FTS_TERM = 3
+
+RECORD_KINDS = ("question", "persona", "opening", "turn", "round_summary", "observer", "summary")
+
+_PERSONA_FIELDS = ("expertise", "background", "personality", "stance", "style", "interaction")
+
+def record_documents(record: Dict) -> List[Dict]:
+    """把一份討論記錄拆成可檢索的文本片段"""
+    docs = []
+
+    def add(kind, content, speaker=None, round_number=None):
+        if isinstance(content, str) and content.strip():
+            docs.append({"kind": kind, "speaker": speaker, "round": round_number, "content": content})
+
+    add("question", record.get("question"))
+
+    personas = [record.get("moderator")] + list(record.get("agents") or [])
+    for persona in personas:
+        if isinstance(persona, dict):
+            text = "\n".join(f"{persona[field]}" for field in _PERSONA_FIELDS if persona.get(field))
+            add("persona", text, persona.get("name"))
+
+    for round_data in record.get("discussion_history") or []:
+        if not isinstance(round_data, dict):
+            continue
+        round_number = round_data.get("round_number")
+        opening = round_data.get("opening") or {}
+        if isinstance(opening, dict):
+            add("opening", opening.get("opening"), opening.get("name"), round_number)
+        for response in round_data.get("responses") or []:
+            if isinstance(response, dict):
+                add("turn", response.get("content"), (response.get("agent") or {}).get("name"), round_number)
+        summary = round_data.get("summary") or {}
+        if isinstance(summary, dict):
+            add("round_summary", summary.get("summary"), summary.get("name"), round_number)
+
+    for index, observer_input in enumerate(record.get("observer_inputs") or [], 1):
+        add("observer", observer_input, round_number=index)
+
+    add("summary", record.get("summary"))
+    return docs
+
+def _snippet(content: str, terms: List[str], width: int = 40) -> str:
+    """在 Python 中截取匹配位置附近的文本（只有短詞時使用）"""
+    position = min((content.find(term) for term in terms if term in content), default=0)
+    start = max(0, position - width // 2)
+    text = content[start:start + width]
+    for term in terms:
+        text = text.replace(term, f"[{term}]")
+    return ("…" if start > 0 else "") + text + ("…" if start + width < len(content) else "")
+
+class RecordIndex:
+    """討論記錄的全文索引"""
+
+    def __init__(self, path: str = RECORD_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                question TEXT,
+                timestamp TEXT,
+                status TEXT,
+                rounds INTEGER,
+                mtime REAL,
+                indexed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS record_docs (
+                id INTEGER PRIMARY KEY,
+                record_id INTEGER NOT NULL REFERENCES records (id),
+                kind TEXT NOT NULL,
+                speaker TEXT,
+                round INTEGER,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_record_docs_record ON record_docs (record_id);
+            CREATE TRIGGER IF NOT EXISTS record_docs_ai AFTER INSERT ON record_docs BEGIN
+                INSERT INTO record_text (rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS record_docs_ad AFTER DELETE ON record_docs BEGIN
+                INSERT INTO record_text (record_text, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+            """
+        )
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS record_text USING fts5(content, content='record_docs', content_rowid='id', tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            # 舊版 SQLite 沒有 trigram 分詞器，中文只能按整段匹配
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS record_text USING fts5(content, content='record_docs', content_rowid='id')"
+            )
+        self._conn.commit()
+
+    def add(self, path: str, record: Dict, mtime: Optional[float] = None) -> int:
+        """索引（或重新索引）一份記錄，返回索引的文本片段數"""
+        path = os.path.abspath(path)
+        if mtime is None:
+            mtime = os.path.getmtime(path) if os.path.exists(path) else time.time()
+        docs = record_documents(record)
+        with self._lock, self._conn:
+            self._delete(path)
+            cursor = self._conn.execute(
+                "INSERT INTO records (path, question, timestamp, status, rounds, mtime, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, record.get("question"), str(record.get("timestamp") or ""), record.get("status"),
+                 len(record.get("discussion_history") or []), mtime, time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO record_docs (record_id, kind, speaker, round, content) VALUES (?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, doc["kind"], doc["speaker"], doc["round"], doc["content"]) for doc in docs]
+            )
+        return len(docs)
+
+    def _delete(self, path: str) -> None:
+        row = self._conn.execute("SELECT id FROM records WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM record_docs WHERE record_id = ?", row)
+            self._conn.execute("DELETE FROM records WHERE id = ?", row)
+
+    def remove(self, path: str) -> None:
+        with self._lock, self._conn:
+            self._delete(os.path.abspath(path))
+
+    def sync(self, directories: Iterable[str] = ("records",)) -> Dict:
+        """增量同步目錄（含子目錄）中的記錄文件和 YAML 記錄：只重新解析新增或修改過的文件，刪除已不存在的文件的索引"""
+        with self._lock:
+            indexed = dict(self._conn.execute("SELECT path, mtime FROM records").fetchall())
+
+        stats = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+        seen = set()
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    if not is_record_file(name):
+                        continue
+                    path = os.path.abspath(os.path.join(root, name))
+                    # 與記錄文件同名的 YAML 是導出的閱讀視圖，不重複索引
+                    if name.endswith(YAML_SUFFIXES) and os.path.exists(record_stem(path) + RECORD_SUFFIX):
+                        continue
+                    seen.add(path)
+                    mtime = os.path.getmtime(path)
+                    if indexed.get(path) == mtime:
+                        continue
+                    try:
+                        record = load_record(path)
+                    except (OSError, ValueError, yaml.YAMLError) as e:
+                        print(f"無法讀取記錄 {path}: {str(e)}")
+                        stats["skipped"] += 1
+                        continue
+                    if not isinstance(record, dict) or "question" not in record:
+                        stats["skipped"] += 1
+                        continue
+                    self.add(path, record, mtime)
+                    stats["updated" if path in indexed else "added"] += 1
+
+        # 只清理本次同步範圍內已被刪除的文件
+        roots = tuple(os.path.join(os.path.abspath(directory), "") for directory in directories)
+        for path in indexed:
+            if path.startswith(roots) and path not in seen:
+                self.remove(path)
+                stats["removed"] += 1
+        return stats
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """全文檢索，返回按相關度排序的記錄，每份記錄附帶匹配的片段
+
+        查詢按空白分詞，所有詞都必須出現在同一片段中；kind 限定片段類型（見 RECORD_KINDS）。
+        """
+        terms = [term for term in re.split(r"\s+", query.strip()) if term]
+        if not terms:
+            return []
+        long_terms = [term for term in terms if len(term) >= MIN_FTS_TERM]
+        short_terms = [term for term in terms if len(term) < MIN_FTS_TERM]
+
+        conditions, params = [], []
+        for term in short_terms:
+            conditions.append("d.content LIKE ?")
+            params.append(f"%{term}%")
+        if kind:
+            conditions.append("d.kind = ?")
+            params.append(kind)
+
+        columns = "r.path, r.question, r.timestamp, r.status, d.kind, d.speaker, d.round, d.content"
+        if long_terms:
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            sql = (
+                f"SELECT {columns}, snippet(record_text, 0, '[', ']', '…', 16), bm25(record_text) "
+                "FROM record_text JOIN record_docs d ON d.id = record_text.rowid JOIN records r ON r.id = d.record_id "
+                f"WHERE record_text MATCH ? {''.join(' AND ' + c for c in conditions)} ORDER BY bm25(record_text) LIMIT ?"
+            )
+            params = [match] + params
+        else:
+            sql = (
+                f"SELECT {columns}, NULL, 0 FROM record_docs d JOIN records r ON r.id = d.record_id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY r.timestamp DESC LIMIT ?"
+            )
+        # 每份記錄可能有多個片段匹配，多取一些再按記錄歸併
+        params.append(limit * 10)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        results = {}
+        for path, question, timestamp, status, doc_kind, speaker, round_number, content, snippet, score in rows:
+            if path not in results:
+                if len(results) >= limit:
+                    continue
+                results[path] = {"path": path, "question": question, "timestamp": timestamp, "status": status, "score": score, "matches": []}
+            results[path]["matches"].append({
+                "kind": doc_kind,
+                "speaker": speaker,
+                "round": round_number,
+                "snippet": snippet if snippet is not None else _snippet(content, terms)
+            })
+        return list(results.values())
+
+    def records_after(self, after_id: int = 0) -> List[Dict]:
+        """按索引順序列出編號大於 after_id 的記錄（不含內容），用於增量構建其他索引"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, path, question, timestamp, status FROM records WHERE id > ? ORDER BY id", (after_id,)
+            ).fetchall()
+        return [dict(zip(("id", "path", "question", "timestamp", "status"), row)) for row in rows]
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """讀取一份記錄的基本信息和最終結論，記錄已被刪除或重新索引時返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, path, question, timestamp, status FROM records WHERE id = ?", (record_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            summary = self._conn.execute(
+                "SELECT content FROM record_docs WHERE record_id = ? AND kind = 'summary'", (record_id,)
+            ).fetchone()
+        record = dict(zip(("id", "path", "question", "timestamp", "status"), row))
+        record["summary"] = summary[0] if summary else None
+        return record
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+# 進程內共享的索引實例，首次使用時創建
+_record_index = None
+
+def get_record_index() -> RecordIndex:
+    """獲取共享的記錄索引實例"""
+    global _record_index
+    if _record_index is None:
+        _record_index = RecordIndex()
+    return _record_index
+
+def index_record(path: str, record: Dict) -> None:
+    """把剛保存的記錄加入索引；索引不可用時只打印警告，不影響記錄的保存"""
+    if not RECORD_INDEX:
+        return
+    try:
+        get_record_index().add(path, record)
+    except sqlite3.Error as e:
+        print(f"警告: 更新記錄索引失敗: {str(e)}")
+
+def search_records(query: str, kind: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """在共享索引中檢索討論記錄"""
+    return get_record_index().search(query, kind=kind, limit=limit)
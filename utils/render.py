@@ -0,0 +1,80 @@
+"""
+串流回應的增量渲染
+"""
+
+import time
+from typing import List
+
+from rich.console import Group
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.text import Text
+
+# Live 面板的刷新頻率，渲染頻率與其一致即可
+LIVE_REFRESH_PER_SECOND = 10
+
+class StreamRenderer:
+    """累積串流內容塊，按刷新頻率合併渲染，並只重新解析尚未完成的尾部段落"""
+
+    def __init__(self, live, title: str, enabled: bool = True, refresh_per_second: int = LIVE_REFRESH_PER_SECOND):
+        self.live = live
+        self.title = title
+        self.enabled = enabled
+        self.interval = 1.0 / refresh_per_second
+        self._chunks: List[str] = []
+        self._joined = 0
+        self._text = ""
+        self._stable_blocks = []  # 已完成段落的渲染結果，不再重新解析
+        self._stable_end = 0      # 已完成部分在全文中的結束位置
+        self._last_render = 0.0
+        self._dirty = False
+
+    @property
+    def text(self) -> str:
+        """目前累積的完整文本"""
+        if self._joined < len(self._chunks):
+            self._text += "".join(self._chunks[self._joined:])
+            self._joined = len(self._chunks)
+        return self._text
+
+    def append(self, delta: str) -> None:
+        """追加一個內容塊，距離上次渲染超過刷新間隔時才重新渲染"""
+        self._chunks.append(delta)
+        self._dirty = True
+        if self.enabled and time.monotonic() - self._last_render >= self.interval:
+            self.render()
+
+    def flush(self) -> None:
+        """渲染尚未顯示的內容"""
+        if self.enabled and self._dirty:
+            self.render()
+
+    def _advance_stable(self, text: str) -> None:
+        """把最後一個空行之前、且不在代碼塊內的段落固定下來"""
+        boundary = text.rfind("\n\n", self._stable_end)
+        if boundary < 0:
+            return
+        segment = text[self._stable_end:boundary]
+        # 代碼塊未閉合時不能在此切分
+        if segment.count("```") % 2 != 0:
+            return
+        if segment.strip():
+            self._stable_blocks.append(self._to_renderable(segment))
+            self._stable_blocks.append(Text(""))
+        self._stable_end = boundary + 2
+
+    @staticmethod
+    def _to_renderable(text: str):
+        try:
+            return Markdown(text)
+        except Exception:
+            # 如果 Markdown 解析失敗，使用純文本顯示
+            return Text(text)
+
+    def render(self) -> None:
+        text = self.text
+        self._advance_stable(text)
+        tail = self._to_renderable(text[self._stable_end:])
+        self.live.update(Panel(Group(*self._stable_blocks, tail), title=self.title, border_style="green"))
+        self._last_render = time.monotonic()
+        self._dirty = False
@@ -0,0 +1,179 @@
+"""
+模型路由：根據延遲、錯誤率和價格選擇模型，並用熔斷器排除故障模型
+"""
+
+import time
+import asyncio
+from typing import Dict, List, Optional
+
+from utils.config import (
+    client,
+    AVAILABLE_MODELS,
+    ROUTING_POLICY,
+    CIRCUIT_BREAKER_THRESHOLD,
+    CIRCUIT_BREAKER_COOLDOWN,
+    MODEL_PRICES
+)
+from utils.model_stats import get_model_stats
+
+ROUTING_POLICIES = ("round_robin", "fastest", "cheapest", "sticky")
+
+# 估算總延遲時假設的回應長度（token）
+TYPICAL_COMPLETION_TOKENS = 400
+
+class CircuitBreaker:
+    """單個模型的熔斷器：連續失敗達到閾值後斷開，冷卻後允許一次試探"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        # 冷卻結束後進入半開狀態，允許請求通過
+        return time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """記錄失敗，返回熔斷器是否因此斷開"""
+        self.failures += 1
+        if self.failures >= self.threshold:
+            was_open = self.is_open
+            self.opened_at = time.monotonic()
+            return not was_open
+        return False
+
+class ModelRouter:
+    """根據路由策略選擇模型"""
+
+    def __init__(
+        self,
+        models: Optional[List[str]] = None,
+        policy: str = ROUTING_POLICY,
+        prices: Optional[Dict[str, Dict[str, float]]] = None,
+        threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+        cooldown: float = CIRCUIT_BREAKER_COOLDOWN
+    ):
+        self.models = list(models or AVAILABLE_MODELS)
+        self.policy = policy if policy in ROUTING_POLICIES else "round_robin"
+        self.prices = MODEL_PRICES if prices is None else prices
+        self.breakers = {model: CircuitBreaker(threshold, cooldown) for model in self.models}
+        self.stats = get_model_stats()
+        self._counter = 0
+        self._sticky = {}
+
+    def is_available(self, model: str) -> bool:
+        """模型是否可用（熔斷器未斷開）"""
+        breaker = self.breakers.get(model)
+        return breaker is None or not breaker.is_open
+
+    def available_models(self) -> List[str]:
+        """返回可用模型；全部熔斷時返回最早恢復的模型"""
+        available = [m for m in self.models if self.is_available(m)]
+        if available:
+            return available
+        return [min(self.models, key=lambda m: self.breakers[m].opened_at)]
+
+    def _expected_latency(self, model: str) -> float:
+        """估算一次調用的總延遲，並按錯誤率加權；沒有數據的模型優先探索"""
+        ttft = self.stats.ewma_ttft.get(model)
+        if ttft is None:
+            return 0.0
+        tps = self.stats.ewma_tps.get(model)
+        latency = ttft + (TYPICAL_COMPLETION_TOKENS / tps if tps else 0.0)
+        error_rate = self.stats.error_rate.get(model, 0.0)
+        return latency / max(0.05, 1.0 - error_rate)
+
+    def _price(self, model: str) -> float:
+        price = self.prices.get(model)
+        if not price:
+            return float("inf")
+        return price.get("prompt", 0.0) + price.get("completion", 0.0)
+
+    def select(self, policy: Optional[str] = None, key: Optional[str] = None) -> str:
+        """按策略選擇模型；sticky 策略需要提供 key（例如專家名稱）"""
+        policy = policy or self.policy
+        candidates = self.available_models()
+
+        if policy == "fastest":
+            return min(candidates, key=self._expected_latency)
+
+        if policy == "cheapest":
+            return min(candidates, key=lambda m: (self._price(m), self._expected_latency(m)))
+
+        if policy == "sticky" and key is not None:
+            model = self._sticky.get(key)
+            if model not in candidates:
+                # 首次分配或原模型不可用時，按輪詢重新分配，使不同角色分散到不同模型
+                model = self._round_robin(candidates)
+                self._sticky[key] = model
+            return model
+
+        return self._round_robin(candidates)
+
+    def _round_robin(self, candidates: List[str]) -> str:
+        model = candidates[self._counter % len(candidates)]
+        self._counter += 1
+        return model
+
+    def record_success(self, model: str) -> None:
+        self.stats.record_result(model, True)
+        if model in self.breakers:
+            self.breakers[model].record_success()
+
+    def record_failure(self, model: str) -> None:
+        self.stats.record_result(model, False)
+        if model in self.breakers and self.breakers[model].record_failure():
+            print(f"模型 {model} 連續失敗，暫停使用 {self.breakers[model].cooldown:.0f} 秒")
+
+    async def probe(self, timeout: float = 20.0) -> Dict[str, Optional[float]]:
+        """並行探測所有模型的可用性和延遲，返回每個模型的延遲（失敗為 None）"""
+
+        async def probe_one(model: str) -> Optional[float]:
+            start = time.time()
+            try:
+                await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": "ping"}],
+                        max_tokens=1
+                    ),
+                    timeout=timeout
+                )
+            except Exception as e:
+                print(f"模型 {model} 探測失敗: {str(e)}")
+                # 探測失敗直接斷開熔斷器
+                for _ in range(self.breakers[model].threshold):
+                    self.record_failure(model)
+                return None
+            latency = time.time() - start
+            self.stats.record_ttft(model, latency)
+            self.record_success(model)
+            return latency
+
+        results = await asyncio.gather(*(probe_one(m) for m in self.models))
+        return dict(zip(self.models, results))
+
+    def status(self) -> Dict[str, Dict]:
+        """返回每個模型的統計與熔斷狀態"""
+        return {
+            model: dict(self.stats.snapshot(model), available=self.is_available(model))
+            for model in self.models
+        }
+
+# 進程內共享的路由器
+_router = None
+
+def get_router() -> ModelRouter:
+    """獲取共享的模型路由器"""
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
@@ -0,0 +1,155 @@
+"""
+記錄序列化：YAML 在可用時使用 libyaml（C 實現），程式讀寫使用緊湊的 JSON Lines 記錄格式
+
+記錄文件（*.record.jsonl）第一行為記錄頭（除討論輪次和調用明細外的字段），之後每行一輪討論，
+最後每行一次 LLM 調用；專家發言中的完整專家信息只保存名稱，讀取時按記錄頭中的專家列表還原。
+大記錄可以用 iter_record / iter_rounds 逐行讀取，不需要一次載入整份記錄。YAML 只作為導出的閱讀視圖。
+"""
+
+import os
+import json
+import yaml
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LIBYAML = hasattr(yaml, "CSafeLoader")
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+class SafeDumper(getattr(yaml, "CSafeDumper", yaml.SafeDumper)):
+    """安全的 YAML 輸出，元組按列表輸出（與 JSON 一致）"""
+
+SafeDumper.add_representer(tuple, yaml.representer.SafeRepresenter.represent_list)
+
+RECORD_SUFFIX = ".record.jsonl"
+RECORD_FORMAT = "roundtable-record"
+RECORD_FORMAT_VERSION = 1
+YAML_SUFFIXES = (".yaml", ".yml")
+
+def load_yaml(stream):
+    """安全載入 YAML 字符串或文件"""
+    return yaml.load(stream, Loader=SafeLoader)
+
+def dump_yaml(data, stream=None):
+    """輸出 YAML（保留字段順序和非 ASCII 字符），stream 為 None 時返回字符串"""
+    return yaml.dump(data, stream, Dumper=SafeDumper, allow_unicode=True, sort_keys=False)
+
+def dump_json(data) -> str:
+    """緊湊的單行 JSON"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def compact_rounds(rounds: List[Dict], agents: List[Dict]) -> List[Dict]:
+    """把發言中與專家列表相同的專家信息替換為專家名稱，不修改傳入的數據"""
+    by_name = {agent.get("name"): agent for agent in agents or [] if isinstance(agent, dict)}
+    compacted = []
+    for round_data in rounds or []:
+        responses = round_data.get("responses") if isinstance(round_data, dict) else None
+        if not responses:
+            compacted.append(round_data)
+            continue
+        items = []
+        for response in responses:
+            agent = response.get("agent") if isinstance(response, dict) else None
+            if isinstance(agent, dict) and by_name.get(agent.get("name")) == agent:
+                response = dict(response, agent=agent["name"])
+            items.append(response)
+        compacted.append(dict(round_data, responses=items))
+    return compacted
+
+def expand_rounds(rounds: List[Dict], agents: List[Dict]) -> List[Dict]:
+    """compact_rounds 的逆操作：把發言中的專家名稱還原為完整的專家信息"""
+    by_name = {agent.get("name"): agent for agent in agents or [] if isinstance(agent, dict)}
+    expanded = []
+    for round_data in rounds or []:
+        responses = round_data.get("responses") if isinstance(round_data, dict) else None
+        if responses and any(isinstance(r, dict) and isinstance(r.get("agent"), str) for r in responses):
+            round_data = dict(round_data, responses=[
+                dict(r, agent=by_name.get(r["agent"], {"name": r["agent"]}))
+                if isinstance(r, dict) and isinstance(r.get("agent"), str) else r
+                for r in responses
+            ])
+        expanded.append(round_data)
+    return expanded
+
+def dump_record(record: Dict, path: str) -> str:
+    """以緊湊格式保存記錄，先寫臨時文件再替換；返回文件路徑"""
+    agents = record.get("agents") or []
+    header = dict(record, discussion_history=None)
+    calls = []
+    if isinstance(record.get("usage"), dict) and "calls" in record["usage"]:
+        calls = record["usage"]["calls"] or []
+        header["usage"] = dict(record["usage"], calls=None)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(dump_json({"format": RECORD_FORMAT, "version": RECORD_FORMAT_VERSION, "record": header}) + "\n")
+        for round_data in compact_rounds(record.get("discussion_history") or [], agents):
+            f.write(dump_json({"round": round_data}) + "\n")
+        for call in calls:
+            f.write(dump_json({"call": call}) + "\n")
+    os.replace(temp_path, path)
+    return path
+
+def iter_record(path: str) -> Iterator[Tuple[str, Dict]]:
+    """逐行讀取緊湊格式的記錄，依次產生 ("record", 記錄頭)、("round", 討論輪次) 和 ("call", 調用明細)
+
+    討論輪次中的專家信息已經還原；文件不是記錄格式時拋出 ValueError。
+    """
+    agents = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if line_number == 1:
+                if item.get("format") != RECORD_FORMAT:
+                    raise ValueError(f"{path} 不是討論記錄文件")
+                agents = item["record"].get("agents") or []
+                yield "record", item["record"]
+            elif "round" in item:
+                yield "round", expand_rounds([item["round"]], agents)[0]
+            elif "call" in item:
+                yield "call", item["call"]
+
+def iter_rounds(path: str) -> Iterator[Dict]:
+    """逐輪讀取討論記錄（YAML 記錄只能整份載入後再逐輪產生）"""
+    if path.endswith(YAML_SUFFIXES):
+        yield from (load_record(path).get("discussion_history") or [])
+        return
+    for kind, data in iter_record(path):
+        if kind == "round":
+            yield data
+
+def load_record(path: str) -> Dict:
+    """讀取整份記錄，按擴展名支持緊湊格式和 YAML"""
+    if path.endswith(YAML_SUFFIXES):
+        with open(path, "r", encoding="utf-8") as f:
+            return load_yaml(f)
+
+    record, rounds, calls = {}, [], []
+    for kind, data in iter_record(path):
+        if kind == "record":
+            record = data
+        elif kind == "round":
+            rounds.append(data)
+        else:
+            calls.append(data)
+    record["discussion_history"] = rounds
+    if isinstance(record.get("usage"), dict) and "calls" in record["usage"]:
+        record["usage"]["calls"] = calls
+    return record
+
+def record_stem(path: str) -> str:
+    """去掉記錄文件的擴展名，同一記錄的 Markdown 和 YAML 文件與它同名"""
+    if path.endswith(RECORD_SUFFIX):
+        return path[:-len(RECORD_SUFFIX)]
+    return os.path.splitext(path)[0]
+
+def is_record_file(name: str) -> bool:
+    return name.endswith(RECORD_SUFFIX) or name.endswith(YAML_SUFFIXES)
+
+def export_yaml(path: str, yaml_path: Optional[str] = None) -> str:
+    """把記錄導出為 YAML 閱讀視圖，默認保存在記錄旁邊；返回 YAML 文件路徑"""
+    yaml_path = yaml_path or f"{record_stem(path)}.yaml"
+    record = load_record(path)
+    with open(yaml_path, "w", encoding="utf-8") as f:
+        dump_yaml(record, f)
+    return yaml_path
@@ -0,0 +1,112 @@
+"""
+問題相似度：字符 n-gram 的 MinHash 簽名和 LSH 分桶索引，在本地找出與新問題相近的舊問題
+"""
+
+import re
+import random
+import hashlib
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# 字符 n-gram 長度：中文問題較短，二元組對措辭變化更穩健
+SHINGLE_SIZE = 2
+NUM_PERM = 64
+# 64 個哈希分成 16 段、每段 4 個，相似度約 0.5 以上的問題大概率落入同一個桶
+BANDS = 16
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_IGNORED = re.compile(r"[\W_]+", re.UNICODE)
+
+def normalize_text(text: str) -> str:
+    """統一全形半形和大小寫，去掉空白和標點"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _IGNORED.sub("", text)
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big")
+
+class MinHasher:
+    """MinHash 簽名：用 num_perm 個隨機線性哈希近似 n-gram 集合的 Jaccard 相似度
+
+    參數由固定種子生成，同樣的設置下簽名可以持久化並在之後的進程中比較。
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text: str) -> List[int]:
+        hashes = [_hash(shingle) for shingle in shingles(text)]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in self._params]
+
+def estimate_similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """兩個簽名中相同位置取值相等的比例，即 Jaccard 相似度的估計"""
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+class MinHashIndex:
+    """LSH 分桶索引：查詢只比較至少有一段簽名相同的候選，數量增長時不需要逐一比較"""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, hasher: Optional[MinHasher] = None):
+        if num_perm % bands:
+            raise ValueError("num_perm 必須能被 bands 整除")
+        self.hasher = hasher or MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[Tuple[int, ...], Set]] = [{} for _ in range(bands)]
+        self._signatures: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: Sequence[int]) -> Iterable[Tuple[int, Tuple[int, ...]]]:
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, key, text: Optional[str] = None, signature: Optional[Sequence[int]] = None) -> List[int]:
+        """加入一個條目，可直接傳入之前保存的簽名；返回簽名"""
+        if signature is None:
+            signature = self.hasher.signature(text)
+        signature = list(signature)
+        self.remove(key)
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+        return signature
+
+    def remove(self, key) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def query(self, text: str, threshold: float = 0.0, limit: Optional[int] = None) -> List[Tuple[object, float]]:
+        """返回估計相似度不低於 threshold 的條目 [(key, similarity)]，按相似度從高到低排列"""
+        signature = self.hasher.signature(text)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates |= self._buckets[band].get(band_key, set())
+        matches = [(key, estimate_similarity(signature, self._signatures[key])) for key in candidates]
+        matches = sorted((match for match in matches if match[1] >= threshold), key=lambda match: match[1], reverse=True)
+        return matches[:limit] if limit else matches
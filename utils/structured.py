@@ -0,0 +1,118 @@
+"""
+結構化輸出：按 JSON Schema 請求、解析並校驗模型輸出，校驗失敗時針對錯誤重新詢問一次
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import STRUCTURED_OUTPUT
+from utils.llm import call_llm_streaming, LLM_FAILURE_PREFIX, UnsupportedParameterError
+
+STRUCTURED_OUTPUT_MODES = ("json_schema", "json_object", "off")
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool
+}
+
+def validate_schema(data, schema: Dict, path: str = "$") -> List[str]:
+    """按 JSON Schema 的常用子集（type、properties、required、items、minItems、minLength）校驗數據，返回錯誤列表"""
+    expected = schema.get("type")
+    if expected and not isinstance(data, _TYPES[expected]):
+        return [f"{path} 應為 {expected}"]
+
+    errors = []
+    if expected == "object":
+        for field in schema.get("required", []):
+            if field not in data or data[field] is None:
+                errors.append(f"{path}.{field} 缺少必填字段")
+        for field, sub_schema in schema.get("properties", {}).items():
+            if data.get(field) is not None:
+                errors.extend(validate_schema(data[field], sub_schema, f"{path}.{field}"))
+    elif expected == "array":
+        if len(data) < schema.get("minItems", 0):
+            errors.append(f"{path} 至少需要 {schema['minItems']} 項，實際 {len(data)} 項")
+        if "items" in schema:
+            for index, item in enumerate(data):
+                errors.extend(validate_schema(item, schema["items"], f"{path}[{index}]"))
+    elif expected == "string":
+        if len(data.strip()) < schema.get("minLength", 0):
+            errors.append(f"{path} 不能為空")
+    return errors
+
+def parse_structured(text: str, schema: Dict) -> Tuple[Optional[object], List[str]]:
+    """解析模型輸出的 JSON 並校驗，返回 (數據, 錯誤列表)"""
+    text = text.strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        # 非 JSON 模式下模型可能加上代碼塊或說明文字，截取最外層的 JSON 對象
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return None, [f"輸出不是有效的 JSON：{e.msg}"]
+        try:
+            data = json.loads(text[start:end + 1])
+        except json.JSONDecodeError as inner:
+            return None, [f"輸出不是有效的 JSON：{inner.msg}（第 {inner.lineno} 行第 {inner.colno} 列）"]
+    return data, validate_schema(data, schema)
+
+def response_format_for(name: str, schema: Dict, mode: Optional[str] = None) -> Optional[Dict]:
+    """根據結構化輸出模式生成 response_format 參數，off 模式返回 None"""
+    mode = mode or STRUCTURED_OUTPUT
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+def _reask_prompt(errors: List[str]) -> str:
+    error_lines = "\n".join(f"- {error}" for error in errors)
+    return f"""你的輸出不符合要求的 JSON 格式，存在以下問題：
+{error_lines}
+
+請修正這些問題，只輸出完整的 JSON，不要包含代碼塊標記或其他說明文字。"""
+
+async def call_llm_structured(
+    messages: List[Dict[str, str]],
+    schema: Dict,
+    name: str,
+    mode: Optional[str] = None,
+    **kwargs
+) -> Optional[object]:
+    """請求符合 schema 的 JSON 輸出並校驗
+
+    校驗失敗時把錯誤反饋給模型重新詢問一次；仍然失敗或調用失敗時返回 None，由調用方決定如何降級。
+    模型拒絕 response_format 時，之後對該模型的請求改為只在提示中要求 JSON（由 call_llm_streaming 記錄）。
+    其餘參數傳給 call_llm_streaming。
+    """
+    conversation = list(messages)
+    reasked = False
+    response_format = response_format_for(name, schema, mode)
+    while True:
+        try:
+            response = await call_llm_streaming(conversation, response_format=response_format, **kwargs)
+        except UnsupportedParameterError as e:
+            print(f"{str(e)}，改為在提示中要求 JSON 輸出")
+            continue
+
+        if response.startswith(LLM_FAILURE_PREFIX):
+            return None
+
+        data, errors = parse_structured(response, schema)
+        if not errors:
+            return data
+
+        if reasked:
+            print(f"結構化輸出重新詢問後仍不符合要求：{'；'.join(errors)}")
+            return None
+
+        print(f"結構化輸出不符合要求，重新詢問：{'；'.join(errors)}")
+        reasked = True
+        conversation = list(messages) + [
+            {"role": "assistant", "content": response},
+            {"role": "user", "content": _reask_prompt(errors)}
+        ]
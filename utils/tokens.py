@@ -0,0 +1,178 @@
+"""
+本地 token 估算與提示預算檢查：在發出請求之前判斷是否超出模型上下文或配置的預算，並按策略裁剪或拒絕
+"""
+
+import re
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.config import (
+    MODEL_CONTEXT_LIMITS,
+    DEFAULT_CONTEXT_LIMIT,
+    PROMPT_TOKEN_BUDGET,
+    COMPLETION_TOKEN_BUDGET,
+    TOKEN_BUDGET_POLICY
+)
+
+TOKEN_BUDGET_POLICIES = ("trim", "reject", "off")
+
+# 每條消息的格式開銷（角色標記等）和回覆起始開銷
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# 未指定 max_tokens 時為回應預留的 token 數
+DEFAULT_COMPLETION_RESERVE = 512
+
+# 回應至少需要的 token 數，不足時視為超出預算
+MIN_COMPLETION_TOKENS = 64
+
+# 已知模型的上下文長度，可用 MODEL_CONTEXT_LIMITS 覆蓋或補充
+KNOWN_CONTEXT_LIMITS = {
+    "deepseek/deepseek-chat-v3-0324": 163840
+}
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+class PromptBudgetError(ValueError):
+    """請求超出模型上下文或配置的 token 預算"""
+
+    def __init__(self, message: str, prompt_tokens: int, budget: int):
+        super().__init__(message)
+        self.prompt_tokens = prompt_tokens
+        self.budget = budget
+
+def heuristic_tokenizer(cjk_tokens_per_char: float, chars_per_token: float) -> Callable[[str], int]:
+    """按字符類型估算 token 數的分詞器：中日韓字符按每字 token 數計算，其他字符按每 token 字符數計算"""
+
+    def count(text: str) -> int:
+        cjk = len(_CJK_PATTERN.findall(text))
+        return math.ceil(cjk * cjk_tokens_per_char + (len(text) - cjk) / chars_per_token)
+
+    return count
+
+def _tiktoken_tokenizer(encoding_name: str) -> Optional[Callable[[str], int]]:
+    """使用 tiktoken 精確計數；未安裝或編碼文件無法加載時返回 None"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+# 未匹配任何模型系列時使用的分詞器（偏保守，寧可高估）
+_default_tokenizer = heuristic_tokenizer(1.0, 3.5)
+
+# 按模型名稱前綴註冊的分詞器，匹配時取最長前綴；值為 None 表示首次使用時再加載
+_tokenizers: Dict[str, Optional[Callable[[str], int]]] = {
+    "deepseek/": heuristic_tokenizer(0.6, 3.3),
+    "anthropic/": heuristic_tokenizer(1.2, 3.5),
+    "google/": heuristic_tokenizer(0.8, 4.0),
+    "meta-llama/": heuristic_tokenizer(1.0, 4.0),
+    "openai/": None,
+    "gpt-": None
+}
+
+# 延遲加載的分詞器及其加載失敗時的替代
+_lazy_tokenizers = {
+    "openai/": (lambda: _tiktoken_tokenizer("o200k_base"), heuristic_tokenizer(0.9, 4.0)),
+    "gpt-": (lambda: _tiktoken_tokenizer("o200k_base"), heuristic_tokenizer(0.9, 4.0))
+}
+
+def register_tokenizer(prefix: str, tokenizer: Callable[[str], int]) -> None:
+    """為模型名稱以 prefix 開頭的模型註冊分詞器（接收文本、返回 token 數的函數）"""
+    _tokenizers[prefix] = tokenizer
+    _lazy_tokenizers.pop(prefix, None)
+
+def get_tokenizer(model: Optional[str] = None) -> Callable[[str], int]:
+    """獲取模型對應的分詞器"""
+    if not model:
+        return _default_tokenizer
+    matches = [prefix for prefix in _tokenizers if model.startswith(prefix)]
+    if not matches:
+        return _default_tokenizer
+    prefix = max(matches, key=len)
+    if _tokenizers[prefix] is None:
+        loader, fallback = _lazy_tokenizers[prefix]
+        _tokenizers[prefix] = loader() or fallback
+    return _tokenizers[prefix]
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """估算文本的 token 數"""
+    return get_tokenizer(model)(text or "")
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """估算消息列表作為提示時的 token 數"""
+    tokenizer = get_tokenizer(model)
+    return sum(tokenizer(str(m.get("content") or "")) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+def context_limit(model: str) -> int:
+    """模型的上下文長度（提示和回應共用）"""
+    return MODEL_CONTEXT_LIMITS.get(model) or KNOWN_CONTEXT_LIMITS.get(model) or DEFAULT_CONTEXT_LIMIT
+
+def _truncate_middle(text: str, remove_chars: int) -> str:
+    """刪除文本中間的一段，保留開頭的指示和結尾的要求"""
+    keep = max(0, len(text) - remove_chars)
+    head = keep * 3 // 5
+    tail = keep - head
+    omitted = len(text) - keep
+    return f"{text[:head]}\n……（為控制長度省略了 {omitted} 字）……\n{text[len(text) - tail:] if tail else ''}"
+
+def trim_messages(messages: List[Dict[str, str]], model: str, budget: int) -> List[Dict[str, str]]:
+    """反覆截斷最長消息的中間部分，直到提示不超過預算；無法做到時拋出 PromptBudgetError"""
+    trimmed = [dict(m) for m in messages]
+    for _ in range(5):
+        excess = count_message_tokens(trimmed, model) - budget
+        if excess <= 0:
+            return trimmed
+        longest = max(trimmed, key=lambda m: len(str(m.get("content") or "")))
+        content = str(longest.get("content") or "")
+        tokens = count_tokens(content, model)
+        if tokens <= excess:
+            break
+        # 按該消息的平均每 token 字符數換算需要刪除的字符，並多刪一些以抵消省略標記
+        chars_per_token = len(content) / tokens
+        longest["content"] = _truncate_middle(content, math.ceil((excess + 20) * chars_per_token))
+
+    prompt_tokens = count_message_tokens(trimmed, model)
+    if prompt_tokens > budget:
+        raise PromptBudgetError(f"提示約 {prompt_tokens} token，裁剪後仍超出預算 {budget} token", prompt_tokens, budget)
+    return trimmed
+
+def enforce_budget(
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: Optional[int] = None,
+    policy: Optional[str] = None
+) -> Tuple[List[Dict[str, str]], Optional[int]]:
+    """檢查請求是否放得進模型上下文和配置的預算，返回（可能裁剪後的）消息和 max_tokens
+
+    - 提示超出預算時，trim 策略截斷最長消息的中間部分，reject 策略拋出 PromptBudgetError
+    - 回應上限按 COMPLETION_TOKEN_BUDGET 和上下文剩餘空間收緊
+    """
+    policy = policy or TOKEN_BUDGET_POLICY
+    if policy == "off":
+        return messages, max_tokens
+
+    limit = context_limit(model)
+    prompt_budget = limit - MIN_COMPLETION_TOKENS
+    if PROMPT_TOKEN_BUDGET:
+        prompt_budget = min(prompt_budget, PROMPT_TOKEN_BUDGET)
+
+    prompt_tokens = count_message_tokens(messages, model)
+    if prompt_tokens > prompt_budget:
+        if policy == "reject":
+            raise PromptBudgetError(f"提示約 {prompt_tokens} token，超出預算 {prompt_budget} token", prompt_tokens, prompt_budget)
+        messages = trim_messages(messages, model, prompt_budget)
+        new_tokens = count_message_tokens(messages, model)
+        print(f"提示約 {prompt_tokens} token，超出預算 {prompt_budget} token，已裁剪至約 {new_tokens} token")
+        prompt_tokens = new_tokens
+
+    if COMPLETION_TOKEN_BUDGET:
+        max_tokens = min(max_tokens or COMPLETION_TOKEN_BUDGET, COMPLETION_TOKEN_BUDGET)
+
+    # 回應上限不能超過上下文剩餘空間；未指定時只在預留空間不足時設置
+    available = limit - prompt_tokens
+    if (max_tokens or DEFAULT_COMPLETION_RESERVE) > available:
+        max_tokens = available
+
+    return messages, max_tokens
@@ -0,0 +1,131 @@
+"""
+串流看門狗：分別監控首字延遲、內容塊間隔和總時長
+"""
+
+import asyncio
+from typing import Callable, Dict, Optional
+
+from utils.config import (
+    WATCHDOG_TTFT_FACTOR,
+    WATCHDOG_GAP_FACTOR,
+    WATCHDOG_MIN_TTFT,
+    WATCHDOG_MIN_GAP,
+    WATCHDOG_TOTAL_TIMEOUT
+)
+from utils.model_stats import get_model_stats
+
+# 根據觀察值計算期限時使用的百分位
+DEADLINE_PERCENTILE = 0.95
+
+def stream_deadlines(
+    model: str,
+    idle_timeout: float,
+    ttft_timeout: Optional[float] = None,
+    total_timeout: Optional[float] = None,
+    max_tokens: Optional[int] = None
+) -> Dict[str, float]:
+    """根據模型的歷史統計計算三個期限，idle_timeout 作為首字和間隔期限的上限"""
+    stats = get_model_stats()
+
+    if ttft_timeout is None:
+        observed = stats.ttft_percentile(model, DEADLINE_PERCENTILE)
+        ttft_timeout = idle_timeout if observed is None else min(idle_timeout, max(WATCHDOG_MIN_TTFT, observed * WATCHDOG_TTFT_FACTOR))
+
+    observed_gap = stats.gap_percentile(model, DEADLINE_PERCENTILE)
+    gap_timeout = idle_timeout if observed_gap is None else min(idle_timeout, max(WATCHDOG_MIN_GAP, observed_gap * WATCHDOG_GAP_FACTOR))
+
+    if total_timeout is None:
+        total_timeout = WATCHDOG_TOTAL_TIMEOUT
+        tps = stats.ewma_tps.get(model)
+        if tps and max_tokens:
+            # 已知生成速度和長度上限時，總時長期限不必超過預期時間的數倍
+            expected = ttft_timeout + max_tokens / tps
+            total_timeout = min(total_timeout, max(expected * WATCHDOG_GAP_FACTOR, ttft_timeout + gap_timeout))
+
+    return {"ttft": ttft_timeout, "gap": gap_timeout, "total": total_timeout}
+
+class StreamWatchdog:
+    """基於事件循環定時器的看門狗
+
+    收到首字後，內容塊只記錄時間，不重新設置定時器；定時器觸發時再檢查實際期限，
+    未到期則按新的期限重新設置，因此每個內容塊的開銷是常數級的。
+    """
+
+    REASONS = {
+        "ttft": "等待首字超過 {:.1f} 秒",
+        "gap": "內容塊間隔超過 {:.1f} 秒",
+        "total": "總時長超過 {:.1f} 秒"
+    }
+
+    def __init__(self, deadlines: Dict[str, float], on_expire: Callable[[], None]):
+        self.deadlines = deadlines
+        self.on_expire = on_expire
+        self.expired_reason = None
+        self._loop = None
+        self._handle = None
+        self._started_at = None
+        self._waiting_since = None
+        self._last_chunk_at = None
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+    def start(self) -> None:
+        """開始計時"""
+        self._loop = asyncio.get_running_loop()
+        now = self._loop.time()
+        self._started_at = now
+        self._waiting_since = now
+        self._arm()
+
+    def restart_ttft(self) -> None:
+        """重新開始首字計時（例如請求在限流器排隊後才真正發出）"""
+        if self._last_chunk_at is None and self._loop is not None:
+            self._waiting_since = self._loop.time()
+
+    def feed(self) -> None:
+        """收到內容塊時調用"""
+        if self._loop is None:
+            return
+        first_chunk = self._last_chunk_at is None
+        self._last_chunk_at = self._loop.time()
+        # 從首字期限切換到間隔期限時，新期限可能更早，需要重新設置定時器；
+        # 之後間隔期限只會往後推，等定時器觸發時再檢查即可
+        if first_chunk and self._handle is not None:
+            self._handle.cancel()
+            self._arm()
+
+    def stop(self) -> None:
+        """停止計時"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _next_deadline(self):
+        """返回最近的期限及其類型"""
+        total = (self._started_at + self.deadlines["total"], "total")
+        if self._last_chunk_at is None:
+            pending = (self._waiting_since + self.deadlines["ttft"], "ttft")
+        else:
+            pending = (self._last_chunk_at + self.deadlines["gap"], "gap")
+        return min(total, pending)
+
+    def _arm(self) -> None:
+        deadline, _ = self._next_deadline()
+        self._handle = self._loop.call_at(deadline, self._check)
+
+    def _check(self) -> None:
+        self._handle = None
+        deadline, reason = self._next_deadline()
+        if self._loop.time() < deadline:
+            self._arm()
+            return
+        self.expired_reason = reason
+        self.on_expire()
+
+    def describe(self) -> str:
+        """返回超時原因的描述"""
+        if self.expired_reason is None:
+            return ""
+        return self.REASONS[self.expired_reason].format(self.deadlines[self.expired_reason])
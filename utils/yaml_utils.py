@@ -4,11 +4,13 @@ YAML處理工具
 
 import yaml
 
+from utils.serialization import load_yaml
+
 def yaml_safe_load(yaml_str):
     """安全載入 YAML 字符串，處理常見格式問題"""
     try:
         # 直接嘗試載入
-        return yaml.safe_load(yaml_str)
+        return load_yaml(yaml_str)
     except yaml.YAMLError as e:
         print(f"YAML 解析錯誤，嘗試修復: {str(e)}")
         
@@ -28,7 +30,7 @@ def yaml_safe_load(yaml_str):
         fixed_yaml = "\n".join(fixed_lines)
         
         try:
-            return yaml.safe_load(fixed_yaml)
+            return load_yaml(fixed_yaml)
         except yaml.YAMLError:
             # 如果仍然失敗，將內容轉換為普通文本格式返回
             print("YAML 修復失敗，轉換為普通文本")